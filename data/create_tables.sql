@@ -18,13 +18,30 @@ CREATE TABLE is_super_host (
     host_is_superhost_boo BOOLEAN
 );
 
--- 3) neighborhood_city
+-- 3a) cities, computed by the pipeline (pipeline/neighborhoods.py)
+CREATE TABLE cities (
+    city_id SMALLINT PRIMARY KEY,
+    city VARCHAR(100) NOT NULL,
+    city_key VARCHAR(100) NOT NULL UNIQUE
+);
+
+-- 3b) neighborhood_city
 CREATE TABLE city_neighborhood (
     cleaned_neighborhood VARCHAR(100) NOT NULL PRIMARY KEY,
-    city VARCHAR(100)
+    city VARCHAR(100),
+    neighborhood_id INT NOT NULL UNIQUE,
+    city_id SMALLINT REFERENCES cities(city_id)
 );
 
 CREATE INDEX idx_city_neighborhood_city ON city_neighborhood (city);
+CREATE INDEX idx_city_neighborhood_city_id ON city_neighborhood (city_id);
+
+-- 3c) city_search: lower-cased substrings of city names and aliases
+CREATE TABLE city_search (
+    term VARCHAR(100) NOT NULL,
+    city_id SMALLINT NOT NULL REFERENCES cities(city_id),
+    PRIMARY KEY (term, city_id)
+);
 
 -- 4) Listings
 CREATE TABLE listings (
@@ -53,6 +70,13 @@ CREATE TABLE Listings_detailed (
     review_scores_rating NUMERIC(5, 2)
 );
 
+-- 5a) featured_listing, computed by the pipeline (pipeline/sampling.py)
+-- the listings randomListing picks from, numbered 0..n-1
+CREATE TABLE featured_listing (
+    slot INT NOT NULL PRIMARY KEY,
+    listing_id BIGINT NOT NULL UNIQUE REFERENCES Listings_detailed(id) ON DELETE CASCADE
+);
+
 -- 6) Amenities
 CREATE TABLE Amenities (
     amenity_id SERIAL PRIMARY KEY,
@@ -66,6 +90,19 @@ CREATE TABLE Listings_amenities (
     PRIMARY KEY (id, amenity_id)
 );
 
+-- 7a) listing_amenity_mask, computed by the pipeline (pipeline/amenities.py)
+-- bit amenity_id - 1 (leftmost first) is set for every amenity of the listing
+CREATE TABLE listing_amenity_mask (
+    listing_id BIGINT NOT NULL PRIMARY KEY REFERENCES Listings(id) ON DELETE CASCADE,
+    amenity_mask BIT(200) NOT NULL
+);
+
+-- 7b) amenity_keyword: the amenities whose names contain a keyword, as a mask
+CREATE TABLE amenity_keyword (
+    keyword TEXT NOT NULL PRIMARY KEY,
+    amenity_mask BIT(200) NOT NULL
+);
+
 -- 8) Calendar
 CREATE TABLE Calendar (
     listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
@@ -89,6 +126,16 @@ CREATE TABLE Reviews (
 );
 CREATE INDEX idx_reviews_listing_id ON reviews (listing_id);
 
+-- 9a) listing_review_sample, computed by the pipeline (pipeline/sampling.py)
+-- a random sample of each listing's reviews, numbered 0..n-1 per listing
+CREATE TABLE listing_review_sample (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    slot SMALLINT NOT NULL,
+    review_id BIGINT NOT NULL REFERENCES Reviews(review_id) ON DELETE CASCADE,
+    comments TEXT,
+    PRIMARY KEY (listing_id, slot)
+);
+
 -- 10) Application Users
 CREATE TABLE Application_users (
     user_id SERIAL PRIMARY KEY,
@@ -96,58 +143,67 @@ CREATE TABLE Application_users (
     user_password VARCHAR(255) NOT NULL
 );
 
--- 11) monthly_avg_cache Materialized View
-CREATE MATERIALIZED VIEW monthly_avg_cache AS
-SELECT listing_id,
-       date_trunc('month', date)::date AS month,
-       AVG(price) AS avg_price
-FROM calendar
-GROUP BY listing_id, date_trunc('month', date)::date;
-
--- 12) city_monthly_avg Materialized View
-create materialized view city_monthly_avg as
-SELECT nc.city,
-       mac.month,
-       avg(mac.avg_price) AS avg_price
-FROM monthly_avg_cache mac
-         JOIN listings l ON mac.listing_id = l.id
-         JOIN city_neighborhood nc ON l.cleaned_neighborhood = nc.cleaned_neighborhood::text
-GROUP BY nc.city, mac.month;
-
-create index city_monthly_avg_city_month_idx
-    on city_monthly_avg (city, month);
-
-
--- 13) monthly_avg_cache Materlized View
-create materialized view monthly_avg_cache as
-SELECT listing_id,
-       date_trunc('month'::text, date::timestamp with time zone)::date AS month,
-       avg(price)                                                      AS avg_price
-FROM calendar
-GROUP BY listing_id, (date_trunc('month'::text, date::timestamp with time zone)::date);
-
-
--- 14) superhost_neighborhood_monthly Materlized View
-create materialized view superhost_neighborhood_monthly as
-SELECT n.city,
-       l.cleaned_neighborhood,
-       date_trunc('month'::text, c.date::timestamp with time zone) AS month,
-       avg(c.price)                                                AS avg_price
-FROM listings l
-         JOIN city_neighborhood n ON n.cleaned_neighborhood::text = l.cleaned_neighborhood
-         JOIN is_super_host i ON i.host_id = l.host_id
-         JOIN calendar c ON c.listing_id = l.id
-WHERE i.host_is_superhost_boo = true
-GROUP BY n.city, l.cleaned_neighborhood, (date_trunc('month'::text, c.date::timestamp with time zone));
-
-create index superhost_neighborhood_monthly_city_neighbourhood_idx
-    on superhost_neighborhood_monthly (city, cleaned_neighborhood);
-
---15) listing_overall_avg_price View
-create view listing_overall_avg_price(listing_id, overall_avg_price) as
-SELECT listing_id,
-       round(avg(avg_price), 2) AS overall_avg_price
-FROM monthly_avg_cache
-GROUP BY listing_id;
+-- 11) monthly_avg_cache, computed by the pipeline (pipeline/aggregates.py)
+CREATE TABLE monthly_avg_cache (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    avg_price NUMERIC,
+    PRIMARY KEY (listing_id, month)
+);
 
+-- 12) city_monthly_avg, computed by the pipeline
+CREATE TABLE city_monthly_avg (
+    city VARCHAR(100) NOT NULL,
+    month DATE NOT NULL,
+    avg_price NUMERIC,
+    PRIMARY KEY (city, month)
+);
 
+-- 13) superhost_neighborhood_monthly, computed by the pipeline
+CREATE TABLE superhost_neighborhood_monthly (
+    city VARCHAR(100) NOT NULL,
+    cleaned_neighborhood TEXT NOT NULL,
+    month TIMESTAMP WITH TIME ZONE NOT NULL,
+    avg_price NUMERIC,
+    PRIMARY KEY (city, cleaned_neighborhood, month)
+);
+
+-- 14) listing_overall_avg_price, computed by the pipeline
+CREATE TABLE listing_overall_avg_price (
+    listing_id BIGINT NOT NULL PRIMARY KEY REFERENCES Listings(id) ON DELETE CASCADE,
+    overall_avg_price NUMERIC(10, 2)
+);
+
+-- 15) listing_cheapest_dates, computed by the pipeline (pipeline/calendar_serving.py)
+CREATE TABLE listing_cheapest_dates (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    rank SMALLINT NOT NULL,
+    date DATE NOT NULL,
+    price NUMERIC(10, 2),
+    PRIMARY KEY (listing_id, rank)
+);
+
+-- 16) listing_monthly_trend, computed by the pipeline
+CREATE TABLE listing_monthly_trend (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    avg_monthly_price NUMERIC,
+    PRIMARY KEY (listing_id, month)
+);
+
+-- 17) listing_holiday_price, computed by the pipeline
+CREATE TABLE listing_holiday_price (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    holiday VARCHAR(50) NOT NULL,
+    avg_price NUMERIC,
+    PRIMARY KEY (listing_id, holiday)
+);
+
+-- 18) listing_similar, computed by the pipeline (pipeline/similar.py)
+CREATE TABLE listing_similar (
+    listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    rank SMALLINT NOT NULL,
+    similar_listing_id BIGINT NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+    score NUMERIC(5, 4),
+    PRIMARY KEY (listing_id, rank)
+);
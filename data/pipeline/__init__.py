@@ -0,0 +1,6 @@
+"""Helpers for the SmartStay data preprocessing pipeline.
+
+`Data EDA and Preprocessing.py` drives these modules; they hold the parts of
+the pipeline that have to scale to the full nationwide dataset.
+`python -m pipeline` runs the same stages from the command line.
+"""
@@ -0,0 +1,83 @@
+"""Command-line runner for the preprocessing pipeline, without Colab.
+
+    python -m pipeline --raw RAW_DIR --data DATA_DIR [--stages calendar,reviews] [--only]
+        [--force calendar|all] [--jobs 4] [--memory-mb 24000] [--sequential] [--no-cache]
+        [--set calendar.price_cap=5000] [--set 'calendar.holidays=[["christmas","2023-12-20","2023-12-26"]]']
+        [--profile calendar] [--list]
+
+Run from the data/ folder (or with it on PYTHONPATH). Without --stages every
+stage runs; with it, the named stages and the stages they depend on, unless
+--only is given. Up-to-date stages are skipped by the stage cache, as in the
+notebook. Stages run concurrently as their dependencies finish
+(pipeline/scheduler.py); --sequential runs them one after another with
+run_stages instead. --set values are parsed as JSON, falling back to text.
+There is no notebook to show plots in, so eda writes its headless reports
+(eda.report=true) unless --set eda.report=false is given.
+"""
+import argparse
+import json
+import sys
+
+from pipeline.scheduler import dependencies, schedule_stages, select_stages
+from pipeline.stages import STAGES, run_stages
+
+
+def parse_params(assignments):
+    """['calendar.price_cap=5000', ...] -> {'calendar': {'price_cap': 5000}}."""
+    params = {}
+    for assignment in assignments:
+        target, sep, value = assignment.partition('=')
+        stage, dot, name = target.partition('.')
+        if not sep or not dot:
+            raise ValueError(f"--set takes stage.parameter=value, got {assignment!r}")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        params.setdefault(stage, {})[name] = value
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pipeline', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--raw', help='per-city Inside Airbnb folders')
+    parser.add_argument('--data', help='folder for the combined files and the DB_*.csv outputs')
+    parser.add_argument('--stages', help='comma-separated stage names (default: all)')
+    parser.add_argument('--only', action='store_true', help='do not add the stages the named ones depend on')
+    parser.add_argument('--force', default='', help="comma-separated stages to rerun even if up to date, or 'all'")
+    parser.add_argument('--jobs', type=int, help='stages running at once (default: one per CPU)')
+    parser.add_argument('--memory-mb', type=float, help='memory budget of the running stages')
+    parser.add_argument('--sequential', action='store_true', help='run the stages one at a time, in order')
+    parser.add_argument('--no-cache', action='store_true', help='run every selected stage')
+    parser.add_argument('--set', action='append', default=[], metavar='STAGE.PARAM=VALUE')
+    parser.add_argument('--profile', default='', help='comma-separated stages to run under cProfile')
+    parser.add_argument('--list', action='store_true', help='print the stages and their dependencies and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, deps in dependencies(STAGES, {'raw': '{raw}', 'data': '{data}'}).items():
+            print(f"{name:14s} <- {', '.join(deps) or '(raw files)'}")
+        return
+    if not args.raw or not args.data:
+        parser.error('--raw and --data are required')
+
+    paths = {'raw': args.raw, 'data': args.data}
+    stages = STAGES
+    if args.stages:
+        stages = select_stages(args.stages.split(','), STAGES, paths, upstream=not args.only)
+    force = [s.name for s in stages] if args.force == 'all' else [f for f in args.force.split(',') if f]
+    profile = [p for p in args.profile.split(',') if p]
+    params = parse_params(args.set)
+    params.setdefault('eda', {}).setdefault('report', True)
+
+    if args.sequential:
+        ran = run_stages(paths, stages, params, force=force, use_cache=not args.no_cache, profile=profile)
+    else:
+        ran = schedule_stages(paths, stages, params, force=force, use_cache=not args.no_cache, profile=profile,
+                              jobs=args.jobs, memory_mb=args.memory_mb)
+    print(f"Stages run: {ran}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
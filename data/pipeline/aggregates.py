@@ -0,0 +1,102 @@
+"""Monthly price aggregates, computed by the pipeline instead of the database.
+
+create_tables.sql used to define monthly_avg_cache, city_monthly_avg,
+superhost_neighborhood_monthly and listing_overall_avg_price as (materialized)
+views over the whole Calendar table, so every refresh re-aggregated 58M rows
+on the serving database. The same numbers come out of one running sum:
+
+    (listing_id, month) -> sum of price, number of nights
+
+which clean_calendar collects while it writes the cleaned calendar, and
+saves as DB_calendar_monthly.ckpt. Everything else is derived from that
+small table:
+
+    monthly_avg_cache               avg price per listing and month
+    listing_overall_avg_price       mean of a listing's monthly averages, 2 decimals
+    city_monthly_avg                mean of the monthly averages of a city's listings
+    superhost_neighborhood_monthly  avg nightly price of superhost listings per
+                                    city, neighbourhood and month
+
+and they are written as CSVs with the columns of the old views, ready for
+pipeline.load.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline.checkpoint import DATE_NULL, EPOCH, INT_NULL
+
+
+MONTHLY_SCHEMA = {'listing_id': 'int', 'month': 'date', 'price_sum': 'int', 'nights': 'int'}
+
+# partial sums kept before they are folded together
+_MAX_PARTS = 64
+
+
+class MonthlyPrices:
+    """Running price sum (in cents) and night count per (listing_id, month)."""
+
+    def __init__(self):
+        self._parts = []
+
+    def add(self, listing_id, days, price_cents):
+        """Add calendar rows given as int64 ids, int32 day offsets and int64 cents."""
+        listing_id = np.asarray(listing_id)
+        days = np.asarray(days)
+        price_cents = np.asarray(price_cents)
+        # like AVG(price), rows without a price do not count
+        valid = (price_cents != INT_NULL) & (days != DATE_NULL)
+        if not valid.any():
+            return
+        month = (EPOCH + days[valid].astype(np.int64)).astype('datetime64[M]')
+        part = (pd.DataFrame({'listing_id': listing_id[valid], 'month': month, 'price': price_cents[valid]})
+                  .groupby(['listing_id', 'month'], sort=False)['price']
+                  .agg(price_sum='sum', nights='size'))
+        self._parts.append(part)
+        if len(self._parts) >= _MAX_PARTS:
+            self._parts = [self._combine()]
+
+    def _combine(self):
+        return pd.concat(self._parts).groupby(level=['listing_id', 'month'], sort=False).sum()
+
+    def frame(self):
+        """listing_id, month (first day), price_sum, nights sorted by listing and month."""
+        if not self._parts:
+            return pd.DataFrame({'listing_id': pd.Series([], dtype=np.int64),
+                                 'month': pd.Series([], dtype='datetime64[ns]'),
+                                 'price_sum': pd.Series([], dtype=np.int64),
+                                 'nights': pd.Series([], dtype=np.int64)})
+        monthly = self._combine().sort_index().reset_index()
+        monthly['month'] = monthly['month'].astype('datetime64[ns]')
+        return monthly
+
+
+def monthly_avg_cache(monthly):
+    """listing_id, month, avg_price, from the running sums (prices in cents)."""
+    return pd.DataFrame({'listing_id': monthly['listing_id'], 'month': monthly['month'],
+                         'avg_price': monthly['price_sum'] / monthly['nights'] / 100})
+
+
+def listing_overall_avg_price(monthly_avg):
+    overall = monthly_avg.groupby('listing_id')['avg_price'].mean().round(2)
+    return overall.rename('overall_avg_price').reset_index()
+
+
+def city_monthly_avg(monthly_avg, listing_city):
+    """city, month, avg_price; listing_city has columns id, city."""
+    joined = monthly_avg.merge(listing_city, left_on='listing_id', right_on='id')
+    return joined.groupby(['city', 'month'], as_index=False)['avg_price'].mean()
+
+
+def superhost_neighborhood_monthly(monthly, listings, superhost, listing_city):
+    """city, cleaned_neighborhood, month, avg_price over superhost listings.
+
+    listings has columns id, host_id, neighbourhood; superhost has host_id,
+    host_is_superhost_boo. The average is over nights, not over monthly
+    averages, like the old view.
+    """
+    superhosts = superhost.loc[superhost['host_is_superhost_boo'], 'host_id']
+    listings = listings[listings['host_id'].isin(superhosts)].merge(listing_city, on='id')
+    joined = monthly.merge(listings[['id', 'city', 'neighbourhood']], left_on='listing_id', right_on='id')
+    grouped = joined.groupby(['city', 'neighbourhood', 'month'], as_index=False)[['price_sum', 'nights']].sum()
+    return pd.DataFrame({'city': grouped['city'], 'cleaned_neighborhood': grouped['neighbourhood'],
+                         'month': grouped['month'], 'avg_price': grouped['price_sum'] / grouped['nights'] / 100})
@@ -0,0 +1,138 @@
+"""One-pass amenity tokenizer for the Amenities and Listings_amenities tables.
+
+The `amenities` column of listings_detailed_combined.csv holds stringified
+lists like '["Wifi", "Free parking on premises"]'. It is tokenized once with
+vectorized string operations and every distinct token is interned into an
+integer code, so counting, ranking, unicode decoding and the has_amenity
+join all work on codes and on the ~27K distinct strings, never per row.
+
+For the amenity filters of the routes, every listing also gets a BIT(200)
+mask over the top amenities (bit amenity_id - 1, leftmost first), and every
+keyword a mask of the amenities it names:
+
+    listing_amenity_mask  listing_id, amenity_mask
+    amenity_keyword       keyword, amenity_mask: every lower-cased run of
+                          whole words of an amenity name ('free parking' ->
+                          'Free parking on premises', 'Free parking on street')
+
+A listing has all of a set of amenities when (amenity_mask & wanted) =
+wanted, and any of them when the AND is not all zeros.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics
+from pipeline.checkpoint import INT_NULL, encode_int
+
+
+TOP_N = 200
+
+# width of the BIT(200) amenity_mask columns in create_tables.sql
+MASK_BITS = 200
+
+
+def decode_unicode(val):
+    """Turn literal escapes like '\\u2019' into the characters they stand for."""
+    try:
+        return val.encode('utf-8').decode('unicode_escape')
+    except Exception:
+        return val
+
+
+def tokenize_amenities(amenities):
+    """Split the amenities column into (row, code) pairs.
+
+    Returns (rows, codes, tokens): rows are positions in `amenities`, codes
+    index into tokens, the distinct raw amenity strings in order of first
+    appearance. Empty tokens and non-string values are skipped.
+    """
+    amenities = pd.Series(amenities).reset_index(drop=True)
+    amenities = amenities.where(amenities.map(lambda v: isinstance(v, str)))
+    tokens = (amenities.str.replace(r'[\[\]"\']', '', regex=True)
+                       .str.split(',')
+                       .explode()
+                       .str.strip())
+    tokens = tokens[tokens.notna() & (tokens != '')]
+    codes, uniques = pd.factorize(tokens, sort=False)
+    return tokens.index.to_numpy(), codes, pd.Index(uniques)
+
+
+def build_amenities(listing_ids, amenities, valid_listing_ids, top_n=TOP_N):
+    """Build the Amenities and Listings_amenities tables in one pass.
+
+    listing_ids and amenities are the `id` and `amenities` columns of
+    listings_detailed_combined.csv. Returns
+
+        top_amenities_df  columns amenities, amenity_id (1..n), most frequent first
+        has_amenity       columns id, amenity_id for listings in valid_listing_ids,
+                          one row per (id, amenity_id) in first-seen order
+        amenity_counts    occurrences of every distinct raw amenity, most frequent first
+    """
+    with metrics.timed('tokenize'):
+        rows, codes, tokens = tokenize_amenities(amenities)
+    counts = np.bincount(codes, minlength=len(tokens))
+
+    # stable sort keeps first-seen order between amenities with the same count
+    ranked = np.argsort(-counts, kind='stable')
+    amenity_counts = pd.Series(counts[ranked], index=tokens[ranked], name='count')
+
+    # decoding can map two raw spellings onto one name; the first one keeps its slot
+    top_codes = ranked[:top_n]
+    decoded = [decode_unicode(tokens[code]) for code in top_codes]
+    names = list(dict.fromkeys(decoded))
+    top_amenities_df = pd.DataFrame({'amenities': names, 'amenity_id': np.arange(1, len(names) + 1)})
+
+    code_to_amenity_id = np.zeros(len(tokens), dtype=np.int64)
+    name_to_id = dict(zip(names, top_amenities_df['amenity_id']))
+    code_to_amenity_id[top_codes] = [name_to_id[name] for name in decoded]
+
+    ids = encode_int(pd.Series(listing_ids).reset_index(drop=True))[rows]
+    amenity_ids = code_to_amenity_id[codes]
+    valid_listing_ids = np.unique(np.asarray(valid_listing_ids, dtype=np.int64))
+    in_top = amenity_ids > 0
+    keep = in_top & (ids != INT_NULL) & np.isin(ids, valid_listing_ids)
+    metrics.rows('not_top_amenity', len(codes), int(in_top.sum()), reason=f"amenity not in the top {top_n}")
+    metrics.rows('orphan_listing', int(in_top.sum()), int(keep.sum()), reason='id not in DB_listings')
+
+    has_amenity = pd.DataFrame({'id': ids[keep], 'amenity_id': amenity_ids[keep]})
+    has_amenity = has_amenity.drop_duplicates(subset=['id', 'amenity_id'], keep='first').reset_index(drop=True)
+    metrics.rows('duplicate_pair', int(keep.sum()), len(has_amenity), reason='repeated (id, amenity_id), first kept')
+    return top_amenities_df, has_amenity, amenity_counts
+
+
+def mask_strings(rows, amenity_ids, n_rows, bits=MASK_BITS):
+    """'0'/'1' strings of `bits` characters, one per row, with character amenity_id - 1 set for each pair."""
+    amenity_ids = np.asarray(amenity_ids, dtype=np.int64)
+    if len(amenity_ids) and amenity_ids.max() > bits:
+        raise ValueError(f"amenity_id {amenity_ids.max()} does not fit a BIT({bits}) mask")
+    chars = np.full((n_rows, bits), ord('0'), dtype=np.uint8)
+    chars[np.asarray(rows, dtype=np.int64), amenity_ids - 1] = ord('1')
+    return chars.view(f"S{bits}").ravel().astype(str)
+
+
+def listing_amenity_masks(has_amenity, listing_ids, bits=MASK_BITS):
+    """listing_id, amenity_mask for every listing in listing_ids; no top amenity gives all zeros."""
+    listing_ids = np.unique(np.asarray(listing_ids, dtype=np.int64))
+    rows = np.searchsorted(listing_ids, has_amenity['id'].to_numpy(np.int64))
+    return pd.DataFrame({'listing_id': listing_ids,
+                         'amenity_mask': mask_strings(rows, has_amenity['amenity_id'], len(listing_ids), bits)})
+
+
+def keywords(name):
+    """Every lower-cased run of whole words of an amenity name."""
+    words = re.findall(r'\w+', name.lower())
+    return {' '.join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)}
+
+
+def amenity_keywords(top_amenities_df, bits=MASK_BITS):
+    """keyword, amenity_mask for every keyword of the top amenities, sorted by keyword."""
+    pairs = sorted((keyword, amenity_id) for name, amenity_id in zip(top_amenities_df['amenities'],
+                                                                     top_amenities_df['amenity_id'])
+                   for keyword in keywords(name))
+    pairs = pd.DataFrame(pairs, columns=['keyword', 'amenity_id'])
+    codes, uniques = pd.factorize(pairs['keyword'], sort=True)
+    return pd.DataFrame({'keyword': uniques,
+                         'amenity_mask': mask_strings(codes, pairs['amenity_id'], len(uniques), bits)})
+
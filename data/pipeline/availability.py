@@ -0,0 +1,303 @@
+"""Memory-mapped availability index for date-range stay searches.
+
+"Which listings of a city are free every night from check-in to check-out,
+and allow a stay that long?" used to be a GROUP BY over the whole Calendar
+table. The calendar stage now lays the cleaned calendar out per listing over
+the calendar horizon (first to last date in DB_calendar4.ckpt):
+
+    - one availability bitset per listing, a bit per night;
+    - aligned arrays of that night's price and minimum/maximum nights.
+
+A search is then a few 64-bit AND/compare operations per listing of the
+city, and the total stay price a row sum over the matching listings only.
+
+Listings are ordered by (city_id, listing_id), so a city's listings are a
+contiguous block of rows. The city of a listing comes from its cleaned
+neighbourhood in city_neighborhood.csv. Listings without a city are kept,
+under city_id 0, for lookups by listing id.
+
+A night is free when its calendar row has available_boo set; nights without
+a row, like the dropped months, are not. As on Airbnb, a stay's length is
+checked against the minimum/maximum nights of its check-in night; 0 (the
+cleaned value of a missing one) means no limit.
+
+Files in the index directory, all memory-mapped:
+
+    listing_ids.i8      listing id of each row
+    sorted_ids.i8       listing ids, ascending, and
+    sorted_rows.i8      the row of each, for lookups by listing id
+    city_ids.i2         the city of each block of rows, and
+    city_offsets.i8     the block's first row (+ total)
+    available.u8        rows x words little-endian uint64 bitsets; bit d % 64
+                        of word d // 64 is night d of the horizon
+    price.i4            rows x days price in cents (PRICE_NULL when missing or past int32)
+    minimum_nights.i4   rows x days
+    maximum_nights.i4   rows x days
+    meta.json           horizon, shape, city names and the calendar checkpoint
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pipeline.checkpoint import (CHUNKSIZE, DATE_NULL, EPOCH, INT_NULL, checkpoint_rows, column_array,
+                                 read_checkpoint)
+
+
+PRICE_NULL = np.iinfo(np.int32).min
+
+_PRICE_MAX = np.iinfo(np.int32).max
+
+_NIGHTS_MAX = np.iinfo(np.int32).max
+
+# rows packed into bitsets at a time
+_PACK_ROWS = 65_536
+
+
+def listing_cities(listings_csv, city_neighborhood_csv):
+    """DataFrame of listing_id, city_id (0 for no city) for the cleaned listings table."""
+    listings = pd.read_csv(listings_csv, usecols=['id', 'neighbourhood'], dtype=str)
+    cities = pd.read_csv(city_neighborhood_csv, usecols=['cleaned_neighborhood', 'city_id'], dtype=str,
+                         encoding='utf-8-sig')
+    listings['listing_id'] = pd.to_numeric(listings['id'], errors='coerce')
+    listings = listings.dropna(subset=['listing_id']).drop_duplicates('listing_id')
+    listings = listings.merge(cities, left_on='neighbourhood', right_on='cleaned_neighborhood', how='left')
+    return pd.DataFrame({'listing_id': listings['listing_id'].astype(np.int64),
+                         'city_id': pd.to_numeric(listings['city_id']).fillna(0).astype(np.int16)})
+
+
+def city_names(city_neighborhood_csv):
+    """{city: city_id} from city_neighborhood.csv."""
+    cities = pd.read_csv(city_neighborhood_csv, usecols=['city', 'city_id'], encoding='utf-8-sig').dropna()
+    return {city: int(city_id) for city, city_id in zip(cities['city'], cities['city_id'])}
+
+
+def _create(path, dtype, shape, fill=None):
+    """A writable memmap of `shape`, or None (and an empty file) when it has no elements."""
+    if int(np.prod(shape)) == 0:
+        open(path, 'wb').close()
+        return None
+    array = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+    if fill is not None:
+        array[:] = fill
+    return array
+
+
+def _horizon(date, chunksize):
+    """(first, last) day offset of the non-missing dates, or None."""
+    first = last = None
+    for start in range(0, len(date), chunksize):
+        days = np.asarray(date[start:start + chunksize])
+        days = days[days != DATE_NULL]
+        if len(days):
+            first = days.min() if first is None else min(first, days.min())
+            last = days.max() if last is None else max(last, days.max())
+    return None if first is None else (int(first), int(last))
+
+
+def _nights(values):
+    """Encoded minimum/maximum nights as int32; missing -> 0, out-of-range values clipped."""
+    values = np.where(values == INT_NULL, 0, values)
+    return np.clip(values, 0, _NIGHTS_MAX).astype(np.int32)
+
+
+def _prices(values):
+    """Prices in cents as int32; missing -> PRICE_NULL, and so is a price past int32 (about $21.4M).
+
+    calendar_clean caps adjusted_price but not price, so the check is here:
+    an out-of-range price is unknown rather than wrapped.
+    """
+    fits = (values != INT_NULL) & (values > PRICE_NULL) & (values <= _PRICE_MAX)
+    return np.where(fits, values, PRICE_NULL).astype(np.int32)
+
+
+def build_availability_index(calendar_ckpt, listings_csv, city_neighborhood_csv, index_dir, chunksize=CHUNKSIZE):
+    """Build the availability index of DB_calendar4.ckpt in index_dir. Returns meta."""
+    listings = listing_cities(listings_csv, city_neighborhood_csv).sort_values(['city_id', 'listing_id'])
+    listing_ids = listings['listing_id'].to_numpy(np.int64)
+    city_id = listings['city_id'].to_numpy(np.int16)
+    n = len(listing_ids)
+    id_order = np.argsort(listing_ids, kind='stable')
+    sorted_ids = listing_ids[id_order]
+    block_cities, block_starts = np.unique(city_id, return_index=True)
+
+    date = column_array(calendar_ckpt, 'date')
+    horizon = _horizon(date, chunksize)
+    first_day, days = (horizon[0], horizon[1] - horizon[0] + 1) if horizon else (0, 0)
+    words = (days + 63) // 64
+
+    tmp_dir = tempfile.mkdtemp(prefix='.availability_', dir=os.path.dirname(os.path.abspath(index_dir)))
+    try:
+        listing_ids.tofile(os.path.join(tmp_dir, 'listing_ids.i8'))
+        sorted_ids.tofile(os.path.join(tmp_dir, 'sorted_ids.i8'))
+        id_order.astype(np.int64).tofile(os.path.join(tmp_dir, 'sorted_rows.i8'))
+        block_cities.astype(np.int16).tofile(os.path.join(tmp_dir, 'city_ids.i2'))
+        np.append(block_starts, n).astype(np.int64).tofile(os.path.join(tmp_dir, 'city_offsets.i8'))
+
+        price = _create(os.path.join(tmp_dir, 'price.i4'), np.int32, (n, days), PRICE_NULL)
+        minimum_nights = _create(os.path.join(tmp_dir, 'minimum_nights.i4'), np.int32, (n, days), 0)
+        maximum_nights = _create(os.path.join(tmp_dir, 'maximum_nights.i4'), np.int32, (n, days), 0)
+        # one byte per night while filling, packed into bitsets at the end
+        nights_free = _create(os.path.join(tmp_dir, 'available.tmp'), np.uint8, (n, words * 64), 0)
+
+        rows = 0
+        if price is not None:
+            ids = column_array(calendar_ckpt, 'listing_id')
+            prices = column_array(calendar_ckpt, 'price')
+            mins = column_array(calendar_ckpt, 'minimum_nights')
+            maxs = column_array(calendar_ckpt, 'maximum_nights')
+            for start in range(0, checkpoint_rows(calendar_ckpt), chunksize):
+                stop = start + chunksize
+                chunk_ids = np.asarray(ids[start:stop])
+                chunk_days = np.asarray(date[start:stop])
+                pos = np.minimum(np.searchsorted(sorted_ids, chunk_ids), max(n - 1, 0))
+                keep = (sorted_ids[pos] == chunk_ids) & (chunk_days != DATE_NULL)
+                row = id_order[pos[keep]]
+                night = chunk_days[keep].astype(np.int64) - first_day
+
+                price[row, night] = _prices(np.asarray(prices[start:stop])[keep])
+                minimum_nights[row, night] = _nights(np.asarray(mins[start:stop])[keep])
+                maximum_nights[row, night] = _nights(np.asarray(maxs[start:stop])[keep])
+                available = read_checkpoint(calendar_ckpt, ['available_boo'], start, stop)['available_boo']
+                free = available.fillna(False).to_numpy(bool)[keep]
+                nights_free[row[free], night[free]] = 1
+                rows += int(keep.sum())
+
+        bitsets = _create(os.path.join(tmp_dir, 'available.u8'), np.dtype('<u8'), (n, words))
+        if bitsets is not None:
+            for start in range(0, n, _PACK_ROWS):
+                block = np.packbits(nights_free[start:start + _PACK_ROWS], axis=1, bitorder='little')
+                bitsets[start:start + _PACK_ROWS] = block.view('<u8')
+        for array in (price, minimum_nights, maximum_nights, bitsets, nights_free):
+            if array is not None:
+                array.flush()
+        del price, minimum_nights, maximum_nights, bitsets, nights_free
+        os.remove(os.path.join(tmp_dir, 'available.tmp'))
+
+        meta = {'listings': n, 'rows': rows, 'first_day': str(EPOCH + np.timedelta64(first_day, 'D')),
+                'days': days, 'words': words, 'cities': city_names(city_neighborhood_csv),
+                'calendar_ckpt': os.path.abspath(calendar_ckpt)}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.replace(tmp_dir, index_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return meta
+
+
+def _range_masks(first, last):
+    """uint64 masks over words first // 64 .. last // 64 with bits first..last (inclusive) set."""
+    w0, w1 = first // 64, last // 64
+    masks = np.full(w1 - w0 + 1, np.iinfo(np.uint64).max, dtype=np.uint64)
+    masks[0] &= np.uint64((1 << 64) - (1 << (first % 64)))
+    masks[-1] &= np.uint64((1 << (last % 64 + 1)) - 1)
+    return w0, masks
+
+
+class AvailabilityIndex:
+    """Query API over a built index: free listings and stay prices for a date range."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.first_day = np.datetime64(self.meta['first_day'], 'D')
+        self.days = self.meta['days']
+        shape = (self.meta['listings'], self.days)
+
+        def load(name, dtype, shape=None):
+            path = os.path.join(index_dir, name)
+            if not os.path.getsize(path):
+                return np.zeros(shape or 0, dtype)
+            return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+        self.listing_ids = load('listing_ids.i8', np.int64)
+        self.sorted_ids = load('sorted_ids.i8', np.int64)
+        self.sorted_rows = load('sorted_rows.i8', np.int64)
+        self.city_ids = load('city_ids.i2', np.int16)
+        self.city_offsets = load('city_offsets.i8', np.int64)
+        self.available = load('available.u8', np.dtype('<u8'), (self.meta['listings'], self.meta['words']))
+        self.price = load('price.i4', np.int32, shape)
+        self.minimum_nights = load('minimum_nights.i4', np.int32, shape)
+        self.maximum_nights = load('maximum_nights.i4', np.int32, shape)
+        self._city_keys = {city.lower(): city_id for city, city_id in self.meta['cities'].items()}
+
+    def city_rows(self, city):
+        """(first, stop) rows of a city, given by name (any case) or city_id; (0, 0) if unknown."""
+        city_id = city if isinstance(city, (int, np.integer)) else self._city_keys.get(str(city).strip().lower())
+        if city_id is None:
+            return 0, 0
+        i = np.searchsorted(self.city_ids, city_id)
+        if i == len(self.city_ids) or self.city_ids[i] != city_id:
+            return 0, 0
+        return int(self.city_offsets[i]), int(self.city_offsets[i + 1])
+
+    def listing_row(self, listing_id):
+        i = np.searchsorted(self.sorted_ids, listing_id)
+        if i == len(self.sorted_ids) or self.sorted_ids[i] != listing_id:
+            return None
+        return int(self.sorted_rows[i])
+
+    def nights(self, check_in, check_out):
+        """(first night, stop) offsets into the horizon, or None when the stay is empty or outside it."""
+        first = int((np.datetime64(check_in, 'D') - self.first_day).astype(np.int64))
+        stop = int((np.datetime64(check_out, 'D') - self.first_day).astype(np.int64))
+        if stop <= first or first < 0 or stop > self.days:
+            return None
+        return first, stop
+
+    def _bookable(self, rows, first, stop):
+        """Which of `rows` (a slice or an index array) are free for nights first..stop-1 and allow the stay."""
+        w0, masks = _range_masks(first, stop - 1)
+        words = np.asarray(self.available[rows, w0:w0 + len(masks)])
+        free = ((words & masks) == masks).all(axis=1)
+        length = stop - first
+        min_nights = np.asarray(self.minimum_nights[rows, first])
+        max_nights = np.asarray(self.maximum_nights[rows, first])
+        return free & (min_nights <= length) & ((max_nights == 0) | (max_nights >= length))
+
+    def _totals(self, rows, first, stop):
+        """Total price of nights first..stop-1 for each of `rows`; NaN if a night has no price."""
+        prices = np.asarray(self.price[rows, first:stop])
+        totals = prices.sum(axis=1, dtype=np.int64) / 100
+        return np.where((prices == PRICE_NULL).any(axis=1), np.nan, totals)
+
+    def search(self, city, check_in, check_out, max_total=None):
+        """Listings of `city` bookable from check_in to check_out (the night before it).
+
+        Returns a DataFrame of listing_id, nights, total_price ordered by
+        total_price, then listing_id. max_total drops the dearer stays.
+        """
+        columns = ['listing_id', 'nights', 'total_price']
+        lo, hi = self.city_rows(city)
+        stay = self.nights(check_in, check_out)
+        if lo == hi or stay is None:
+            return pd.DataFrame(columns=columns)
+        first, stop = stay
+        rows = lo + np.flatnonzero(self._bookable(slice(lo, hi), first, stop))
+        result = pd.DataFrame({'listing_id': np.asarray(self.listing_ids[rows]), 'nights': stop - first,
+                               'total_price': self._totals(rows, first, stop)})
+        if max_total is not None:
+            result = result[result['total_price'] <= max_total]
+        return result.sort_values(['total_price', 'listing_id'], kind='stable').reset_index(drop=True)[columns]
+
+    def is_available(self, listing_id, check_in, check_out):
+        """True if the listing can be booked from check_in to check_out."""
+        row = self.listing_row(listing_id)
+        stay = self.nights(check_in, check_out)
+        if row is None or stay is None:
+            return False
+        return bool(self._bookable(np.array([row]), *stay)[0])
+
+    def stay_price(self, listing_id, check_in, check_out):
+        """Total price of the nights from check_in to check_out, available or not; None if unknown."""
+        row = self.listing_row(listing_id)
+        stay = self.nights(check_in, check_out)
+        if row is None or stay is None:
+            return None
+        total = self._totals(np.array([row]), *stay)[0]
+        return None if np.isnan(total) else float(total)
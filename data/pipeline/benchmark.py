@@ -0,0 +1,143 @@
+"""Time every stage of the pipeline on a synthetic snapshot.
+
+Each stage runs in a fresh process (spawned, so nothing is inherited from
+the parent), in order and without the stage cache, and reports:
+
+    wall_s         elapsed time
+    cpu_s          user + system time of the stage and its worker processes
+    peak_rss_mb    peak resident memory of the stage process
+    base_rss_mb    resident memory after imports, before the stage ran
+    children_rss_mb  peak of the largest worker process the stage started
+    filters        rows and time per filter (pipeline/metrics.py)
+
+The results are written as JSON. Given the JSON of an earlier run
+(--baseline), stages whose time or peak memory grew by more than
+--tolerance are listed and the exit status is 1, so a regression shows up
+before the quarterly rebuild rather than during it.
+
+    python -m pipeline.benchmark WORK_DIR [--scale small] [--raw RAW_DIR] [--stages calendar,reviews]
+        [--output bench.json] [--baseline previous.json] [--tolerance 0.25]
+
+Without --raw a synthetic snapshot of --scale is generated in WORK_DIR/raw
+(and reused by later runs). Stage output goes to WORK_DIR/logs/<stage>.log.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics, synthetic
+from pipeline.stages import STAGES, get_stage
+
+
+# the notebook's inline plots need a display; benchmark the headless report instead
+BENCHMARK_PARAMS = {'eda': {'report': True}}
+
+# shorter stage times are mostly noise and are not compared
+MIN_WALL_S = 1.0
+
+
+def _rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _measure(stage_name, paths, params, log_path):
+    """Run one stage in this (fresh) process and return its measurements."""
+    stage = get_stage(stage_name)
+    base_rss = _rss_mb()
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+        with metrics.measure(stage_name) as record:
+            stage.func(paths, **params)
+    return dict(record, base_rss_mb=round(base_rss, 1),
+                children_rss_mb=round(_rss_mb(resource.RUSAGE_CHILDREN), 1))
+
+
+def run_benchmark(work_dir, raw_dir=None, scale='small', stages=None, params=None, workers=None):
+    """Generate (or reuse) a snapshot, run the stages one process each and return the results."""
+    work_dir = os.path.abspath(work_dir)
+    if raw_dir is None:
+        raw_dir = os.path.join(work_dir, 'raw')
+        if not os.path.exists(os.path.join(raw_dir, 'synthetic.json')):
+            print(f"Generating a '{scale}' synthetic snapshot in {raw_dir}")
+            synthetic.generate(raw_dir, scale, workers=workers or os.cpu_count() or 1)
+    paths = {'raw': os.path.abspath(raw_dir), 'data': os.path.join(work_dir, 'data')}
+    os.makedirs(paths['data'], exist_ok=True)
+    os.makedirs(os.path.join(work_dir, 'logs'), exist_ok=True)
+
+    params = dict(BENCHMARK_PARAMS, **(params or {}))
+    names = stages or [stage.name for stage in STAGES]
+    results = []
+    for name in names:
+        stage = get_stage(name)
+        stage_params = dict(stage.params, **params.get(name, {}))
+        log_path = os.path.join(work_dir, 'logs', f"{name}.log")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(_measure, name, paths, stage_params, log_path).result()
+        print(f"{name:12s} {result['wall_s']:9.2f}s  cpu {result['cpu_s']:9.2f}s  "
+              f"peak {result['peak_rss_mb']:8.1f} MB")
+        results.append(result)
+
+    meta = {'raw': paths['raw'], 'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    synthetic_json = os.path.join(paths['raw'], 'synthetic.json')
+    if os.path.exists(synthetic_json):
+        with open(synthetic_json) as f:
+            meta['synthetic'] = json.load(f)['config']
+    return {'meta': meta, 'stages': results}
+
+
+def regressions(results, baseline, tolerance=0.25):
+    """(stage, metric, baseline value, new value) for every metric that grew past the tolerance."""
+    before = {r['stage']: r for r in baseline['stages']}
+    found = []
+    for result in results['stages']:
+        old = before.get(result['stage'])
+        if old is None:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            if metric == 'wall_s' and result[metric] < MIN_WALL_S:
+                continue
+            if result[metric] > old[metric] * (1 + tolerance):
+                found.append((result['stage'], metric, old[metric], result[metric]))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('work_dir')
+    parser.add_argument('--raw', help='existing snapshot to use instead of a synthetic one')
+    parser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='small')
+    parser.add_argument('--stages', help='comma-separated stage names (default: all, in order)')
+    parser.add_argument('--output', help='results JSON (default: WORK_DIR/benchmark.json)')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    stages = args.stages.split(',') if args.stages else None
+    results = run_benchmark(args.work_dir, args.raw, args.scale, stages)
+    output = args.output or os.path.join(args.work_dir, 'benchmark.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for stage, metric, old, new in found:
+            print(f"REGRESSION {stage} {metric}: {old} -> {new}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
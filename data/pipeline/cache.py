@@ -0,0 +1,142 @@
+"""Content-hash cache that lets the pipeline skip stages whose outputs are current.
+
+A stage's cache key is a hash of
+
+    - the content of every input file,
+    - the stage's parameters (missing_threshold, top_n, price_cap, ...),
+    - the source of the stage function and of the modules/functions it lists.
+
+After a stage runs, its key and the content hashes of its outputs are stored
+in <data>/.stage_cache/<stage>.json. On the next run the stage is skipped if
+the key is unchanged and its outputs are still the files it wrote. Because a
+stage's key only covers its own inputs and code, editing the hosts stage
+reruns hosts and superhost but leaves the calendar alone.
+
+File hashes are remembered by (size, mtime), so unchanged multi-GB inputs are
+only read once.
+"""
+import glob
+import hashlib
+import inspect
+import json
+import os
+
+
+CACHE_DIR = '.stage_cache'
+
+_BLOCK = 16 * 1024 * 1024
+
+
+def resolve(patterns, paths):
+    """Expand '{data}/x.csv' / '{raw}/*/calendar.csv' patterns into sorted file paths."""
+    files = []
+    for pattern in patterns:
+        pattern = pattern.format(**paths)
+        if glob.has_magic(pattern):
+            files.extend(sorted(glob.glob(pattern)))
+        else:
+            files.append(pattern)
+    return files
+
+
+class StageCache:
+    """Stage manifests and the file hash memo, kept under <data_path>/.stage_cache."""
+
+    def __init__(self, data_path):
+        self.dir = os.path.join(data_path, CACHE_DIR)
+        os.makedirs(self.dir, exist_ok=True)
+        self._memo_path = os.path.join(self.dir, 'file_hashes.json')
+        self._memo = {}
+        if os.path.exists(self._memo_path):
+            with open(self._memo_path) as f:
+                self._memo = json.load(f)
+
+    def _save_memo(self):
+        tmp = self._memo_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._memo, f)
+        os.replace(tmp, self._memo_path)
+
+    def file_digest(self, path):
+        """sha256 of a file, or of every file under a directory (checkpoints)."""
+        if not os.path.exists(path):
+            return None
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    file_path = os.path.join(root, name)
+                    h.update(os.path.relpath(file_path, path).encode('utf-8'))
+                    h.update(self.file_digest(file_path).encode('ascii'))
+            return h.hexdigest()
+
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        memo = self._memo.get(key)
+        if memo and memo['size'] == stat.st_size and memo['mtime_ns'] == stat.st_mtime_ns:
+            return memo['sha256']
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(_BLOCK), b''):
+                h.update(block)
+        self._memo[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': h.hexdigest()}
+        return h.hexdigest()
+
+    def stage_key(self, stage, paths, params):
+        """Hash of the stage's input contents, parameters and code."""
+        inputs = {os.path.relpath(p, paths['data']) if p.startswith(paths['data']) else p: self.file_digest(p)
+                  for p in resolve(stage.inputs, paths)}
+        code = [inspect.getsource(stage.func)] + [inspect.getsource(c) for c in stage.code]
+        payload = json.dumps({'stage': stage.name, 'inputs': inputs, 'params': params,
+                              'code': hashlib.sha256('\n'.join(code).encode('utf-8')).hexdigest()},
+                             sort_keys=True, default=repr)
+        self._save_memo()
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _manifest_path(self, stage):
+        return os.path.join(self.dir, f"{stage.name}.json")
+
+    def is_valid(self, stage, paths, key):
+        """True if the stage last ran with `key` and its outputs are untouched."""
+        manifest_path = self._manifest_path(stage)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('key') != key:
+            return False
+        outputs = resolve(stage.outputs, paths)
+        if sorted(outputs) != sorted(manifest['outputs']):
+            return False
+        return all(self.file_digest(p) == manifest['outputs'][p] for p in outputs)
+
+    def record(self, stage, paths, key):
+        outputs = {p: self.file_digest(p) for p in resolve(stage.outputs, paths)}
+        with open(self._manifest_path(stage), 'w') as f:
+            json.dump({'key': key, 'outputs': outputs}, f, indent=2)
+        self._save_memo()
+
+    def refresh_outputs(self, files):
+        """Record the current content of `files` in the manifests that list them as outputs.
+
+        For outputs rewritten in place after their stage ran (pipeline/integrity.py
+        dropping orphan rows), so that the stage is not rerun because of it.
+        """
+        files = set(files)
+        for name in sorted(os.listdir(self.dir)):
+            manifest_path = os.path.join(self.dir, name)
+            if not name.endswith('.json') or manifest_path == self._memo_path:
+                continue
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            changed = [p for p in manifest.get('outputs', {}) if p in files]
+            if changed:
+                manifest['outputs'].update({p: self.file_digest(p) for p in changed})
+                with open(manifest_path, 'w') as f:
+                    json.dump(manifest, f, indent=2)
+        self._save_memo()
+
+    def invalidate(self, stage):
+        if os.path.exists(self._manifest_path(stage)):
+            os.remove(self._manifest_path(stage))
@@ -0,0 +1,202 @@
+"""Single-pass, chunked cleaning of calendar_combined.csv.
+
+All of the calendar rules run on each chunk as it is read:
+
+    - parse `date`
+    - drop March-May 2024
+    - drop listing ids that are not in df_listings
+    - strip `$` and `,` from price / adjusted_price (missing -> 0)
+    - minimum_nights / maximum_nights to int (missing -> 0)
+    - available 't'/'f' -> available_boo
+
+Dropping duplicate (listing_id, date) rows and the adjusted_price cap need to
+see the whole table, so the surviving rows go to a typed checkpoint while
+their keys are hash-partitioned by listing_id. Every copy of a key lands in
+the same partition, in file order, so each partition can be deduplicated on
+its own with keep='first'. A final pass over the checkpoint drops those rows
+and the rows above the price cap, which gives the same rows, in the same
+order, as the old step-by-step DB_calendar4.csv.
+
+The same final pass also sums price and nights per (listing_id, month) for
+the monthly price tables (pipeline/aggregates.py).
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pipeline import integrity, metrics
+from pipeline.aggregates import MONTHLY_SCHEMA, MonthlyPrices
+from pipeline.checkpoint import (CHUNKSIZE, CheckpointWriter, INT_NULL, checkpoint_to_csv, column_array,
+                                 encode_date, encode_fixed, encode_int, filter_checkpoint, write_checkpoint)
+
+
+CALENDAR_COLUMNS = ['listing_id', 'date', 'price', 'adjusted_price', 'minimum_nights', 'maximum_nights', 'available_boo']
+
+CALENDAR_SCHEMA = {'listing_id': 'int', 'date': 'date', 'price': 'fixed', 'adjusted_price': 'fixed',
+                   'minimum_nights': 'int', 'maximum_nights': 'int', 'available_boo': 'bool'}
+
+# rows whose (year, month) is listed here are dropped
+DROP_MONTHS = ((2024, 3), (2024, 4), (2024, 5))
+
+PRICE_CAP = 6000
+
+PARTITIONS = 64
+
+_KEY_DTYPE = np.dtype([('listing_id', np.int64), ('date', np.int32), ('row', np.int64)])
+
+
+def parse_price(s):
+    """'$1,234.00' -> 1234.0, missing -> 0."""
+    return s.str.replace('$', '', regex=False).str.replace(',', '', regex=False).fillna(0).astype(float)
+
+
+def clean_calendar_chunk(chunk, valid_listing_ids, drop_months=DROP_MONTHS):
+    """Apply the row-local calendar rules to one chunk of calendar_combined.csv.
+
+    valid_listing_ids is a sorted int64 array. Returns the cleaned chunk and
+    the number of rows dropped by the month cut and by the listing filter.
+    """
+    with metrics.timed('drop_months'):
+        date = pd.to_datetime(chunk['date'], format='%Y-%m-%d')
+        year_month = date.dt.year * 100 + date.dt.month
+        in_dropped_months = year_month.isin([y * 100 + m for y, m in drop_months]).to_numpy()
+
+    with metrics.timed('orphan_listing'):
+        listing_id = encode_int(chunk['listing_id'])
+        # calendar rows come grouped by listing: one lookup per listing (pipeline/integrity.py)
+        valid = integrity.member(valid_listing_ids, listing_id) & (listing_id != INT_NULL)
+
+    month_dropped = int(in_dropped_months.sum())
+    keep = ~in_dropped_months & valid
+    orphan_dropped = int((~in_dropped_months & ~valid).sum())
+    metrics.rows('drop_months', len(chunk), len(chunk) - month_dropped,
+                 reason='date in ' + ', '.join(f"{y}-{m:02d}" for y, m in drop_months))
+    metrics.rows('orphan_listing', len(chunk) - month_dropped, int(keep.sum()), reason='listing_id not in DB_listings')
+
+    chunk = chunk[keep]
+    with metrics.timed('parse_values'):
+        cleaned = pd.DataFrame({
+            'listing_id': listing_id[keep],
+            'date': date[keep],
+            'price': parse_price(chunk['price']),
+            'adjusted_price': parse_price(chunk['adjusted_price']),
+            'minimum_nights': pd.to_numeric(chunk['minimum_nights']).fillna(0).astype(int),
+            'maximum_nights': pd.to_numeric(chunk['maximum_nights']).fillna(0).astype(int),
+            'available_boo': chunk['available'].map({'t': True, 'f': False}),
+        })
+    return cleaned, month_dropped, orphan_dropped
+
+
+def clean_calendar_frame(df, valid_listing_ids, price_cap=PRICE_CAP, drop_months=DROP_MONTHS):
+    """clean_calendar for a calendar that fits in memory (one city's calendar.csv).
+
+    Same rules and same row order, without the checkpoint and partition files.
+    """
+    valid_listing_ids = np.unique(np.asarray(valid_listing_ids, dtype=np.int64))
+    cleaned, _, _ = clean_calendar_chunk(df, valid_listing_ids, drop_months)
+    cleaned = cleaned[~cleaned.duplicated(subset=['listing_id', 'date'], keep='first')]
+    over_cap = encode_fixed(cleaned['adjusted_price']) > round(price_cap * 100)
+    return cleaned[~over_cap].reset_index(drop=True)
+
+
+def _duplicate_rows(part_path):
+    """Row numbers of every repeat of a (listing_id, date) key in one partition."""
+    keys = np.fromfile(part_path, dtype=_KEY_DTYPE)
+    if len(keys) == 0:
+        return np.zeros(0, np.int64)
+    # rows were appended in file order, so keep='first' keeps the earliest row
+    dup = pd.DataFrame({'listing_id': keys['listing_id'], 'date': keys['date']}).duplicated(keep='first').to_numpy()
+    return keys['row'][dup]
+
+
+def clean_calendar(calendar_csv, valid_listing_ids, output_ckpt, output_csv=None, price_cap=PRICE_CAP,
+                   drop_months=DROP_MONTHS, partitions=PARTITIONS, chunksize=CHUNKSIZE, work_dir=None,
+                   monthly_ckpt=None):
+    """Clean calendar_combined.csv into the DB_calendar4 table in one streaming pass.
+
+    The result is written as a checkpoint to output_ckpt and, if output_csv is
+    given, exported there as CSV. With monthly_ckpt the per (listing_id, month)
+    price sums of the kept rows are written there (MONTHLY_SCHEMA). Memory stays
+    at about one chunk plus one key partition. Returns a dict of row counts for
+    each rule.
+    """
+    valid_listing_ids = np.unique(np.asarray(valid_listing_ids, dtype=np.int64))
+    work_dir = tempfile.mkdtemp(prefix='.calendar_', dir=work_dir or os.path.dirname(os.path.abspath(output_ckpt)))
+    stats = {'rows_in': 0, 'dropped_months': 0, 'dropped_orphan_listing': 0,
+             'dropped_duplicate': 0, 'dropped_price_cap': 0}
+    try:
+        spool_ckpt = os.path.join(work_dir, 'spool.ckpt')
+        part_files = [open(os.path.join(work_dir, f"keys_{p:03d}.bin"), 'wb') for p in range(partitions)]
+        row = 0
+        try:
+            reader = pd.read_csv(calendar_csv, chunksize=chunksize,
+                                 usecols=['listing_id', 'date', 'available', 'price', 'adjusted_price',
+                                          'minimum_nights', 'maximum_nights'],
+                                 dtype={'listing_id': str, 'available': str, 'price': str, 'adjusted_price': str})
+            with CheckpointWriter(spool_ckpt, CALENDAR_SCHEMA) as spool:
+                for chunk in reader:
+                    stats['rows_in'] += len(chunk)
+                    cleaned, month_dropped, orphan_dropped = clean_calendar_chunk(chunk, valid_listing_ids, drop_months)
+                    stats['dropped_months'] += month_dropped
+                    stats['dropped_orphan_listing'] += orphan_dropped
+                    with metrics.timed('write_checkpoint'):
+                        spool.append(cleaned)
+
+                    keys = np.empty(len(cleaned), dtype=_KEY_DTYPE)
+                    keys['listing_id'] = cleaned['listing_id'].to_numpy()
+                    keys['date'] = encode_date(cleaned['date'])
+                    keys['row'] = np.arange(row, row + len(cleaned))
+                    row += len(cleaned)
+                    part = keys['listing_id'] % partitions
+                    order = np.argsort(part, kind='stable')
+                    bounds = np.searchsorted(part[order], np.arange(partitions + 1))
+                    for p in range(partitions):
+                        if bounds[p] < bounds[p + 1]:
+                            keys[order[bounds[p]:bounds[p + 1]]].tofile(part_files[p])
+        finally:
+            for f in part_files:
+                f.close()
+
+        # duplicates never cross partitions, so each one is resolved on its own
+        keep = np.ones(row, dtype=bool)
+        with metrics.timed('duplicate_key'):
+            for p in range(partitions):
+                keep[_duplicate_rows(os.path.join(work_dir, f"keys_{p:03d}.bin"))] = False
+        stats['dropped_duplicate'] = int((~keep).sum())
+        metrics.rows('duplicate_key', row, row - stats['dropped_duplicate'],
+                     reason='repeated (listing_id, date), first kept')
+
+        with metrics.timed('price_cap'):
+            over_cap = np.asarray(column_array(spool_ckpt, 'adjusted_price')) > round(price_cap * 100)
+        stats['dropped_price_cap'] = int((keep & over_cap).sum())
+        metrics.rows('price_cap', row - stats['dropped_duplicate'],
+                     row - stats['dropped_duplicate'] - stats['dropped_price_cap'],
+                     reason=f"adjusted_price > {price_cap}")
+        keep &= ~over_cap
+
+        with metrics.timed('write_checkpoint'):
+            filter_checkpoint(spool_ckpt, output_ckpt, keep, chunksize=chunksize)
+        stats['rows_out'] = int(keep.sum())
+
+        if monthly_ckpt is not None:
+            with metrics.timed('monthly_prices'):
+                monthly = MonthlyPrices()
+                listing_id = column_array(spool_ckpt, 'listing_id')
+                date = column_array(spool_ckpt, 'date')
+                price = column_array(spool_ckpt, 'price')
+                for start in range(0, row, chunksize):
+                    mask = keep[start:start + chunksize]
+                    monthly.add(listing_id[start:start + chunksize][mask], date[start:start + chunksize][mask],
+                                price[start:start + chunksize][mask])
+                write_checkpoint(monthly_ckpt, monthly.frame(), MONTHLY_SCHEMA)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output_csv is not None:
+        with metrics.timed('export_csv'):
+            checkpoint_to_csv(output_ckpt, output_csv, columns=CALENDAR_COLUMNS, chunksize=chunksize)
+    return stats
+
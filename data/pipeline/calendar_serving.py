@@ -0,0 +1,120 @@
+"""Per-listing calendar tables for the listing detail routes.
+
+cheapestAvailableDates, monthlyPriceTrend and averageChristmasPrice each
+aggregated a listing's Calendar rows on every request. The calendar stage
+now precomputes their answers in one pass over the cleaned calendar
+checkpoint, into three tables keyed by listing_id:
+
+    listing_cheapest_dates  listing_id, rank, date, price
+                            the 3 cheapest available nights (ties by date)
+    listing_monthly_trend   listing_id, month, avg_monthly_price
+                            average price of the available nights per month
+    listing_holiday_price   listing_id, holiday, avg_price
+                            average price over each configured date window,
+                            available or not, like the old Christmas query
+
+so each route becomes a primary-key lookup. Holiday windows are
+(name, first day, last day) tuples; HOLIDAYS holds the window the
+Christmas route used to hard-code.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline.aggregates import MonthlyPrices
+from pipeline.checkpoint import CHUNKSIZE, EPOCH, INT_NULL, checkpoint_rows, column_array, read_checkpoint
+
+
+HOLIDAYS = (('christmas', '2023-12-20', '2023-12-26'),)
+
+CHEAPEST = 3
+
+# candidate rows kept before they are reduced to CHEAPEST per listing
+_MAX_CANDIDATES = 5_000_000
+
+
+def _day(date):
+    return int((np.datetime64(date, 'D') - EPOCH).astype(np.int64))
+
+
+class CalendarServing:
+    """Running state for the three serving tables."""
+
+    def __init__(self, holidays=HOLIDAYS, cheapest=CHEAPEST):
+        self.holidays = [(name, _day(start), _day(end)) for name, start, end in holidays]
+        self.cheapest = cheapest
+        self.monthly = MonthlyPrices()
+        self._candidates = []
+        self._candidate_rows = 0
+        self._holiday_parts = []
+
+    def add(self, listing_id, days, price_cents, available):
+        """Add calendar rows: int64 ids, int32 day offsets, int64 cents, bool available."""
+        has_price = price_cents != INT_NULL
+        nights = available & has_price
+        self.monthly.add(listing_id[nights], days[nights], price_cents[nights])
+
+        # the cheapest nights of a listing in this chunk are the only ones that can make its top 3
+        candidates = (pd.DataFrame({'listing_id': listing_id[nights], 'price': price_cents[nights],
+                                    'date': days[nights]})
+                        .sort_values(['listing_id', 'price', 'date'], kind='stable'))
+        candidates = candidates.groupby('listing_id', sort=False).head(self.cheapest)
+        self._candidates.append(candidates)
+        self._candidate_rows += len(candidates)
+        if self._candidate_rows > _MAX_CANDIDATES:
+            self._candidates = [self._reduce_candidates()]
+            self._candidate_rows = len(self._candidates[0])
+
+        for name, start, end in self.holidays:
+            in_window = has_price & (days >= start) & (days <= end)
+            if in_window.any():
+                part = (pd.DataFrame({'listing_id': listing_id[in_window], 'price': price_cents[in_window]})
+                          .groupby('listing_id')['price'].agg(price_sum='sum', nights='size').reset_index())
+                part['holiday'] = name
+                self._holiday_parts.append(part)
+
+    def _reduce_candidates(self):
+        candidates = pd.concat(self._candidates).sort_values(['listing_id', 'price', 'date'], kind='stable')
+        return candidates.groupby('listing_id', sort=False).head(self.cheapest)
+
+    def cheapest_dates(self):
+        if not self._candidates:
+            return pd.DataFrame(columns=['listing_id', 'rank', 'date', 'price'])
+        top = self._reduce_candidates().reset_index(drop=True)
+        return pd.DataFrame({'listing_id': top['listing_id'],
+                             'rank': top.groupby('listing_id').cumcount() + 1,
+                             'date': (EPOCH + top['date'].to_numpy().astype(np.int64)).astype('datetime64[ns]'),
+                             'price': top['price'] / 100})
+
+    def monthly_trend(self):
+        monthly = self.monthly.frame()
+        return pd.DataFrame({'listing_id': monthly['listing_id'], 'month': monthly['month'],
+                             'avg_monthly_price': monthly['price_sum'] / monthly['nights'] / 100})
+
+    def holiday_price(self):
+        if not self._holiday_parts:
+            return pd.DataFrame(columns=['listing_id', 'holiday', 'avg_price'])
+        sums = (pd.concat(self._holiday_parts).groupby(['listing_id', 'holiday'], as_index=False)
+                  [['price_sum', 'nights']].sum())
+        return pd.DataFrame({'listing_id': sums['listing_id'], 'holiday': sums['holiday'],
+                             'avg_price': sums['price_sum'] / sums['nights'] / 100})
+
+
+def build_calendar_serving(calendar_ckpt, holidays=HOLIDAYS, chunksize=CHUNKSIZE):
+    """Serving tables from the cleaned calendar checkpoint, in one chunked pass.
+
+    Returns {table name: DataFrame}.
+    """
+    serving = CalendarServing(holidays)
+    listing_id = column_array(calendar_ckpt, 'listing_id')
+    date = column_array(calendar_ckpt, 'date')
+    price = column_array(calendar_ckpt, 'price')
+    for start in range(0, checkpoint_rows(calendar_ckpt), chunksize):
+        stop = start + chunksize
+        available = read_checkpoint(calendar_ckpt, ['available_boo'], start, stop)['available_boo']
+        # a missing flag is not `available_boo = TRUE`
+        available = available.fillna(False).to_numpy(bool)
+        serving.add(np.asarray(listing_id[start:stop]), np.asarray(date[start:stop]),
+                    np.asarray(price[start:stop]), available)
+    return {'listing_cheapest_dates': serving.cheapest_dates(),
+            'listing_monthly_trend': serving.monthly_trend(),
+            'listing_holiday_price': serving.holiday_price()}
@@ -0,0 +1,351 @@
+"""Columnar, typed checkpoints for the intermediate pipeline outputs.
+
+A checkpoint is a directory holding one raw binary file per column and a
+schema.json describing how each column is encoded:
+
+    int    int64, missing values stored as INT_NULL
+    date   int32 days since 1970-01-01, missing values stored as DATE_NULL
+    fixed  int64 fixed-point with FIXED_SCALE decimals (prices in cents)
+    float  float64, missing values stored as NaN
+    bool   packed bits, plus a packed validity bitmap
+    str    utf-8 bytes back to back, int64 offsets and a validity bitmap
+
+Columns are memory-mapped on read, so a stage that only needs `listing_id`
+and `date` never touches the price columns, and nothing is parsed from text.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+SCHEMA_FILE = 'schema.json'
+
+# rows per chunk when streaming a checkpoint
+CHUNKSIZE = 1_000_000
+
+INT_NULL = np.iinfo(np.int64).min
+DATE_NULL = np.iinfo(np.int32).min
+FIXED_SCALE = 2
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+KINDS = ('int', 'date', 'fixed', 'float', 'bool', 'str')
+
+
+def _column_files(column, kind):
+    if kind == 'int' or kind == 'fixed':
+        return {'values': f"{column}.i8"}
+    if kind == 'date':
+        return {'values': f"{column}.i4"}
+    if kind == 'float':
+        return {'values': f"{column}.f8"}
+    if kind == 'bool':
+        return {'values': f"{column}.bits", 'valid': f"{column}.valid"}
+    return {'values': f"{column}.str", 'offsets': f"{column}.off", 'valid': f"{column}.valid"}
+
+
+####################################################
+#### encoding
+####################################################
+
+def encode_int(s):
+    if pd.api.types.is_integer_dtype(s.dtype) and not s.hasnans:
+        return s.to_numpy(np.int64)
+    # nullable ints keep ids above 2**53 exact when some values are missing
+    s = pd.to_numeric(s, errors='coerce', dtype_backend='numpy_nullable')
+    missing = s.isna().to_numpy()
+    if pd.api.types.is_integer_dtype(s.dtype):
+        values = np.array(s.to_numpy(np.int64, na_value=0))
+    else:
+        values = np.nan_to_num(s.to_numpy(np.float64, na_value=np.nan)).astype(np.int64)
+    values[missing] = INT_NULL
+    return values
+
+
+def encode_date(s):
+    if not pd.api.types.is_datetime64_any_dtype(s.dtype):
+        s = pd.to_datetime(s)
+    missing = s.isna().to_numpy()
+    days = s.to_numpy().astype('datetime64[D]').astype(np.int64).astype(np.int32)
+    days[missing] = DATE_NULL
+    return days
+
+
+def encode_fixed(s, scale=FIXED_SCALE):
+    values = pd.to_numeric(s, errors='coerce').to_numpy(np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    fixed = np.rint(np.where(missing, 0, values) * 10 ** scale).astype(np.int64)
+    fixed[missing] = INT_NULL
+    return fixed
+
+
+def encode_float(s):
+    return pd.to_numeric(s, errors='coerce').to_numpy(np.float64, na_value=np.nan)
+
+
+def encode_bool(s):
+    valid = ~s.isna().to_numpy()
+    values = s.where(pd.Series(valid, index=s.index), False).astype(bool).to_numpy()
+    return values, valid
+
+
+def encode_str(s):
+    valid = ~s.isna().to_numpy()
+    encoded = [v.encode('utf-8') if ok else b'' for v, ok in zip(s.astype(object).tolist(), valid)]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    return b''.join(encoded), lengths, valid
+
+
+####################################################
+#### writing
+####################################################
+
+class CheckpointWriter:
+    """Append DataFrame chunks to a checkpoint directory.
+
+    `schema` maps each column to one of KINDS, in output column order.
+    Use as a context manager, or call close() to write schema.json. A with
+    block left by an exception calls abort() instead, so a partly written
+    checkpoint never gets a schema.json.
+    """
+
+    def __init__(self, path, schema):
+        for column, kind in schema.items():
+            if kind not in KINDS:
+                raise ValueError(f"Unknown checkpoint kind {kind!r} for column {column!r}")
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        self.path = path
+        self.schema = dict(schema)
+        self.rows = 0
+        self._files = {}
+        self._pending_bits = {}
+        self._str_bytes = {}
+        for column, kind in self.schema.items():
+            files = _column_files(column, kind)
+            self._files[column] = {part: open(os.path.join(path, name), 'wb') for part, name in files.items()}
+            if kind == 'bool':
+                self._pending_bits[column] = {'values': np.zeros(0, bool), 'valid': np.zeros(0, bool)}
+            elif kind == 'str':
+                self._pending_bits[column] = {'valid': np.zeros(0, bool)}
+                self._str_bytes[column] = 0
+                np.zeros(1, np.int64).tofile(self._files[column]['offsets'])
+
+    def _write_bits(self, column, part, bits, final=False):
+        # packbits works on whole bytes, so carry the remainder to the next chunk
+        bits = np.concatenate([self._pending_bits[column][part], bits])
+        keep = len(bits) if final else len(bits) - len(bits) % 8
+        np.packbits(bits[:keep]).tofile(self._files[column][part])
+        self._pending_bits[column][part] = bits[keep:]
+
+    def append(self, df):
+        for column, kind in self.schema.items():
+            s = df[column]
+            files = self._files[column]
+            if kind == 'int':
+                encode_int(s).tofile(files['values'])
+            elif kind == 'date':
+                encode_date(s).tofile(files['values'])
+            elif kind == 'fixed':
+                encode_fixed(s).tofile(files['values'])
+            elif kind == 'float':
+                encode_float(s).tofile(files['values'])
+            elif kind == 'bool':
+                values, valid = encode_bool(s)
+                self._write_bits(column, 'values', values)
+                self._write_bits(column, 'valid', valid)
+            else:
+                blob, lengths, valid = encode_str(s)
+                files['values'].write(blob)
+                (self._str_bytes[column] + np.cumsum(lengths)).tofile(files['offsets'])
+                self._str_bytes[column] += len(blob)
+                self._write_bits(column, 'valid', valid)
+        self.rows += len(df)
+
+    def close(self):
+        for column, kind in self.schema.items():
+            for part in self._pending_bits.get(column, {}):
+                self._write_bits(column, part, np.zeros(0, bool), final=True)
+            for f in self._files[column].values():
+                f.close()
+        with open(os.path.join(self.path, SCHEMA_FILE), 'w') as f:
+            json.dump({'rows': self.rows, 'fixed_scale': FIXED_SCALE,
+                       'columns': [{'name': c, 'kind': k} for c, k in self.schema.items()]}, f, indent=2)
+
+    def abort(self):
+        """Close the column files and remove the checkpoint directory."""
+        for files in self._files.values():
+            for f in files.values():
+                f.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_checkpoint(path, df, schema):
+    """Write a whole DataFrame as a checkpoint."""
+    with CheckpointWriter(path, schema) as writer:
+        writer.append(df)
+    return path
+
+
+####################################################
+#### reading
+####################################################
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+def checkpoint_kinds(path):
+    """Return {column: kind} in stored column order."""
+    return {c['name']: c['kind'] for c in read_schema(path)['columns']}
+
+
+def checkpoint_rows(path):
+    return read_schema(path)['rows']
+
+
+def _map(path, name, dtype):
+    file_path = os.path.join(path, name)
+    if os.path.getsize(file_path) == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(file_path, dtype=dtype, mode='r')
+
+
+def _bits(path, name, start, stop):
+    packed = _map(path, name, np.uint8)
+    bits = np.unpackbits(packed[start // 8:(stop + 7) // 8])
+    offset = start - (start // 8) * 8
+    return bits[offset:offset + stop - start].astype(bool)
+
+
+def column_array(path, column):
+    """Raw encoded values of a fixed-width column as a read-only memmap.
+
+    int/fixed columns come back as int64 (INT_NULL for missing), dates as
+    int32 day offsets (DATE_NULL for missing) and floats as float64.
+    """
+    kind = checkpoint_kinds(path)[column]
+    dtype = {'int': np.int64, 'fixed': np.int64, 'date': np.int32, 'float': np.float64}.get(kind)
+    if dtype is None:
+        raise ValueError(f"Column {column!r} is {kind}, not a fixed-width column")
+    return _map(path, _column_files(column, kind)['values'], dtype)
+
+
+def decode_column(path, column, kind, start, stop, scale=FIXED_SCALE):
+    """Decode rows [start, stop) of one column back to a pandas-friendly array."""
+    files = _column_files(column, kind)
+    if kind == 'int':
+        values = np.asarray(_map(path, files['values'], np.int64)[start:stop])
+        missing = values == INT_NULL
+        if missing.any():
+            return pd.arrays.IntegerArray(values, missing)
+        return values
+    if kind == 'date':
+        days = np.asarray(_map(path, files['values'], np.int32)[start:stop])
+        dates = (EPOCH + days.astype(np.int64)).astype('datetime64[ns]')
+        dates[days == DATE_NULL] = np.datetime64('NaT')
+        return dates
+    if kind == 'fixed':
+        values = np.asarray(_map(path, files['values'], np.int64)[start:stop])
+        decoded = values / 10 ** scale
+        decoded[values == INT_NULL] = np.nan
+        return decoded
+    if kind == 'float':
+        return np.array(_map(path, files['values'], np.float64)[start:stop])
+    if kind == 'bool':
+        values = _bits(path, files['values'], start, stop)
+        valid = _bits(path, files['valid'], start, stop)
+        if not valid.all():
+            return pd.arrays.BooleanArray(values, ~valid)
+        return values
+    offsets = np.asarray(_map(path, files['offsets'], np.int64)[start:stop + 1])
+    valid = _bits(path, files['valid'], start, stop)
+    blob = bytes(_map(path, files['values'], np.uint8)[offsets[0]:offsets[-1]]) if len(offsets) else b''
+    rel = offsets - (offsets[0] if len(offsets) else 0)
+    out = np.empty(stop - start, dtype=object)
+    for i in range(stop - start):
+        out[i] = blob[rel[i]:rel[i + 1]].decode('utf-8') if valid[i] else None
+    return out
+
+
+def take_strings(path, column, rows):
+    """Values of a str column at the given row numbers, in that order (None if missing)."""
+    files = _column_files(column, 'str')
+    offsets = _map(path, files['offsets'], np.int64)
+    blob = _map(path, files['values'], np.uint8)
+    rows = np.asarray(rows, dtype=np.int64)
+    valid_bytes = np.asarray(_map(path, files['valid'], np.uint8)[rows >> 3]) if len(rows) else np.zeros(0, np.uint8)
+    valid = (valid_bytes >> (7 - (rows & 7)).astype(np.uint8)) & 1
+    return [bytes(blob[offsets[r]:offsets[r + 1]]).decode('utf-8') if ok else None for r, ok in zip(rows, valid)]
+
+
+def read_checkpoint(path, columns=None, start=0, stop=None):
+    """Read rows [start, stop) of the given columns into a DataFrame.
+
+    Only the requested columns are touched on disk.
+    """
+    schema = read_schema(path)
+    kinds = {c['name']: c['kind'] for c in schema['columns']}
+    stop = schema['rows'] if stop is None else min(stop, schema['rows'])
+    start = min(start, stop)
+    columns = list(kinds) if columns is None else list(columns)
+    return pd.DataFrame({column: decode_column(path, column, kinds[column], start, stop, schema['fixed_scale'])
+                         for column in columns})
+
+
+def iter_checkpoint(path, columns=None, chunksize=CHUNKSIZE):
+    """Yield the checkpoint as DataFrame chunks of `chunksize` rows."""
+    rows = checkpoint_rows(path)
+    for start in range(0, rows, chunksize):
+        yield read_checkpoint(path, columns, start, start + chunksize)
+
+
+####################################################
+#### derived checkpoints and exports
+####################################################
+
+def filter_checkpoint(src, dst, keep, rename=None, chunksize=CHUNKSIZE):
+    """Copy the rows of src where the boolean array `keep` is set into dst.
+
+    `rename` maps old column names to new ones. Work is done chunk by chunk.
+    """
+    kinds = checkpoint_kinds(src)
+    rename = rename or {}
+    schema = {rename.get(c, c): k for c, k in kinds.items()}
+    keep = np.asarray(keep, dtype=bool)
+    with CheckpointWriter(dst, schema) as writer:
+        for start in range(0, len(keep), chunksize):
+            mask = keep[start:start + chunksize]
+            if not mask.any():
+                continue
+            chunk = read_checkpoint(src, start=start, stop=start + len(mask))
+            writer.append(chunk[mask].rename(columns=rename))
+    return dst
+
+
+def checkpoint_to_csv(src, csv_path, columns=None, chunksize=CHUNKSIZE, encoding='utf-8-sig'):
+    """Export a checkpoint as CSV, the format the database load expects."""
+    mode = 'w'
+    header = True
+    columns = list(checkpoint_kinds(src)) if columns is None else columns
+    if checkpoint_rows(src) == 0:
+        pd.DataFrame(columns=columns).to_csv(csv_path, index=False, encoding=encoding)
+        return csv_path
+    for chunk in iter_checkpoint(src, columns, chunksize):
+        chunk.to_csv(csv_path, mode=mode, header=header, index=False, encoding=encoding)
+        # only the first write carries the header (and BOM)
+        mode, header, encoding = 'a', False, 'utf-8'
+    return csv_path
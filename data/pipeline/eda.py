@@ -0,0 +1,232 @@
+"""Basic EDA for the combined nationwide files.
+
+Every number comes from one streaming pass of pipeline.profiler, so the
+files are never loaded whole; the plots are drawn from the precomputed
+histogram bins, value counts and correlation matrix. eda_report is the
+headless variant for large runs: it renders the plots to PNGs in worker
+processes and writes one static HTML report per file.
+"""
+import html
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from pipeline.profiler import CHUNKSIZE, profile_csv
+
+try:
+    from IPython.display import display
+except ImportError:  # running outside a notebook
+    display = print
+
+
+# List of combined CSV files
+COMBINED_FILES = ['calendar_combined.csv', 'listings_combined.csv', 'listings_detailed_combined.csv',
+                  'neighbourhoods_combined.csv', 'reviews_combined.csv', 'reviews_detailed_combined.csv']
+
+_TABLE_STYLES = [{'selector': 'th', 'props': [('background-color', '#f0f0f0'), ('color', 'black'), ('font-weight', 'bold')]},
+                 {'selector': 'td', 'props': [('text-align', 'center')]}]
+
+
+def eda_summary(file, profile, missing_threshold=0.5):
+    """The eda_results row for one file, plus the missing and unique value summaries."""
+    missing_percent = profile['missing'] * 100 / profile['rows'] if profile['rows'] else profile['missing'] * 0.0
+    missing_summary = missing_percent[missing_percent > missing_threshold].sort_values(ascending=False)
+    unique_counts = profile['distinct'][profile['cat_cols']].sort_values()
+    few_unique = unique_counts[unique_counts < 20]
+    eda_results = {
+        "File": file,
+        "Shape": (profile['rows'], len(profile['columns'])),
+        "Missing Value Summary": missing_summary.to_string() if not missing_summary.empty else "No missing values > 10%",
+        "Numerical Columns": len(profile['num_cols']),
+        "Categorical Columns": len(profile['cat_cols']),
+        "Unique Value Counts": few_unique.to_string() if not few_unique.empty else "No categorical variables with <20 unique values"
+    }
+    return eda_results, missing_summary, few_unique
+
+
+def plot_specs(file, profile):
+    """Plots for one file, drawn from the profile's bins, counts and correlation.
+
+    The old loop drew the first three histograms and the heatmap twice;
+    specs are keyed by (kind, column) so every plot is drawn once.
+    """
+    specs = {}
+    # Numerical features: Histograms
+    for col in profile['num_cols']:
+        counts, edges = profile['histograms'][col]
+        if len(counts):
+            specs[('hist', col)] = {'kind': 'hist', 'column': col, 'title': f'Distribution of {col}',
+                                    'counts': counts, 'edges': edges}
+    # Categorical features: Bar plots (fewer than 20 unique values)
+    for col in profile['cat_cols']:
+        counts = profile['value_counts'].get(col)
+        if counts is not None and len(counts) < 20:
+            specs[('bar', col)] = {'kind': 'bar', 'column': col, 'title': f'Counts of {col}', 'counts': counts}
+    # Correlation matrix (for numerical features)
+    if len(profile['num_cols']) > 1:
+        specs[('heatmap', None)] = {'kind': 'heatmap', 'column': None, 'title': f'Correlation Matrix for {file}',
+                                    'corr': profile['corr']}
+    return list(specs.values())
+
+
+def draw_spec(spec):
+    """Draw one plot spec on a new figure and return the figure."""
+    if spec['kind'] == 'hist':
+        fig = plt.figure(figsize=(6, 4))
+        plt.stairs(spec['counts'], spec['edges'], fill=True)
+    elif spec['kind'] == 'bar':
+        fig = plt.figure(figsize=(6, 4))
+        spec['counts'].plot(kind='bar')
+        plt.xlabel(spec['column'])
+        plt.ylabel("Frequency")
+        plt.xticks(rotation=45)
+    else:
+        fig = plt.figure(figsize=(10, 8))
+        sns.heatmap(spec['corr'], annot=True, cmap='coolwarm', fmt=".2f")
+    plt.title(spec['title'])
+    return fig
+
+
+def show_plots(file, profile):
+    for spec in plot_specs(file, profile):
+        fig = draw_spec(spec)
+        plt.show()
+        # show() does not release a figure on non-interactive backends
+        plt.close(fig)
+
+
+def spec_filename(spec):
+    name = spec['kind'] if spec['column'] is None else f"{spec['kind']}_{spec['column']}"
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name) + '.png'
+
+
+def _use_agg():
+    plt.switch_backend('Agg')
+
+
+def render_spec(spec, path):
+    """Draw a spec headless and save it as a PNG (runs in a worker process)."""
+    fig = draw_spec(spec)
+    fig.savefig(path, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def write_report(report_dir, file, profile, eda_results, images):
+    """Write <report_dir>/index.html with the summary tables and the rendered plots."""
+    parts = [f"<html><head><meta charset=\"utf-8\"><title>EDA for {html.escape(file)}</title></head><body>",
+             f"<h1>EDA for {html.escape(file)}</h1>",
+             "<h2>Summary</h2>", pd.DataFrame([eda_results]).T.to_html(header=False),
+             "<h2>Head</h2>", profile['head'].to_html(),
+             "<h2>Describe</h2>", profile['describe'].to_html(),
+             "<h2>Plots</h2>"]
+    parts += [f"<p><img src=\"{html.escape(image)}\"></p>" for image in images]
+    parts.append("</body></html>")
+    path = os.path.join(report_dir, 'index.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(parts))
+    return path
+
+
+def eda_report(base_path, combined_files=COMBINED_FILES, missing_threshold=0.5, chunksize=CHUNKSIZE, workers=None):
+    """Headless EDA: one static report per combined file, rendered in parallel.
+
+    Files are profiled and plots rendered in worker processes with the Agg
+    backend. Writes eda_results/<file>_eda_results.csv as basic_eda does, and
+    eda_results/<file>_report/index.html with its plots next to it.
+    """
+    output_dir = os.path.join(base_path, 'eda_results')
+    os.makedirs(output_dir, exist_ok=True)
+    files = [file for file in combined_files if os.path.exists(os.path.join(base_path, file))]
+    for file in combined_files:
+        if file not in files:
+            print(f"File not found: {os.path.join(base_path, file)}")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_use_agg) as pool:
+        profiling = {file: pool.submit(profile_csv, os.path.join(base_path, file), chunksize) for file in files}
+        rendering = {}
+        profiles = {}
+        for file, future in profiling.items():
+            try:
+                profiles[file] = future.result()
+            except pd.errors.EmptyDataError:
+                print(f"Warning: Empty file found at {os.path.join(base_path, file)}")
+                continue
+            except pd.errors.ParserError:
+                print(f"Error parsing {file}. Please check the file format.")
+                continue
+            except Exception as e:
+                # a failed worker costs this file's report only
+                print(f"EDA of {file} failed: {e!r}")
+                continue
+            report_dir = os.path.join(output_dir, f"{file[:-4]}_report")
+            if os.path.exists(report_dir):
+                shutil.rmtree(report_dir)
+            os.makedirs(report_dir)
+            rendering[file] = [pool.submit(render_spec, spec, os.path.join(report_dir, f"{i:03d}_{spec_filename(spec)}"))
+                               for i, spec in enumerate(plot_specs(file, profiles[file]))]
+
+        for file, profile in profiles.items():
+            eda_results, _, _ = eda_summary(file, profile, missing_threshold)
+            output_file = os.path.join(output_dir, f"{file[:-4]}_eda_results.csv")
+            pd.DataFrame([eda_results]).to_csv(output_file, index=False)
+            images = []
+            for future in rendering[file]:
+                try:
+                    images.append(os.path.basename(future.result()))
+                except Exception as e:
+                    print(f"A plot of {file} failed: {e!r}")
+            report = write_report(os.path.join(output_dir, f"{file[:-4]}_report"), file, profile, eda_results, images)
+            print(f"EDA results saved to {output_file}, report {report} ({len(images)} plots)")
+
+
+def basic_eda(base_path, combined_files=COMBINED_FILES, missing_threshold=0.5, chunksize=CHUNKSIZE, plots=True):
+    """Print, plot and save a summary of every combined file.
+
+    One eda_results/<file>_eda_results.csv is written per file.
+    """
+    for file in combined_files:
+        file_path = os.path.join(base_path, file)
+        if os.path.exists(file_path):
+            try:
+                profile = profile_csv(file_path, chunksize=chunksize)
+                print(f"------ EDA for {file} ------")
+
+                print(f"\n---Head of {file}---")
+                display(profile['head'].style.set_table_styles(_TABLE_STYLES))
+
+                print(f"\n---Describe of {file}---")
+                display(profile['describe'].style.set_table_styles(_TABLE_STYLES))
+
+                eda_results, missing_summary, few_unique = eda_summary(file, profile, missing_threshold)
+                if not missing_summary.empty:
+                    print("\n---Missing Value Summary (>10% missing):---")
+                    print(missing_summary)
+                print(f"\n---Numerical Columns: {eda_results['Numerical Columns']}, "
+                      f"Categorical Columns: {eda_results['Categorical Columns']}---")
+                print("\n---Unique Value Count for Categorical Variables:---")
+                print(few_unique)
+
+                if plots:
+                    show_plots(file, profile)
+
+                # Create the output directory if it doesn't exist
+                output_dir = os.path.join(base_path, 'eda_results')
+                os.makedirs(output_dir, exist_ok=True)
+
+                # Save the EDA results to a CSV file, replacing the previous run's
+                output_file = os.path.join(output_dir, f"{file[:-4]}_eda_results.csv")
+                pd.DataFrame([eda_results]).to_csv(output_file, index=False)
+
+                print(f"EDA results saved to {output_file}")
+            except pd.errors.EmptyDataError:
+                print(f"Warning: Empty file found at {file_path}")
+            except pd.errors.ParserError:
+                print(f"Error parsing {file}. Please check the file format.")
+        else:
+            print(f"File not found: {file_path}")
@@ -0,0 +1,394 @@
+"""Incremental ingestion of a new Inside Airbnb snapshot.
+
+Rebuilding every DB_*.csv and reloading 58M rows for a quarterly snapshot
+that changes a small part of each city is wasteful. Instead, each city of
+the new snapshot is cleaned with the same rules as the full pipeline
+(clean_listings, clean_hosts, clean_reviews, clean_calendar_frame) and every
+row of every table gets two 64-bit fingerprints:
+
+    key_hash  hash of the primary key columns
+    row_hash  hash of the whole row, as it would be loaded
+
+The fingerprints of the last ingested snapshot are kept per city and table
+in a small checkpoint (<state>/<city>/<table>.ckpt). Comparing the two sets
+by key_hash gives the inserted rows (new key), the changed rows (same key,
+different row_hash) and the deleted rows (key gone). Only those rows are
+sent to Postgres: they are COPYed into temporary tables and applied with
+INSERT ... ON CONFLICT DO UPDATE and DELETE ... USING, in one transaction
+per city. The state only moves forward once that transaction has committed,
+so a failed run can simply be repeated. The monthly price tables and the
+listing serving tables are refreshed in the same transaction, for the
+touched listings and city only.
+
+    python -m pipeline.incremental --snapshot RAW_DIR --state STATE_DIR \\
+        [--dsn postgresql://...] [--cities Boston,Austin] [--deltas DIR] [--baseline]
+
+Without --dsn the deltas are only computed (and written with --deltas).
+--baseline records the fingerprints of a snapshot that was loaded in full
+(e.g. with pipeline.load) without applying anything.
+"""
+import argparse
+import io
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import calendar_clean, calendar_serving, checkpoint, ingest, load, neighborhoods
+from pipeline.stages import clean_hosts, clean_listings, clean_reviews
+
+
+# name: table in create_tables.sql and pipeline.load.TABLES
+# key: primary key columns (table column names)
+# guard: extra condition a row must meet before it is deleted
+SyncTable = namedtuple('SyncTable', ['name', 'key', 'guard'])
+
+# parents first; deletes run in the reverse order
+SYNC_TABLES = [
+    SyncTable('hosts', ['host_id'],
+              'NOT EXISTS (SELECT 1 FROM listings l WHERE l.host_id = t.host_id)'),
+    SyncTable('is_super_host', ['host_id'],
+              'NOT EXISTS (SELECT 1 FROM listings l WHERE l.host_id = t.host_id)'),
+    SyncTable('listings', ['id'], None),
+    SyncTable('listings_detailed', ['id'], None),
+    SyncTable('calendar', ['listing_id', 'date'], None),
+    SyncTable('reviews', ['review_id'], None),
+]
+
+# state checkpoint columns besides the key columns
+HASH_SCHEMA = {'key_hash': 'int', 'row_hash': 'int'}
+
+# Keep the pipeline's price tables (pipeline/aggregates.py) current after a
+# delta: the per-listing tables only for the listings whose calendar changed,
+# the per-city tables only for the city being ingested.
+REFRESH_LISTINGS = [
+    "CREATE TEMP TABLE touched_listings ON COMMIT DROP AS "
+    "SELECT listing_id FROM upsert_calendar UNION SELECT listing_id FROM delete_calendar",
+    "DELETE FROM monthly_avg_cache m USING touched_listings t WHERE m.listing_id = t.listing_id",
+    "INSERT INTO monthly_avg_cache (listing_id, month, avg_price) "
+    "SELECT c.listing_id, date_trunc('month', c.date)::date, AVG(c.price) "
+    "FROM calendar c JOIN touched_listings t ON c.listing_id = t.listing_id GROUP BY 1, 2",
+    "DELETE FROM listing_overall_avg_price o USING touched_listings t WHERE o.listing_id = t.listing_id",
+    "INSERT INTO listing_overall_avg_price (listing_id, overall_avg_price) "
+    "SELECT m.listing_id, ROUND(AVG(m.avg_price), 2) "
+    "FROM monthly_avg_cache m JOIN touched_listings t ON m.listing_id = t.listing_id GROUP BY 1",
+    # listing serving tables (pipeline/calendar_serving.py)
+    "DELETE FROM listing_cheapest_dates d USING touched_listings t WHERE d.listing_id = t.listing_id",
+    "INSERT INTO listing_cheapest_dates (listing_id, rank, date, price) "
+    "SELECT listing_id, rank, date, price FROM (SELECT c.listing_id, c.date, c.price, "
+    "ROW_NUMBER() OVER (PARTITION BY c.listing_id ORDER BY c.price, c.date) AS rank "
+    "FROM calendar c JOIN touched_listings t ON c.listing_id = t.listing_id "
+    "WHERE c.available_boo AND c.price IS NOT NULL) r "
+    f"WHERE rank <= {calendar_serving.CHEAPEST}",
+    "DELETE FROM listing_monthly_trend m USING touched_listings t WHERE m.listing_id = t.listing_id",
+    "INSERT INTO listing_monthly_trend (listing_id, month, avg_monthly_price) "
+    "SELECT c.listing_id, date_trunc('month', c.date)::date, AVG(c.price) "
+    "FROM calendar c JOIN touched_listings t ON c.listing_id = t.listing_id "
+    "WHERE c.available_boo AND c.price IS NOT NULL GROUP BY 1, 2",
+    "DELETE FROM listing_holiday_price h USING touched_listings t WHERE h.listing_id = t.listing_id",
+]
+# run once per holiday window
+REFRESH_HOLIDAY = (
+    "INSERT INTO listing_holiday_price (listing_id, holiday, avg_price) "
+    "SELECT c.listing_id, %(holiday)s, AVG(c.price) "
+    "FROM calendar c JOIN touched_listings t ON c.listing_id = t.listing_id "
+    "WHERE c.date BETWEEN %(start)s AND %(end)s AND c.price IS NOT NULL GROUP BY 1")
+REFRESH_CITY = [
+    "DELETE FROM city_monthly_avg WHERE city = %(city)s",
+    "INSERT INTO city_monthly_avg (city, month, avg_price) "
+    "SELECT nc.city, mac.month, AVG(mac.avg_price) FROM monthly_avg_cache mac "
+    "JOIN listings l ON mac.listing_id = l.id "
+    "JOIN city_neighborhood nc ON l.cleaned_neighborhood = nc.cleaned_neighborhood "
+    "WHERE nc.city = %(city)s GROUP BY 1, 2",
+    "DELETE FROM superhost_neighborhood_monthly WHERE city = %(city)s",
+    "INSERT INTO superhost_neighborhood_monthly (city, cleaned_neighborhood, month, avg_price) "
+    "SELECT n.city, l.cleaned_neighborhood, date_trunc('month', c.date::timestamptz), AVG(c.price) "
+    "FROM listings l JOIN city_neighborhood n ON n.cleaned_neighborhood = l.cleaned_neighborhood "
+    "JOIN is_super_host i ON i.host_id = l.host_id JOIN calendar c ON c.listing_id = l.id "
+    "WHERE i.host_is_superhost_boo AND n.city = %(city)s GROUP BY 1, 2, 3",
+]
+
+# a city and neighbourhoods first seen in a delta get the next free ids (pipeline/neighborhoods.py)
+ADD_NEIGHBORHOODS = [
+    "INSERT INTO cities (city_id, city, city_key) "
+    "SELECT COALESCE(MAX(city_id), 0) + 1, %(city)s, %(city_key)s FROM cities ON CONFLICT (city_key) DO NOTHING",
+    "INSERT INTO city_search (term, city_id) "
+    "SELECT t.term, c.city_id FROM unnest(%(terms)s::text[]) AS t(term) JOIN cities c ON c.city_key = %(city_key)s "
+    "ON CONFLICT DO NOTHING",
+    "INSERT INTO city_neighborhood (cleaned_neighborhood, city, neighborhood_id, city_id) "
+    "SELECT u.cleaned_neighborhood, c.city, m.max_id + ROW_NUMBER() OVER (ORDER BY u.cleaned_neighborhood), "
+    "c.city_id "
+    "FROM (SELECT DISTINCT cleaned_neighborhood FROM upsert_listings WHERE cleaned_neighborhood IS NOT NULL) u "
+    "JOIN cities c ON c.city_key = %(city_key)s "
+    "CROSS JOIN (SELECT COALESCE(MAX(neighborhood_id), 0) AS max_id FROM city_neighborhood) m "
+    "WHERE NOT EXISTS (SELECT 1 FROM city_neighborhood n WHERE n.cleaned_neighborhood = u.cleaned_neighborhood)",
+]
+
+Delta = namedtuple('Delta', ['upserts', 'deletes', 'inserted', 'changed', 'deleted'])
+
+
+def _load_table(name):
+    for table in load.TABLES:
+        if table.name == name:
+            return table
+    raise KeyError(name)
+
+
+def as_text(frame, int_columns=()):
+    """Render a table as the text COPY will see; missing values become None.
+
+    Fingerprints are taken from this form, so the same row always hashes the
+    same whatever dtype pandas picked for it.
+    """
+    out = {}
+    for col in frame.columns:
+        s = frame[col]
+        missing = s.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
+            text = s.dt.strftime('%Y-%m-%d')
+        else:
+            text = s.astype(str)
+            if col in int_columns:
+                text = text.str.replace(r'\.0+$', '', regex=True)
+        out[col] = text.astype(object).where(~missing, None)
+    return pd.DataFrame(out, index=frame.index).reset_index(drop=True)
+
+
+def snapshot_collisions(snapshot_path):
+    """Neighborhood names used by more than one city of the snapshot (neighborhoods.colliding_names)."""
+    names, cities = [], []
+    for city, city_path in ingest.city_folders(snapshot_path):
+        path = ingest.city_file(city_path, 'listings_detailed.csv')
+        if path is not None:
+            raw = pd.read_csv(path, usecols=['neighbourhood'], dtype=str)['neighbourhood']
+            city_names = neighborhoods.memoized(raw, neighborhoods.neighborhood_name)
+            names.append(city_names)
+            cities.append(pd.Series(neighborhoods.normalize_name(city), index=city_names.index, dtype=object))
+    if not names:
+        return set()
+    return neighborhoods.colliding_names(pd.concat(names, ignore_index=True), pd.concat(cities, ignore_index=True))
+
+
+def city_tables(city_path, price_cap=calendar_clean.PRICE_CAP, drop_months=calendar_clean.DROP_MONTHS,
+                colliding=None):
+    """Clean one city folder of a snapshot into {table: text frame in table columns}.
+
+    colliding: snapshot_collisions of the snapshot, so that neighborhood names
+    are qualified as the full pipeline qualifies them.
+    """
+    def read(file):
+        path = ingest.city_file(city_path, file)
+        return pd.read_csv(path, dtype=str) if path is not None else None
+
+    listings_detailed = read('listings_detailed.csv')
+    if listings_detailed is None:
+        raise FileNotFoundError(f"{city_path} has no listings_detailed.csv")
+
+    frames = {}
+    listings_detailed['neighbourhood'], _ = neighborhoods.clean_neighborhoods(
+        listings_detailed['neighbourhood'], os.path.basename(os.path.normpath(city_path)), colliding or set())
+    df_listings, df_listings_detailed = clean_listings(listings_detailed)
+    frames['listings'] = df_listings
+    frames['listings_detailed'] = df_listings_detailed
+
+    df_host = clean_hosts(listings_detailed)
+    frames['hosts'] = df_host
+    frames['is_super_host'] = pd.DataFrame({
+        'host_id': df_host['host_id'],
+        'host_is_superhost_boo': df_host['host_is_superhost'].map({'t': True, 'f': False}).fillna(False).astype(bool),
+    })
+
+    listing_ids = df_listings['id'].astype(np.int64).to_numpy()
+    calendar = read('calendar.csv')
+    if calendar is not None:
+        frames['calendar'] = calendar_clean.clean_calendar_frame(calendar, listing_ids, price_cap, drop_months)
+    reviews = read('reviews_detailed.csv')
+    if reviews is not None:
+        reviews = clean_reviews(reviews)
+        # reviews of listings the listings table dropped would break the foreign key
+        reviews = reviews[np.isin(checkpoint.encode_int(reviews['listing_id']), listing_ids)]
+        frames['reviews'] = reviews
+
+    tables = {}
+    for name, frame in frames.items():
+        table = _load_table(name)
+        frame = frame[list(table.columns)].rename(columns=table.columns)
+        tables[name] = as_text(frame, table.int_columns)
+    return tables
+
+
+def fingerprint(frame, key):
+    """(key_hash, row_hash) int64 arrays for a text frame."""
+    key_hash = pd.util.hash_pandas_object(frame[key], index=False).to_numpy().view(np.int64)
+    row_hash = pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+    return key_hash, row_hash
+
+
+def diff(old, frame, key):
+    """Compare a table against the fingerprints of the previous snapshot.
+
+    old is the stored state (key columns, key_hash, row_hash) or None. Returns
+    a Delta with the rows to upsert and the keys to delete.
+    """
+    key_hash, row_hash = fingerprint(frame, key)
+    if old is None or len(old) == 0:
+        empty = pd.DataFrame({k: pd.Series([], dtype=object) for k in key})
+        return Delta(frame, empty, len(frame), 0, 0)
+
+    old_key = old['key_hash'].to_numpy(np.int64)
+    old_row = old['row_hash'].to_numpy(np.int64)
+    order = np.argsort(old_key, kind='stable')
+    sorted_key = old_key[order]
+    pos = np.minimum(np.searchsorted(sorted_key, key_hash), len(sorted_key) - 1)
+    found = sorted_key[pos] == key_hash
+    inserted = ~found
+    changed = found & (old_row[order[pos]] != row_hash)
+
+    gone = ~np.isin(old_key, key_hash)
+    deletes = old.loc[gone, key].reset_index(drop=True)
+    upserts = frame[inserted | changed].reset_index(drop=True)
+    return Delta(upserts, deletes, int(inserted.sum()), int(changed.sum()), int(gone.sum()))
+
+
+def state_path(state_dir, city, table):
+    return os.path.join(state_dir, city, f"{table}.ckpt")
+
+
+def read_state(state_dir, city, sync_table):
+    path = state_path(state_dir, city, sync_table.name)
+    if not os.path.exists(path):
+        return None
+    return checkpoint.read_checkpoint(path)
+
+
+def write_state(state_dir, city, sync_table, frame):
+    key_hash, row_hash = fingerprint(frame, sync_table.key)
+    state = frame[sync_table.key].copy()
+    state['key_hash'] = key_hash
+    state['row_hash'] = row_hash
+    schema = dict({k: 'str' for k in sync_table.key}, **HASH_SCHEMA)
+    checkpoint.write_checkpoint(state_path(state_dir, city, sync_table.name), state, schema)
+
+
+def _copy_frame(cur, temp, columns, frame):
+    buf = io.StringIO()
+    frame.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {temp} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def apply_deltas(conn, city, deltas, holidays=calendar_serving.HOLIDAYS):
+    """Apply {table: Delta} for one city (its normalized name) in a single transaction."""
+    with conn.cursor() as cur:
+        for sync_table in SYNC_TABLES:
+            delta = deltas.get(sync_table.name)
+            if delta is None:
+                continue
+            columns = list(_load_table(sync_table.name).columns.values())
+            cur.execute(f"CREATE TEMP TABLE upsert_{sync_table.name} ON COMMIT DROP AS "
+                        f"SELECT {', '.join(columns)} FROM {sync_table.name} WITH NO DATA")
+            cur.execute(f"CREATE TEMP TABLE delete_{sync_table.name} ON COMMIT DROP AS "
+                        f"SELECT {', '.join(sync_table.key)} FROM {sync_table.name} WITH NO DATA")
+            if len(delta.upserts):
+                _copy_frame(cur, f"upsert_{sync_table.name}", columns, delta.upserts)
+            if len(delta.deletes):
+                _copy_frame(cur, f"delete_{sync_table.name}", sync_table.key, delta.deletes)
+
+        if 'listings' in deltas:
+            # the city and the neighbourhoods a new listing points at must exist first
+            for stmt in ADD_NEIGHBORHOODS:
+                cur.execute(stmt, {'city': city, 'city_key': city.lower(), 'terms': neighborhoods.search_terms(city)})
+
+        for sync_table in SYNC_TABLES:
+            if sync_table.name not in deltas:
+                continue
+            columns = list(_load_table(sync_table.name).columns.values())
+            updates = [c for c in columns if c not in sync_table.key]
+            on_conflict = (f"DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in updates)}"
+                           if updates else 'DO NOTHING')
+            cur.execute(f"INSERT INTO {sync_table.name} ({', '.join(columns)}) "
+                        f"SELECT {', '.join(columns)} FROM upsert_{sync_table.name} "
+                        f"ON CONFLICT ({', '.join(sync_table.key)}) {on_conflict}")
+
+        # children first, so no foreign key points at a deleted row
+        for sync_table in reversed(SYNC_TABLES):
+            if sync_table.name not in deltas:
+                continue
+            match = ' AND '.join(f"t.{k} = d.{k}" for k in sync_table.key)
+            guard = f" AND {sync_table.guard}" if sync_table.guard else ''
+            cur.execute(f"DELETE FROM {sync_table.name} t USING delete_{sync_table.name} d WHERE {match}{guard}")
+
+        if 'calendar' in deltas:
+            for stmt in REFRESH_LISTINGS:
+                cur.execute(stmt)
+            for holiday, start, end in holidays:
+                cur.execute(REFRESH_HOLIDAY, {'holiday': holiday, 'start': start, 'end': end})
+        for stmt in REFRESH_CITY:
+            cur.execute(stmt, {'city': city})
+    conn.commit()
+
+
+def write_deltas(delta_dir, city, deltas):
+    os.makedirs(os.path.join(delta_dir, city), exist_ok=True)
+    for name, delta in deltas.items():
+        delta.upserts.to_csv(os.path.join(delta_dir, city, f"{name}_upsert.csv"), index=False, encoding='utf-8-sig')
+        delta.deletes.to_csv(os.path.join(delta_dir, city, f"{name}_delete.csv"), index=False, encoding='utf-8-sig')
+
+
+def ingest_snapshot(snapshot_path, state_dir, dsn=None, cities=None, delta_dir=None, baseline=False,
+                    price_cap=calendar_clean.PRICE_CAP, drop_months=calendar_clean.DROP_MONTHS,
+                    holidays=calendar_serving.HOLIDAYS):
+    """Diff every city of a snapshot against the stored state and apply the deltas.
+
+    With dsn the deltas are applied and the state advanced; with baseline the
+    state is recorded without applying anything; otherwise nothing is changed.
+    Returns {city: {table: (inserted, changed, deleted)}}.
+    """
+    summary = {}
+    colliding = snapshot_collisions(snapshot_path)
+    for city, city_path in ingest.city_folders(snapshot_path):
+        if cities is not None and city not in cities:
+            continue
+        tables = city_tables(city_path, price_cap, drop_months, colliding)
+        deltas = {}
+        for sync_table in SYNC_TABLES:
+            if sync_table.name in tables:
+                deltas[sync_table.name] = diff(read_state(state_dir, city, sync_table), tables[sync_table.name],
+                                               sync_table.key)
+        summary[city] = {name: (d.inserted, d.changed, d.deleted) for name, d in deltas.items()}
+        print(f"{city}: " + ', '.join(f"{name} +{d.inserted} ~{d.changed} -{d.deleted}" for name, d in deltas.items()))
+
+        if delta_dir is not None:
+            write_deltas(delta_dir, city, deltas)
+        if dsn is not None and not baseline:
+            conn = load.connect(dsn)
+            try:
+                apply_deltas(conn, neighborhoods.normalize_name(city), deltas, holidays)
+            finally:
+                conn.close()
+        if dsn is not None or baseline:
+            for sync_table in SYNC_TABLES:
+                if sync_table.name in tables:
+                    write_state(state_dir, city, sync_table, tables[sync_table.name])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshot', required=True, help='folder with one sub-folder per city')
+    parser.add_argument('--state', required=True, help='folder holding the fingerprints of the last snapshot')
+    parser.add_argument('--dsn', default=os.environ.get('PG_DSN'), help='libpq connection string (default: $PG_DSN)')
+    parser.add_argument('--cities', help='comma-separated subset of cities')
+    parser.add_argument('--deltas', help='also write <city>/<table>_upsert.csv and _delete.csv here')
+    parser.add_argument('--baseline', action='store_true', help='record the state only, apply nothing')
+    parser.add_argument('--dry-run', action='store_true', help='compute the deltas, do not apply them')
+    args = parser.parse_args(argv)
+
+    cities = set(args.cities.split(',')) if args.cities else None
+    dsn = None if args.dry_run else args.dsn
+    ingest_snapshot(args.snapshot, args.state, dsn=dsn, cities=cities, delta_dir=args.deltas, baseline=args.baseline)
+
+
+if __name__ == '__main__':
+    main()
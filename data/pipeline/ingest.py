@@ -0,0 +1,290 @@
+"""Combine the per-city Inside Airbnb files into nationwide CSVs.
+
+City files can be the compressed downloads as Inside Airbnb ships them;
+they are read directly, without decompressing them to disk first.
+listings.csv.gz holds the detailed listings and reviews.csv.gz the detailed
+reviews, while the plain listings.csv and reviews.csv are the summaries. So
+each file the pipeline uses is looked up under these names, first match
+wins:
+
+    calendar.csv           calendar.csv.gz
+    listings_detailed.csv  listings_detailed.csv.gz, listings.csv.gz
+    reviews_detailed.csv   reviews_detailed.csv.gz, reviews.csv.gz
+
+Every city file is read through a read-ahead stream. A background thread
+reads (and gunzips) the file a few blocks ahead of the CSV parser, and the
+next city's file starts loading while the current one is still being
+parsed. Reads from slow mounted storage and decompression then overlap with
+parsing; zlib and file reads release the GIL.
+"""
+import gzip
+import io
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+
+# rows read per chunk when streaming a city file into the combined output
+CHUNKSIZE = 500_000
+
+# the compressed names a city file may have, tried in order after its own name
+COMPRESSED_NAMES = {
+    'calendar.csv': ['calendar.csv.gz'],
+    'listings_detailed.csv': ['listings_detailed.csv.gz', 'listings.csv.gz'],
+    'reviews_detailed.csv': ['reviews_detailed.csv.gz', 'reviews.csv.gz'],
+}
+
+# bytes per read-ahead block, and blocks a stream may hold ahead of its reader
+READ_BLOCK = 4 * 1024 * 1024
+READ_AHEAD = 8
+
+
+def input_names(file):
+    """Names `file` may have in a city folder, in the order they are tried."""
+    return [file] + COMPRESSED_NAMES.get(file, [])
+
+
+def city_folders(base_path):
+    """Yield (city_folder, city_path) for every city folder, sorted by name."""
+    for city_folder in sorted(os.listdir(base_path)):
+        city_path = os.path.join(base_path, city_folder)
+        if os.path.isdir(city_path):  # Ensure we are dealing with a folder, not a file
+            yield city_folder, city_path
+
+
+def city_file(city_path, file):
+    """Path of `file` in one city folder, plain or compressed, or None."""
+    for name in input_names(file):
+        path = os.path.join(city_path, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def city_files(base_path, file):
+    """Return [(city_folder, csv_path)] for the cities that have `file`."""
+    found = []
+    for city_folder, city_path in city_folders(base_path):
+        csv_path = city_file(city_path, file)
+        if csv_path is not None:
+            found.append((city_folder, csv_path))
+    return found
+
+
+class ReadAhead(io.RawIOBase):
+    """A file read, and gunzipped if it ends in .gz, by a background thread.
+
+    The thread stays at most `ahead` blocks in front of the reader, so memory
+    is bounded whatever the file size.
+    """
+
+    def __init__(self, path, block=READ_BLOCK, ahead=READ_AHEAD):
+        super().__init__()
+        self.path = path
+        self._queue = queue.Queue(maxsize=ahead)
+        self._stop = threading.Event()
+        self._data = b''
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(block,), daemon=True)
+        self._thread.start()
+
+    def _fill(self, block):
+        try:
+            with (gzip.open if self.path.endswith('.gz') else open)(self.path, 'rb') as f:
+                while not self._stop.is_set():
+                    data = f.read(block)
+                    self._put(data)
+                    if not data:  # b'' marks the end
+                        return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._pos == len(self._data):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._data, self._pos = item, 0
+        n = min(len(buffer), len(self._data) - self._pos)
+        buffer[:n] = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+
+def open_input(path):
+    """A buffered binary stream over `path` that is read ahead in the background."""
+    return io.BufferedReader(ReadAhead(path), READ_BLOCK)
+
+
+def read_ahead(paths):
+    """Yield an open read-ahead stream per path, closing each when the next is asked for.
+
+    The next file's stream is opened before the current one is handed out,
+    so its first blocks load while the current file is parsed.
+    """
+    paths = list(paths)
+    current = upcoming = None
+    try:
+        upcoming = open_input(paths[0]) if paths else None
+        for i in range(len(paths)):
+            current = upcoming
+            upcoming = open_input(paths[i + 1]) if i + 1 < len(paths) else None
+            yield current
+            current.close()
+    finally:
+        # a consumer that stops early leaves both streams open
+        for stream in (current, upcoming):
+            if stream is not None:
+                stream.close()
+
+
+def combined_columns(csv_paths):
+    """Union of the header columns, in order of first appearance.
+
+    This is the column order pd.concat would give the combined frame. Files
+    whose header can't be read are left out with the usual warnings.
+    """
+    columns = []
+    readable = []
+    for csv_path in csv_paths:
+        try:
+            header = pd.read_csv(csv_path, nrows=0).columns
+        except pd.errors.EmptyDataError:
+            print(f"Warning: Empty file found at {csv_path}")
+            continue
+        except pd.errors.ParserError:
+            print(f"Warning: Parsing error encountered for {csv_path}")
+            continue
+        for col in header:
+            if col not in columns:
+                columns.append(col)
+        readable.append(csv_path)
+    return columns, readable
+
+
+def _write_city(csv_path, city_folder, columns, out, header, add_city, chunksize, stream=None):
+    """Append one city file to `out` chunk by chunk; return (rows, warning).
+
+    stream: the file's read-ahead stream, opened here when not given. A file
+    that fails to parse is truncated back out of `out`.
+    """
+    start = out.tell()
+    rows = 0
+    own_stream = stream is None
+    if own_stream:
+        stream = open_input(csv_path)
+    try:
+        reader = pd.read_csv(stream, dtype=str, keep_default_na=False, chunksize=chunksize)
+        if chunksize is None:
+            reader = [reader]
+        for chunk in reader:
+            chunk = chunk.reindex(columns=columns, fill_value='')
+            if add_city:
+                chunk['city'] = city_folder
+            chunk.to_csv(out, header=header, index=False)
+            header = False
+            rows += len(chunk)
+    except pd.errors.EmptyDataError:
+        return 0, f"Warning: Empty file found at {csv_path}"
+    except pd.errors.ParserError:
+        out.seek(start)
+        out.truncate()
+        return 0, f"Warning: Parsing error encountered for {csv_path}"
+    finally:
+        if own_stream:
+            stream.close()
+    return rows, None
+
+
+def _write_city_part(csv_path, city_folder, columns, part_path, add_city, chunksize):
+    """Worker side of the parallel concat: write one city to its own part file."""
+    with open(part_path, 'w', newline='', encoding='utf-8') as out:
+        return _write_city(csv_path, city_folder, columns, out, False, add_city, chunksize)
+
+
+def concat_city_files(base_path, file, output_path, add_city=False, chunksize=CHUNKSIZE, workers=1):
+    """Stream every city's copy of `file` into one combined CSV.
+
+    Each city file is read `chunksize` rows at a time and appended straight to
+    output_path, so peak memory is one chunk no matter how many cities there
+    are. Values are copied through as text, so nothing is re-typed on the way.
+    With add_city a 'city' column holding the city folder name is added to
+    every chunk. A city file that fails to parse is rolled back out of the
+    output, like the in-memory concat skipping it.
+
+    With workers > 1 the city files are parsed in that many processes, each
+    into its own part file, and the parts are appended in city order. Either
+    way the output rows are ordered by city folder name.
+
+    Returns the number of rows written, or None if no city has the file.
+    """
+    found = city_files(base_path, file)
+    columns, readable = combined_columns([csv_path for _, csv_path in found])
+    if not readable:
+        return None
+    found = [(city, csv_path) for city, csv_path in found if csv_path in readable]
+
+    out_columns = columns + (['city'] if add_city and 'city' not in columns else [])
+    pd.DataFrame(columns=out_columns).to_csv(output_path, index=False)
+
+    rows = 0
+    if workers > 1 and len(found) > 1:
+        part_dir = tempfile.mkdtemp(prefix='.concat_', dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool, open(output_path, 'ab') as out:
+                parts = []
+                for i, (city_folder, csv_path) in enumerate(found):
+                    part_path = os.path.join(part_dir, f"{i:04d}.csv")
+                    future = pool.submit(_write_city_part, csv_path, city_folder, columns,
+                                         part_path, add_city, chunksize)
+                    parts.append((part_path, future))
+
+                # collect in submission (city) order so the output is deterministic
+                for part_path, future in parts:
+                    city_rows, warning = future.result()
+                    if warning:
+                        print(warning)
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, out, 16 * 1024 * 1024)
+                    os.remove(part_path)
+                    rows += city_rows
+        finally:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    else:
+        with open(output_path, 'a', newline='', encoding='utf-8') as out:
+            streams = read_ahead(csv_path for _, csv_path in found)
+            for (city_folder, csv_path), stream in zip(found, streams):
+                city_rows, warning = _write_city(csv_path, city_folder, columns, out, False, add_city, chunksize,
+                                                 stream)
+                if warning:
+                    print(warning)
+                rows += city_rows
+    return rows
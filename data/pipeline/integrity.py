@@ -0,0 +1,360 @@
+"""Referential integrity of the DB_*.csv outputs against create_tables.sql.
+
+Every foreign key declared in the schema is checked, in one pass over the
+outputs, in the load order of pipeline/load.py:
+
+    is_super_host.host_id        -> hosts.host_id
+    listings.host_id             -> hosts.host_id
+    city_neighborhood, city_search .city_id -> cities.city_id
+    listings.cleaned_neighborhood -> city_neighborhood.cleaned_neighborhood
+    listings_detailed.id         -> listings.id
+    listings_amenities.id / amenity_id -> listings.id / amenities.amenity_id
+    calendar, reviews, and the per-listing aggregate tables -> listings.id
+
+The relationships come from the schema itself. Output files and their
+column names come from load.TABLES, so a new table is checked as soon as
+it can be loaded.
+
+Parent keys are held as a sorted int64 array of their distinct values.
+Child keys are tested against it with a bitmap when the keys are dense
+(amenity ids) and with a binary search otherwise. The search runs once per
+run of equal values, so a column grouped by listing, like the calendar's
+listing_id, costs one search per listing rather than one per row. The
+calendar and reviews keys are memory-mapped from their checkpoints; the
+other tables read just the key column.
+
+A missing key (NULL) is not a foreign-key violation. It is counted
+separately, and it is a violation only in a NOT NULL column.
+
+With drop, the rows that violate any foreign key of their table are removed
+from its output and its checkpoint. Parents are processed before children,
+so the rows orphaned by a dropped parent row go too. The stage-cache
+manifests that list a rewritten file are updated, so the stage that wrote
+the file is not rerun because of the drop. The outputs derived from a
+rewritten table that are not loaded themselves follow it: the review index
+is rebuilt when reviews are dropped, because it points at checkpoint rows,
+and when listings or calendar rows are dropped, the monthly price
+checkpoint loses the rows of the dropped listings and the availability
+index is rebuilt. The calendar serving tables are loaded, so their own
+foreign keys drop them.
+
+    python -m pipeline.integrity --data-path DIR [--drop] [--report integrity_report.json]
+"""
+import argparse
+import codecs
+import json
+import os
+import re
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import availability, checkpoint, load, metrics, review_index
+from pipeline.cache import CACHE_DIR, StageCache
+from pipeline.checkpoint import CHUNKSIZE, INT_NULL, encode_int
+
+
+# not_null: the child column is NOT NULL (or part of the primary key)
+ForeignKey = namedtuple('ForeignKey', ['table', 'column', 'ref_table', 'ref_column', 'not_null'])
+
+INT_TYPES = {'smallint', 'int', 'integer', 'bigint', 'serial', 'bigserial'}
+
+# parent keys spanning fewer than this many values per key are looked up in a bitmap
+BITMAP_SPAN = 64
+
+# child keys are tested this many at a time
+BLOCK = 8_000_000
+
+# orphan keys listed per relationship in the report
+EXAMPLES = 5
+
+_CREATE_RE = re.compile(r'create\s+table\s+(?:if\s+not\s+exists\s+)?(\w+)\s*\((.*)\)\s*;',
+                        re.IGNORECASE | re.DOTALL)
+_REFERENCES_RE = re.compile(r'\breferences\s+(\w+)\s*(?:\(\s*(\w+)\s*\))?', re.IGNORECASE)
+_TABLE_FK_RE = re.compile(r'\bforeign\s+key\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+
+
+def _split_definitions(body):
+    """Split the body of a CREATE TABLE at its top-level commas."""
+    items, depth, start = [], 0, 0
+    for i, ch in enumerate(body):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(body[start:i])
+            start = i + 1
+    items.append(body[start:])
+    return [' '.join(item.split()) for item in items if item.strip()]
+
+
+def parse_schema(schema_path=load.SCHEMA_PATH):
+    """({table: {column: type}}, [ForeignKey]) of create_tables.sql, names lower-cased.
+
+    A REFERENCES without a column points at the referenced table's primary key.
+    """
+    columns, primary, foreign = {}, {}, []
+    for stmt in load.schema_statements(schema_path):
+        match = _CREATE_RE.match(stmt)
+        if match is None:
+            continue
+        table = match.group(1).lower()
+        columns[table] = {}
+        for item in _split_definitions(match.group(2)):
+            lower = item.lower()
+            ref = _REFERENCES_RE.search(item)
+            if lower.startswith(('primary key', 'constraint', 'unique', 'check', 'foreign key')):
+                # table constraint; only a single-column FOREIGN KEY matters here
+                fk = _TABLE_FK_RE.search(item)
+                if fk is not None and ref is not None:
+                    foreign.append(ForeignKey(table, fk.group(1).lower(), ref.group(1).lower(),
+                                              (ref.group(2) or '').lower() or None, False))
+                continue
+            name, sql_type = lower.split()[:2]
+            columns[table][name] = re.match(r'\w+', sql_type).group(0)
+            if 'primary key' in lower:
+                primary[table] = name
+            if ref is not None:
+                foreign.append(ForeignKey(table, name, ref.group(1).lower(), (ref.group(2) or '').lower() or None,
+                                          'not null' in lower or 'primary key' in lower))
+    return columns, [fk._replace(ref_column=fk.ref_column or primary[fk.ref_table]) for fk in foreign]
+
+
+def _checkpoint_path(path):
+    """The checkpoint written next to an output CSV (DB_calendar4.csv -> DB_calendar4.ckpt), if any."""
+    ckpt = os.path.splitext(path)[0] + '.ckpt'
+    return ckpt if os.path.isdir(ckpt) else None
+
+
+def read_keys(path, column, integer):
+    """One key column of an output: int64 with INT_NULL for missing, or text with '' for missing."""
+    ckpt = _checkpoint_path(path)
+    if integer and ckpt is not None and checkpoint.checkpoint_kinds(ckpt).get(column) == 'int':
+        return checkpoint.column_array(ckpt, column)
+    if not integer:
+        return pd.read_csv(path, usecols=[column], dtype=str, keep_default_na=False,
+                           encoding='utf-8-sig')[column].to_numpy(object)
+    values = pd.read_csv(path, usecols=[column], encoding='utf-8-sig')[column]
+    if not pd.api.types.is_integer_dtype(values.dtype):
+        # missing values (or ints written as '3.0') make pandas read floats; read text to keep large ids exact
+        values = pd.read_csv(path, usecols=[column], dtype=str, encoding='utf-8-sig')[column]
+    return encode_int(values)
+
+
+def key_array(values):
+    """Sorted distinct int64 keys, missing ones left out."""
+    keys = np.unique(np.asarray(values, dtype=np.int64))
+    return keys[keys != INT_NULL]
+
+
+def member(keys, values):
+    """Boolean mask of the int64 `values` that are in the sorted distinct `keys`."""
+    found = np.zeros(len(values), dtype=bool)
+    if len(keys) == 0 or len(values) == 0:
+        return found
+    low, high = int(keys[0]), int(keys[-1])
+    bitmap = None
+    if high - low < BITMAP_SPAN * len(keys):
+        bitmap = np.zeros(high - low + 1, dtype=bool)
+        bitmap[keys - low] = True
+    for start in range(0, len(values), BLOCK):
+        block = np.asarray(values[start:start + BLOCK])
+        # one lookup per run of equal values
+        heads = np.flatnonzero(np.concatenate(([True], block[1:] != block[:-1])))
+        run_values = block[heads]
+        if bitmap is not None:
+            inside = (run_values >= low) & (run_values <= high)
+            ok = np.zeros(len(run_values), dtype=bool)
+            ok[inside] = bitmap[run_values[inside] - low]
+        else:
+            # searching in sorted order walks the keys once instead of probing them at random
+            order = np.argsort(run_values)
+            pos = np.minimum(np.searchsorted(keys, run_values[order]), len(keys) - 1)
+            ok = np.empty(len(run_values), dtype=bool)
+            ok[order] = keys[pos] == run_values[order]
+        found[start:start + len(block)] = np.repeat(ok, np.diff(np.append(heads, len(block))))
+    return found
+
+
+def drop_checkpoint_rows(ckpt, keep, chunksize=CHUNKSIZE):
+    """Rewrite a checkpoint with only the rows where `keep` is set."""
+    tmp_ckpt = ckpt + '.tmp'
+    shutil.rmtree(tmp_ckpt, ignore_errors=True)
+    checkpoint.filter_checkpoint(ckpt, tmp_ckpt, keep, chunksize=chunksize)
+    shutil.rmtree(ckpt)
+    os.replace(tmp_ckpt, ckpt)
+
+
+def drop_rows(path, keep, chunksize=CHUNKSIZE):
+    """Rewrite an output CSV, and its checkpoint, with only the rows where `keep` is set."""
+    ckpt = _checkpoint_path(path)
+    if ckpt is not None:
+        drop_checkpoint_rows(ckpt, keep, chunksize)
+
+    with open(path, 'rb') as f:
+        encoding = 'utf-8-sig' if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 'utf-8'
+    tmp_path = path + '.tmp'
+    rows = 0
+    with open(tmp_path, 'w', newline='', encoding=encoding) as out:
+        # text in, text out: values are written back exactly as read
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize, encoding='utf-8-sig'):
+            chunk[keep[rows:rows + len(chunk)]].to_csv(out, header=rows == 0, index=False)
+            rows += len(chunk)
+    if rows != len(keep):
+        os.remove(tmp_path)
+        raise ValueError(f"{path} has {rows} rows, its keys {len(keep)}")
+    os.replace(tmp_path, path)
+
+
+def rebuild_calendar_outputs(data_path, chunksize=CHUNKSIZE):
+    """Bring the calendar outputs that are not loaded in line with the listings and calendar after a drop.
+
+    Returns the paths rewritten.
+    """
+    rewritten = []
+    monthly_ckpt = os.path.join(data_path, 'DB_calendar_monthly.ckpt')
+    listings_csv = os.path.join(data_path, 'DB_listings.csv')
+    if os.path.isdir(monthly_ckpt):
+        keep = member(key_array(read_keys(listings_csv, 'id', True)),
+                      checkpoint.column_array(monthly_ckpt, 'listing_id'))
+        if not keep.all():
+            metrics.rows('fk.calendar_monthly.listing_id', len(keep), int(keep.sum()), reason='listing dropped')
+            drop_checkpoint_rows(monthly_ckpt, keep, chunksize)
+            rewritten.append(monthly_ckpt)
+    index_dir = os.path.join(data_path, 'availability_index')
+    calendar_ckpt = os.path.join(data_path, 'DB_calendar4.ckpt')
+    if os.path.isdir(index_dir) and os.path.isdir(calendar_ckpt):
+        availability.build_availability_index(calendar_ckpt, listings_csv,
+                                              os.path.join(data_path, 'city_neighborhood.csv'), index_dir, chunksize)
+        rewritten.append(index_dir)
+    return rewritten
+
+
+def relationship(fk):
+    return f"{fk.table}.{fk.column} -> {fk.ref_table}.{fk.ref_column}"
+
+
+def check_integrity(data_path, drop=False, schema_path=load.SCHEMA_PATH, tables=load.TABLES, chunksize=CHUNKSIZE):
+    """Check every foreign key of the schema against the outputs in data_path.
+
+    Returns one dict per relationship: rows of the child output, orphans
+    (keys not in the parent), nulls, a few orphan keys as examples and, with
+    drop, the rows dropped for it. A relationship whose child or parent
+    output does not exist is reported as skipped.
+    """
+    columns, foreign = parse_schema(schema_path)
+    by_name = {t.name: t for t in tables}
+    parent_keys = {}
+    results, rewritten, dropped = [], [], set()
+    for table in tables:
+        fks = [fk for fk in foreign if fk.table == table.name]
+        if not fks:
+            continue
+        path = os.path.join(data_path, table.file)
+        csv_column = {col: csv_col for csv_col, col in table.columns.items()}
+        keep = None
+        for fk in fks:
+            result = {'relationship': relationship(fk), 'file': table.file, 'status': 'skipped'}
+            results.append(result)
+            parent = by_name.get(fk.ref_table)
+            if not os.path.exists(path):
+                result['reason'] = f"{table.file} not found"
+                continue
+            if parent is None or not os.path.exists(os.path.join(data_path, parent.file)):
+                result['reason'] = f"{parent.file if parent else fk.ref_table} not found"
+                continue
+
+            integer = columns[fk.ref_table][fk.ref_column] in INT_TYPES
+            with metrics.timed(f"fk.{fk.table}.{fk.column}"):
+                if (fk.ref_table, fk.ref_column) not in parent_keys:
+                    ref_path = os.path.join(data_path, parent.file)
+                    ref_csv_column = {col: csv_col for csv_col, col in parent.columns.items()}[fk.ref_column]
+                    values = read_keys(ref_path, ref_csv_column, integer)
+                    parent_keys[(fk.ref_table, fk.ref_column)] = (
+                        key_array(values) if integer else np.unique(values[values != '']))
+                keys = parent_keys[(fk.ref_table, fk.ref_column)]
+
+                values = read_keys(path, csv_column[fk.column], integer)
+                if integer:
+                    null = np.asarray(values) == INT_NULL
+                    found = member(keys, values)
+                else:
+                    null = values == ''
+                    found = pd.Series(values).isin(keys).to_numpy()
+                orphan = ~found & ~null
+                bad = orphan | null if fk.not_null else orphan
+
+            result.update(status='violations' if bad.any() else 'ok', rows=len(values), orphans=int(orphan.sum()),
+                          nulls=int(null.sum()),
+                          examples=[v.item() if integer else v for v in pd.unique(values[orphan])[:EXAMPLES]])
+            if drop:
+                kept_before = len(values) if keep is None else int(keep.sum())
+                keep = ~bad if keep is None else keep & ~bad
+                result['dropped'] = kept_before - int(keep.sum())
+                metrics.rows(f"fk.{fk.table}.{fk.column}", kept_before, int(keep.sum()),
+                             reason=f"{fk.column} not in {fk.ref_table}.{fk.ref_column}")
+
+        if drop and keep is not None and not keep.all():
+            drop_rows(path, keep, chunksize)
+            rewritten.append(path)
+            dropped.add(table.name)
+            # its keys changed: children read them again
+            parent_keys = {k: v for k, v in parent_keys.items() if k[0] != table.name}
+            if table.name == 'reviews':
+                index_dir = os.path.join(data_path, 'review_index')
+                if os.path.isdir(index_dir):
+                    # positions in the index are rows of the reviews checkpoint
+                    review_index.build_review_index(_checkpoint_path(path), index_dir)
+                    rewritten.append(index_dir)
+
+    if dropped & {'listings', 'calendar'}:
+        rewritten += rebuild_calendar_outputs(data_path, chunksize)
+
+    if rewritten and os.path.isdir(os.path.join(data_path, CACHE_DIR)):
+        StageCache(data_path).refresh_outputs(rewritten + [_checkpoint_path(p) for p in rewritten
+                                                           if _checkpoint_path(p)])
+    return results
+
+
+def print_results(results):
+    for result in results:
+        if result['status'] == 'skipped':
+            print(f"{result['relationship']}: skipped, {result['reason']}")
+            continue
+        line = (f"{result['relationship']}: {result['orphans']} orphan(s), {result['nulls']} null(s) "
+                f"in {result['rows']} rows")
+        if result['examples']:
+            line += f", e.g. {result['examples']}"
+        if 'dropped' in result:
+            line += f"; {result['dropped']} dropped"
+        print(line)
+
+
+def write_report(results, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'relationships': results}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-path', required=True, help='folder holding the DB_*.csv outputs')
+    parser.add_argument('--schema', default=load.SCHEMA_PATH, help='create_tables.sql')
+    parser.add_argument('--drop', action='store_true', help='remove the rows that violate a foreign key')
+    parser.add_argument('--report', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = check_integrity(args.data_path, drop=args.drop, schema_path=args.schema)
+    print_results(results)
+    if args.report:
+        write_report(results, args.report)
+    if not args.drop and any(r['status'] == 'violations' for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
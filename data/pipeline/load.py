@@ -0,0 +1,322 @@
+"""Bulk-load the DB_*.csv outputs into the create_tables.sql schema with COPY.
+
+Tables are loaded in foreign-key order:
+
+    Hosts -> is_super_host
+    cities -> city_neighborhood, city_search
+    Hosts, city_neighborhood -> listings -> Listings_detailed -> featured_listing
+    Amenities
+    listings, Amenities -> Listings_amenities
+    listings -> listing_amenity_mask; amenity_keyword
+    listings -> Calendar, Reviews
+    Reviews -> listing_review_sample
+    listings -> monthly_avg_cache, listing_overall_avg_price
+    listings -> listing_cheapest_dates, listing_monthly_trend, listing_holiday_price
+    listings -> listing_similar
+    city_monthly_avg, superhost_neighborhood_monthly
+
+A table starts as soon as the tables it references are loaded. Independent
+tables load at the same time, each on its own connection. Secondary indexes
+(idx_calendar_date, idx_reviews_listing_id, ...) can be dropped before the
+load and built once at the end. Building an index once is much cheaper than
+keeping it up to date through 58M inserts.
+
+A file whose header already matches the table's columns is streamed to COPY
+as is. Other files are streamed through pandas in chunks, so that their
+columns can be renamed, projected and cast.
+
+    python -m pipeline.load --data-path DIR --dsn postgresql://user@localhost/smartstay \\
+        [--create-schema] [--truncate [--cascade]] [--workers 4] [--tables calendar,reviews]
+
+Rows whose foreign keys would fail the load can be found (or dropped) beforehand
+with pipeline/integrity.py.
+
+psycopg2 is only needed for this module. tests/test_load.py loads the
+synthetic outputs into a scratch schema of the database at $PG_DSN.
+"""
+import argparse
+import io
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'create_tables.sql')
+
+CHUNKSIZE = 200_000
+
+# name: table name in create_tables.sql (Postgres folds it to lower case)
+# columns: {csv column: table column}, in table column order
+# int_columns: table columns pandas may have written as floats ('3.0')
+LoadTable = namedtuple('LoadTable', ['name', 'file', 'columns', 'depends_on', 'int_columns'])
+
+TABLES = [
+    LoadTable('hosts', 'DB_host.csv',
+              {'host_id': 'host_id', 'host_name': 'host_name', 'host_since': 'host_since',
+               'host_location': 'host_location', 'host_response_time': 'host_response_time',
+               'host_identity_verified': 'host_identity_verified', 'host_has_profile_pic': 'host_has_profile_pic',
+               'host_listings_count': 'host_listings_count', 'host_total_listings_count': 'host_total_listings_count'},
+              [], ['host_id', 'host_listings_count', 'host_total_listings_count']),
+    LoadTable('is_super_host', 'DB_is_super_host.csv',
+              {'host_id': 'host_id', 'host_is_superhost_boo': 'host_is_superhost_boo'},
+              ['hosts'], ['host_id']),
+    LoadTable('cities', 'cities.csv',
+              {'city_id': 'city_id', 'city': 'city', 'city_key': 'city_key'},
+              [], ['city_id']),
+    LoadTable('city_neighborhood', 'city_neighborhood.csv',
+              {'cleaned_neighborhood': 'cleaned_neighborhood', 'city': 'city', 'neighborhood_id': 'neighborhood_id',
+               'city_id': 'city_id'},
+              ['cities'], ['neighborhood_id', 'city_id']),
+    LoadTable('city_search', 'city_search.csv',
+              {'term': 'term', 'city_id': 'city_id'},
+              ['cities'], ['city_id']),
+    LoadTable('listings', 'DB_listings.csv',
+              {'id': 'id', 'name': 'name', 'host_id': 'host_id', 'room_type': 'room_type',
+               'neighbourhood': 'cleaned_neighborhood'},
+              ['hosts', 'city_neighborhood'], ['id', 'host_id']),
+    LoadTable('listings_detailed', 'DB_listings_detailed.csv',
+              {'id': 'id', 'description': 'description', 'listing_url': 'listing_url', 'picture_url': 'picture_url',
+               'bedrooms': 'bedrooms', 'beds': 'beds', 'number_of_reviews': 'number_of_reviews',
+               'accommodates': 'accommodates', 'instant_bookable': 'instant_bookable',
+               'review_scores_rating': 'review_scores_rating'},
+              ['listings'], ['id', 'number_of_reviews', 'accommodates']),
+    LoadTable('featured_listing', 'featured_listing.csv',
+              {'slot': 'slot', 'listing_id': 'listing_id'},
+              ['listings_detailed'], ['slot', 'listing_id']),
+    LoadTable('amenities', 'amenities.csv',
+              {'amenity_id': 'amenity_id', 'amenities': 'amenities'},
+              [], ['amenity_id']),
+    LoadTable('listings_amenities', 'DB_has_amenity2.csv',
+              {'id': 'id', 'amenity_id': 'amenity_id'},
+              ['listings', 'amenities'], ['id', 'amenity_id']),
+    LoadTable('listing_amenity_mask', 'listing_amenity_mask.csv',
+              {'listing_id': 'listing_id', 'amenity_mask': 'amenity_mask'},
+              ['listings'], ['listing_id']),
+    LoadTable('amenity_keyword', 'amenity_keyword.csv',
+              {'keyword': 'keyword', 'amenity_mask': 'amenity_mask'},
+              [], []),
+    LoadTable('calendar', 'DB_calendar4.csv',
+              {'listing_id': 'listing_id', 'date': 'date', 'price': 'price', 'adjusted_price': 'adjusted_price',
+               'minimum_nights': 'minimum_nights', 'maximum_nights': 'maximum_nights', 'available_boo': 'available_boo'},
+              ['listings'], ['listing_id', 'minimum_nights', 'maximum_nights']),
+    LoadTable('reviews', 'DB_reviews.csv',
+              {'review_id': 'review_id', 'listing_id': 'listing_id', 'reviewer_name': 'reviewer_name',
+               'date': 'date', 'comments': 'comments'},
+              ['listings'], ['review_id', 'listing_id']),
+    LoadTable('listing_review_sample', 'listing_review_sample.csv',
+              {'listing_id': 'listing_id', 'slot': 'slot', 'review_id': 'review_id', 'comments': 'comments'},
+              ['reviews'], ['listing_id', 'slot', 'review_id']),
+    LoadTable('monthly_avg_cache', 'monthly_avg_cache.csv',
+              {'listing_id': 'listing_id', 'month': 'month', 'avg_price': 'avg_price'},
+              ['listings'], ['listing_id']),
+    LoadTable('listing_overall_avg_price', 'listing_overall_avg_price.csv',
+              {'listing_id': 'listing_id', 'overall_avg_price': 'overall_avg_price'},
+              ['listings'], ['listing_id']),
+    LoadTable('city_monthly_avg', 'city_monthly_avg.csv',
+              {'city': 'city', 'month': 'month', 'avg_price': 'avg_price'},
+              [], []),
+    LoadTable('superhost_neighborhood_monthly', 'superhost_neighborhood_monthly.csv',
+              {'city': 'city', 'cleaned_neighborhood': 'cleaned_neighborhood', 'month': 'month',
+               'avg_price': 'avg_price'},
+              [], []),
+    LoadTable('listing_cheapest_dates', 'listing_cheapest_dates.csv',
+              {'listing_id': 'listing_id', 'rank': 'rank', 'date': 'date', 'price': 'price'},
+              ['listings'], ['listing_id', 'rank']),
+    LoadTable('listing_monthly_trend', 'listing_monthly_trend.csv',
+              {'listing_id': 'listing_id', 'month': 'month', 'avg_monthly_price': 'avg_monthly_price'},
+              ['listings'], ['listing_id']),
+    LoadTable('listing_holiday_price', 'listing_holiday_price.csv',
+              {'listing_id': 'listing_id', 'holiday': 'holiday', 'avg_price': 'avg_price'},
+              ['listings'], ['listing_id']),
+    LoadTable('listing_similar', 'listing_similar.csv',
+              {'listing_id': 'listing_id', 'rank': 'rank', 'similar_listing_id': 'similar_listing_id',
+               'score': 'score'},
+              ['listings'], ['listing_id', 'rank', 'similar_listing_id']),
+]
+
+_INDEX_RE = re.compile(r'create\s+(?:unique\s+)?index\s+(?:if\s+not\s+exists\s+)?(\w+)\s+on\s+(\w+)[^;]*;',
+                       re.IGNORECASE)
+
+
+def connect(dsn):
+    import psycopg2  # only the loader needs a database driver
+    return psycopg2.connect(dsn)
+
+
+def schema_statements(schema_path=SCHEMA_PATH):
+    """Split create_tables.sql into statements, dropping comments."""
+    with open(schema_path) as f:
+        sql = '\n'.join(line for line in f.read().splitlines() if not line.strip().startswith('--'))
+    return [stmt.strip() + ';' for stmt in sql.split(';') if stmt.strip()]
+
+
+def schema_indexes(schema_path=SCHEMA_PATH):
+    """{index name: (table, CREATE INDEX statement)} for every index in the schema."""
+    with open(schema_path) as f:
+        sql = f.read()
+    return {m.group(1).lower(): (m.group(2).lower(), m.group(0)) for m in _INDEX_RE.finditer(sql)}
+
+
+def create_schema(dsn, schema_path=SCHEMA_PATH):
+    """Run create_tables.sql statement by statement; objects that exist are left alone."""
+    import psycopg2
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            for stmt in schema_statements(schema_path):
+                cur.execute('SAVEPOINT stmt')
+                try:
+                    cur.execute(stmt)
+                except (psycopg2.errors.DuplicateTable, psycopg2.errors.DuplicateObject) as e:
+                    cur.execute('ROLLBACK TO SAVEPOINT stmt')
+                    print(f"Skipped, already exists: {str(e).strip().splitlines()[0]}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _copy_sql(table):
+    return f"COPY {table.name} ({', '.join(table.columns.values())}) FROM STDIN WITH (FORMAT csv{{header}})"
+
+
+def copy_table(conn, table, path, chunksize=CHUNKSIZE):
+    """COPY one output file into its table. Returns the number of rows loaded."""
+    header = pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns.tolist()
+    missing = [c for c in table.columns if c not in header]
+    if missing:
+        raise ValueError(f"{path} has no column(s) {missing} for table {table.name}")
+
+    rows = 0
+    with conn.cursor() as cur:
+        if header == list(table.columns):
+            # the file is already laid out like the table: stream it as is
+            with open(path, encoding='utf-8-sig') as f:
+                cur.copy_expert(_copy_sql(table).format(header=', HEADER true'), f)
+            rows = cur.rowcount
+        else:
+            for chunk in pd.read_csv(path, usecols=list(table.columns), chunksize=chunksize,
+                                     encoding='utf-8-sig', dtype=str, keep_default_na=False):
+                chunk = chunk[list(table.columns)].rename(columns=table.columns)
+                for col in table.int_columns:
+                    # ints written by pandas next to missing values come out as '3.0'
+                    chunk[col] = chunk[col].str.replace(r'\.0+$', '', regex=True)
+                buf = io.StringIO()
+                chunk.to_csv(buf, header=False, index=False)
+                buf.seek(0)
+                cur.copy_expert(_copy_sql(table).format(header=''), buf)
+                rows += len(chunk)
+    return rows
+
+
+def _load_one(dsn, table, path):
+    start = time.perf_counter()
+    conn = connect(dsn)
+    try:
+        rows = copy_table(conn, table, path)
+        conn.commit()
+    finally:
+        conn.close()
+    return rows, time.perf_counter() - start
+
+
+def load_tables(dsn, data_path, tables=TABLES, only=None, workers=4, defer_indexes=True,
+                truncate=False, cascade=False, schema_path=SCHEMA_PATH):
+    """Load every table whose output file exists, in foreign-key order.
+
+    only: optional table names to load (their dependencies must already be
+    loaded). With truncate the tables are emptied first, by one TRUNCATE of
+    all of them. Postgres refuses it when a table outside the selection
+    references one of them, unless cascade is set, which empties those
+    tables too. Returns {table: rows}.
+    """
+    selected = [t for t in tables if only is None or t.name in only]
+    todo = {}
+    for table in selected:
+        path = os.path.join(data_path, table.file)
+        if os.path.exists(path):
+            todo[table.name] = (table, path)
+        else:
+            print(f"Skipping {table.name}: {path} not found")
+
+    deferred = {}
+    if defer_indexes:
+        deferred = {name: stmt for name, (tbl, stmt) in schema_indexes(schema_path).items() if tbl in todo}
+
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            if truncate and todo:
+                # one statement for all tables: no per-row delete, WAL or foreign-key checks
+                cur.execute(f"TRUNCATE {', '.join(todo)}{' CASCADE' if cascade else ''}")
+            for name in deferred:
+                cur.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+    finally:
+        conn.close()
+
+    names = {t.name for t in tables}
+    done = {t.name for t in tables if t.name not in todo}  # already loaded or skipped
+    loaded = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            while todo or running:
+                for name, (table, path) in list(todo.items()):
+                    if all(dep in done or dep not in names for dep in table.depends_on):
+                        running[pool.submit(_load_one, dsn, table, path)] = name
+                        del todo[name]
+                if not running:
+                    raise RuntimeError(f"Cannot order the load of {sorted(todo)}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    rows, seconds = future.result()
+                    loaded[name] = rows
+                    done.add(name)
+                    print(f"Loaded {rows} rows into {name} in {seconds:.1f}s")
+    finally:
+        # the dropped indexes come back even when a table fails to load
+        if deferred:
+            conn = connect(dsn)
+            try:
+                with conn.cursor() as cur:
+                    for name, stmt in deferred.items():
+                        start = time.perf_counter()
+                        cur.execute(stmt)
+                        print(f"Created index {name} in {time.perf_counter() - start:.1f}s")
+                conn.commit()
+            finally:
+                conn.close()
+    return loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-path', required=True, help='folder holding the DB_*.csv outputs')
+    parser.add_argument('--dsn', default=os.environ.get('PG_DSN'), help='libpq connection string (default: $PG_DSN)')
+    parser.add_argument('--schema', default=SCHEMA_PATH, help='create_tables.sql')
+    parser.add_argument('--create-schema', action='store_true', help='run the schema before loading')
+    parser.add_argument('--truncate', action='store_true', help='empty the tables before loading')
+    parser.add_argument('--cascade', action='store_true',
+                        help='with --truncate, also empty the tables referencing the loaded ones')
+    parser.add_argument('--tables', help='comma-separated subset of tables to load')
+    parser.add_argument('--workers', type=int, default=4, help='tables loaded at the same time')
+    parser.add_argument('--no-defer-indexes', action='store_true', help='keep secondary indexes during the load')
+    args = parser.parse_args(argv)
+    if not args.dsn:
+        parser.error('--dsn or $PG_DSN is required')
+
+    if args.create_schema:
+        create_schema(args.dsn, args.schema)
+    only = set(args.tables.split(',')) if args.tables else None
+    load_tables(args.dsn, args.data_path, only=only, workers=args.workers,
+                defer_indexes=not args.no_defer_indexes, truncate=args.truncate, cascade=args.cascade,
+                schema_path=args.schema)
+
+
+if __name__ == '__main__':
+    main()
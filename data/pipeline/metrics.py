@@ -0,0 +1,170 @@
+"""Structured metrics for pipeline runs: time, memory and row accounting.
+
+run_stages measures every stage it runs:
+
+    wall_s       elapsed time
+    cpu_s        user + system time, worker processes included
+    peak_rss_mb  peak resident memory of the process during the stage
+
+and, inside a stage, the cleaning code accounts for each filter by name:
+
+    metrics.rows('price_cap', rows_in, rows_out, reason='adjusted_price > 6000')
+    with metrics.timed('price_cap'):
+        ...
+
+Calls with the same name add up, so a filter applied chunk by chunk is
+reported once with its totals; a name that is only timed has no row counts.
+Outside a measured stage (e.g. in pipeline.incremental) both are no-ops.
+
+The records of a run are written to a JSON log (by default
+<data>/metrics/run-<time>.json), rewritten after every stage so a failed
+run still leaves one. A stage can also be run under cProfile; its stats go
+to <data>/metrics/<stage>.prof and the top entries are printed.
+
+Peak memory is per stage on Linux, where the kernel's high-water mark can be
+reset (/proc/self/clear_refs); elsewhere it is the peak of the process so far.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import time
+from contextlib import contextmanager
+
+
+# stage being measured
+_active = None
+
+
+class StageMetrics:
+    """Counters of one stage run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.filters = {}
+
+    def _filter(self, name):
+        if name not in self.filters:
+            self.filters[name] = {'name': name, 'wall_s': 0.0}
+        return self.filters[name]
+
+    def rows(self, name, rows_in, rows_out, reason=None):
+        entry = self._filter(name)
+        if 'rows_in' not in entry:
+            entry.update(reason=None, rows_in=0, rows_out=0, dropped=0)
+        entry['rows_in'] += int(rows_in)
+        entry['rows_out'] += int(rows_out)
+        entry['dropped'] += int(rows_in) - int(rows_out)
+        if reason is not None:
+            entry['reason'] = reason
+
+    def add_time(self, name, seconds):
+        self._filter(name)['wall_s'] += seconds
+
+
+def rows(name, rows_in, rows_out, reason=None):
+    """Record that filter `name` kept rows_out of rows_in rows, in the stage being measured."""
+    if _active is not None:
+        _active.rows(name, rows_in, rows_out, reason)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to filter `name` of the stage being measured."""
+    if _active is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.add_time(name, time.perf_counter() - t0)
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(reset):
+    if reset:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cpu_s():
+    return sum(u.ru_utime + u.ru_stime
+               for u in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+@contextmanager
+def measure(name, profile_path=None):
+    """Measure a stage run; yields a dict that holds the record once the block exits.
+
+    With profile_path the block runs under cProfile and the stats are dumped there.
+    """
+    global _active
+    previous = _active
+    stage = _active = StageMetrics(name)
+    record = {'stage': name, 'status': 'ran'}
+    reset = _reset_peak_rss()
+    cpu0 = _cpu_s()
+    t0 = time.perf_counter()
+    profiler = cProfile.Profile() if profile_path else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'failed'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            record['profile'] = profile_path
+        _active = previous
+        record.update({'wall_s': round(time.perf_counter() - t0, 3), 'cpu_s': round(_cpu_s() - cpu0, 3),
+                       'peak_rss_mb': round(_peak_rss_mb(reset), 1)})
+        record['filters'] = [dict(f, wall_s=round(f['wall_s'], 3)) for f in stage.filters.values()]
+
+
+def profile_summary(profile_path, top=20):
+    """The top entries of a dumped profile by cumulative time, as text."""
+    out = io.StringIO()
+    pstats.Stats(profile_path, stream=out).sort_stats('cumulative').print_stats(top)
+    return out.getvalue()
+
+
+class RunLog:
+    """The JSON log of one run_stages call."""
+
+    def __init__(self, path, paths, params):
+        self.path = path
+        self.run = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'finished': None,
+                    'paths': dict(paths), 'params': params, 'stages': []}
+
+    def add(self, record):
+        self.run['stages'].append(record)
+        self.write()
+
+    def finish(self):
+        self.run['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.write()
+
+    def write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.run, f, indent=2, default=repr)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,142 @@
+"""Normalized city and neighborhood names, integer ids and the city search table.
+
+listings_detailed's free-text `neighbourhood` ('Downtown, Austin, United
+States', ' east  side ') becomes a cleaned_neighborhood: the first part of
+the text with unicode normalized, whitespace collapsed and all-lower or
+all-upper names title-cased ('East Side'). A name used in more than one
+city is qualified with its city ('Downtown (Austin)'), so that it can stay
+the primary key of city_neighborhood. Cities (the per-city folder names
+the combine stage writes to `city`) are normalized the same way.
+
+The normalization is done once per distinct value, not per row: a
+nationwide file has ~300K listings but a few thousand distinct
+neighbourhood strings.
+
+The tables this module builds:
+
+    cities             city_id, city, city_key (lower-cased city)
+    city_neighborhood  cleaned_neighborhood, city, neighborhood_id, city_id
+    city_search        term, city_id: every substring of a city's name and
+                       aliases, lower-cased
+
+Ids are dense and assigned in name order. city_search answers the routes'
+old `city ILIKE '%term%'` with an index lookup:
+`city_id IN (SELECT city_id FROM city_search WHERE term = LOWER(TRIM($1)))`.
+"""
+import re
+import unicodedata
+
+import pandas as pd
+
+
+# other names users search a city by
+ALIASES = {
+    'New York City': ['NYC', 'New York'],
+    'Los Angeles': ['LA'],
+    'San Francisco': ['SF'],
+    'Washington D.C.': ['DC'],
+    'Twin Cities MSA': ['Minneapolis', 'Saint Paul', 'St. Paul'],
+    'Clark County': ['Las Vegas'],
+    'Broward County': ['Fort Lauderdale'],
+    'Santa Clara County': ['San Jose'],
+    'Hawaii': ['Honolulu'],
+}
+
+
+def normalize_name(value):
+    """'  east  SIDE ' -> 'East Side'; None for a missing or blank value."""
+    if not isinstance(value, str):
+        return None
+    name = ' '.join(unicodedata.normalize('NFKC', value).split())
+    if not name:
+        return None
+    if name.islower() or name.isupper():
+        name = name.title()
+    return name
+
+
+def neighborhood_name(value):
+    """The neighborhood part of listings_detailed's neighbourhood text, normalized."""
+    if not isinstance(value, str):
+        return None
+    for part in value.split(','):
+        name = normalize_name(part)
+        if name is not None:
+            return name
+    return None
+
+
+def memoized(values, func):
+    """func applied to every distinct value of `values` once, as a Series aligned with `values`."""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values, sort=False)
+    mapped = pd.Series([func(v) for v in uniques] + [None], dtype=object)
+    # code -1 (missing) picks the trailing None
+    return pd.Series(mapped.to_numpy()[codes], index=values.index, dtype=object)
+
+
+def colliding_names(names, cities):
+    """Lower-cased neighborhood names that occur in more than one city."""
+    pairs = pd.DataFrame({'key': pd.Series(names, dtype=object).str.lower(),
+                          'city': pd.Series(cities, dtype=object)}).dropna().drop_duplicates()
+    counts = pairs['key'].value_counts()
+    return set(counts.index[counts > 1])
+
+
+def clean_neighborhoods(neighbourhood, city, colliding=None):
+    """(cleaned_neighborhood, city) Series for the raw neighbourhood and city columns.
+
+    city may be a single name (one city's file). colliding is the set of
+    colliding_names over every city; by default it is computed from the input.
+    """
+    names = memoized(neighbourhood, neighborhood_name)
+    if isinstance(city, str) or city is None:
+        cities = pd.Series(normalize_name(city), index=names.index, dtype=object)
+    else:
+        cities = memoized(city, normalize_name).set_axis(names.index)
+    if colliding is None:
+        colliding = colliding_names(names, cities)
+    qualify = (names.str.lower().isin(colliding) & cities.notna()).to_numpy()
+    cleaned = names.copy()
+    cleaned[qualify] = names[qualify] + ' (' + cities[qualify] + ')'
+    return cleaned, cities
+
+
+def search_terms(city):
+    """Every lower-cased substring of the city's name and aliases, for city_search."""
+    names = {city} | set(ALIASES.get(city, []))
+    # 'Washington D.C.' is also found as 'washington dc'
+    names |= {re.sub(r"[.'\-]", lambda m: ' ' if m.group(0) == '-' else '', name) for name in names}
+    names |= {unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii') for name in names}
+    terms = set()
+    for name in names:
+        name = ' '.join(name.lower().split())
+        for start in range(len(name)):
+            for stop in range(start + 1, len(name) + 1):
+                term = name[start:stop].strip()
+                if term:
+                    terms.add(term)
+    return sorted(terms)
+
+
+def build_tables(cleaned, cities):
+    """{'cities', 'city_neighborhood', 'city_search': DataFrame} from clean_neighborhoods' output."""
+    pairs = (pd.DataFrame({'cleaned_neighborhood': cleaned, 'city': cities})
+             .dropna(subset=['cleaned_neighborhood']).drop_duplicates(subset='cleaned_neighborhood'))
+
+    city_names = sorted(pairs['city'].dropna().unique())
+    city_table = pd.DataFrame({'city_id': range(1, len(city_names) + 1), 'city': city_names,
+                               'city_key': [c.lower() for c in city_names]})
+    city_ids = dict(zip(city_table['city'], city_table['city_id']))
+
+    pairs = pairs.sort_values(['city', 'cleaned_neighborhood'], na_position='last').reset_index(drop=True)
+    neighborhood_table = pd.DataFrame({
+        'cleaned_neighborhood': pairs['cleaned_neighborhood'],
+        'city': pairs['city'],
+        'neighborhood_id': range(1, len(pairs) + 1),
+        'city_id': pairs['city'].map(city_ids).astype('Int64'),
+    })
+
+    search = [(term, city_id) for city, city_id in city_ids.items() for term in search_terms(city)]
+    search_table = pd.DataFrame(search, columns=['term', 'city_id']).drop_duplicates()
+    return {'cities': city_table, 'city_neighborhood': neighborhood_table, 'city_search': search_table}
@@ -0,0 +1,252 @@
+"""One-pass, bounded-memory profiling of the combined CSV files.
+
+The old EDA loop read each combined file whole and ran describe(), nunique(),
+isnull() and corr() over it, which does not fit calendar_combined.csv in
+memory. profile_csv reads a file once, in chunks, and keeps per column
+
+    missing count        exact
+    dtype                numeric / categorical / bool, as pandas would infer
+                         for the whole file
+    count, mean, std,    exact (sums are kept around a per-column shift, so
+    min, max             large ids do not lose precision)
+    25% / 50% / 75%      approximate, from a uniform sample of SAMPLE_SIZE
+    histogram            bins and counts from the same sample, scaled to count
+    distinct count       exact up to EXACT_DISTINCT values (with value counts),
+                         HyperLogLog estimate above that
+    correlation          exact pairwise-complete Pearson correlation between
+                         numeric columns, from running co-moment sums
+
+Memory is one chunk plus a fixed amount per column.
+"""
+import numpy as np
+import pandas as pd
+
+
+CHUNKSIZE = 500_000
+
+# values per numeric column kept for quantiles and histograms
+SAMPLE_SIZE = 100_000
+
+# distinct values counted exactly before a column falls back to HyperLogLog
+EXACT_DISTINCT = 1_000
+
+# HyperLogLog precision: 2**14 registers, about 0.8% standard error
+HLL_P = 14
+
+MAX_BINS = 50
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-count sketch over 64-bit hashes."""
+
+    def __init__(self, p=HLL_P):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # bit length of `rest`, from its two exactly representable 32-bit halves
+        hi = (rest >> np.uint64(32)).astype(np.float64)
+        lo = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        bit_length = np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+        rank = np.minimum(65 - bit_length, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate while many registers are empty
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class ColumnProfile:
+    """Running statistics for one column."""
+
+    def __init__(self, sample_size, rng):
+        self.missing = 0
+        self.kinds = set()
+        self.hll = HyperLogLog()
+        self.value_counts = {}  # None once the column has too many distinct values
+        self.count = 0
+        self.shift = None
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sample = np.zeros(0)
+        self.sample_keys = np.zeros(0)
+        self.sample_size = sample_size
+        self.rng = rng
+
+    def add(self, s):
+        missing = s.isna()
+        self.missing += int(missing.sum())
+        values = s[~missing]
+        if len(values) == 0:
+            return  # an all-missing chunk reads as float and says nothing about the dtype
+        if pd.api.types.is_bool_dtype(s.dtype):
+            self.kinds.add('bool')
+        elif pd.api.types.is_numeric_dtype(s.dtype):
+            self.kinds.add('numeric')
+            self._add_numeric(values.to_numpy(np.float64))
+        else:
+            self.kinds.add('categorical')
+
+        self.hll.add_hashes(pd.util.hash_array(values.to_numpy()))
+        if self.value_counts is not None:
+            for value, n in values.value_counts(sort=False).items():
+                self.value_counts[value] = self.value_counts.get(value, 0) + n
+            if len(self.value_counts) > EXACT_DISTINCT:
+                self.value_counts = None
+
+    def _add_numeric(self, x):
+        if self.shift is None:
+            self.shift = float(x[0])
+        shifted = x - self.shift
+        self.count += len(x)
+        self.sum += float(shifted.sum())
+        self.sumsq += float((shifted * shifted).sum())
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+
+        # bottom-k by random key is a uniform sample of everything seen so far
+        keys = np.concatenate([self.sample_keys, self.rng.random(len(x))])
+        sample = np.concatenate([self.sample, x])
+        if len(keys) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, sample = keys[keep], sample[keep]
+        self.sample_keys, self.sample = keys, sample
+
+    @property
+    def kind(self):
+        # one categorical chunk makes the whole column object, like a full read
+        if 'categorical' in self.kinds or len(self.kinds) > 1:
+            return 'categorical'
+        if self.kinds == {'bool'}:
+            return 'bool'
+        return 'numeric'
+
+    def distinct(self):
+        if self.value_counts is not None:
+            return len(self.value_counts)
+        return self.hll.estimate()
+
+    def describe(self):
+        if self.count == 0:
+            return pd.Series({'count': 0.0, 'mean': np.nan, 'std': np.nan, 'min': np.nan,
+                              **{f"{q:.0%}": np.nan for q in QUANTILES}, 'max': np.nan})
+        mean = self.sum / self.count
+        var = (self.sumsq - self.sum * mean) / (self.count - 1) if self.count > 1 else np.nan
+        quantiles = np.quantile(self.sample, QUANTILES)
+        return pd.Series({'count': float(self.count), 'mean': mean + self.shift,
+                          'std': np.sqrt(max(var, 0.0)) if self.count > 1 else np.nan, 'min': self.min,
+                          **{f"{q:.0%}": v for q, v in zip(QUANTILES, quantiles)}, 'max': self.max})
+
+    def histogram(self):
+        """(counts, edges); counts are scaled from the sample to the column's count."""
+        if len(self.sample) == 0:
+            return np.zeros(0), np.zeros(1)
+        edges = np.histogram_bin_edges(self.sample, bins='auto')
+        if len(edges) > MAX_BINS + 1:
+            edges = np.histogram_bin_edges(self.sample, bins=MAX_BINS)
+        counts, edges = np.histogram(self.sample, bins=edges)
+        return counts * (self.count / len(self.sample)), edges
+
+
+class Comoments:
+    """Pairwise-complete sums for a streaming Pearson correlation matrix."""
+
+    def __init__(self, columns):
+        p = len(columns)
+        self.columns = list(columns)
+        self.shift = np.full(p, np.nan)
+        self.n = np.zeros((p, p))
+        self.sx = np.zeros((p, p))   # sx[i, j]: sum of x_i where x_i and x_j are both present
+        self.sxx = np.zeros((p, p))
+        self.sxy = np.zeros((p, p))
+
+    def add(self, chunk, numeric_columns):
+        idx = [self.columns.index(c) for c in numeric_columns]
+        if not idx:
+            return
+        x = chunk[numeric_columns].to_numpy(np.float64, na_value=np.nan)
+        present = ~np.isnan(x)
+        new = np.isnan(self.shift[idx]) & present.any(axis=0)
+        first = np.argmax(present, axis=0)
+        self.shift[np.array(idx)[new]] = x[first[new], np.nonzero(new)[0]]
+        x = np.where(present, x - np.nan_to_num(self.shift[idx]), 0.0)
+        m = present.astype(np.float64)
+        grid = np.ix_(idx, idx)
+        self.n[grid] += m.T @ m
+        self.sx[grid] += x.T @ m
+        self.sxx[grid] += (x * x).T @ m
+        self.sxy[grid] += x.T @ x
+
+    def corr(self, columns):
+        idx = [self.columns.index(c) for c in columns]
+        grid = np.ix_(idx, idx)
+        n, sx, sxx, sxy = self.n[grid], self.sx[grid], self.sxx[grid], self.sxy[grid]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * sxy - sx * sx.T
+            var = (n * sxx - sx * sx) * (n * sxx - sx * sx).T
+            corr = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+        corr[var <= 0] = np.nan
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+def profile_csv(path, chunksize=CHUNKSIZE, sample_size=SAMPLE_SIZE, seed=0):
+    """Profile a CSV file in one chunked pass.
+
+    Returns a dict with the file's rows, columns, head, and per column its
+    kind, missing count, distinct count, value counts (when exact), plus
+    describe() and histograms for numeric columns and their correlation.
+    """
+    rng = np.random.default_rng(seed)
+    columns = None
+    stats = None
+    comoments = None
+    head = None
+    rows = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+        if columns is None:
+            columns = list(chunk.columns)
+            stats = {c: ColumnProfile(sample_size, rng) for c in columns}
+            comoments = Comoments(columns)
+            head = chunk.head()
+        rows += len(chunk)
+        for c in columns:
+            stats[c].add(chunk[c])
+        numeric = [c for c in columns if pd.api.types.is_numeric_dtype(chunk[c].dtype)
+                   and not pd.api.types.is_bool_dtype(chunk[c].dtype)]
+        comoments.add(chunk, numeric)
+
+    if columns is None:
+        raise pd.errors.EmptyDataError(f"No columns to parse from {path}")
+    kinds = {c: stats[c].kind for c in columns}
+    num_cols = [c for c in columns if kinds[c] == 'numeric']
+    cat_cols = [c for c in columns if kinds[c] == 'categorical']
+    return {
+        'rows': rows,
+        'columns': columns,
+        'head': head,
+        'kinds': kinds,
+        'num_cols': num_cols,
+        'cat_cols': cat_cols,
+        'missing': pd.Series({c: stats[c].missing for c in columns}, dtype=np.int64),
+        'distinct': pd.Series({c: stats[c].distinct() for c in columns}, dtype=np.int64),
+        'value_counts': {c: pd.Series(stats[c].value_counts).sort_values(ascending=False)
+                         for c in columns if stats[c].value_counts is not None},
+        'describe': pd.DataFrame({c: stats[c].describe() for c in num_cols}),
+        'histograms': {c: stats[c].histogram() for c in num_cols},
+        'corr': comoments.corr(num_cols),
+    }
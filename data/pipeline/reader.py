@@ -0,0 +1,170 @@
+"""Schema-typed, column-projected reads of the combined files.
+
+listings_detailed_combined.csv has ~75 columns, and the listings, amenities,
+hosts and price_views stages each used to parse all of it with
+pd.read_csv's type inference, only to keep a handful of columns. Here every
+combined file has one declared schema, {column: kind}:
+
+    int       nullable Int64
+    float     float64
+    str       text, as read
+    category  categorical (low-cardinality text such as room_type)
+    bool      nullable boolean, decoded from Inside Airbnb's 't' / 'f'
+
+A malformed value in an int, float or bool column ('2.5' or 'abc' in an
+int column) fails the typed parse. The columns are then read again as
+text and coerced, with values that do not parse set to null and counted in
+a warning. The stages drop rows whose id is null, as the notebook did.
+
+A schema lists only the columns the pipeline reads. The first read_table of
+a file in a run parses all of them, with those dtypes, in one pass, and
+keeps the frame: the other stages reading the file get their columns
+without touching it again. run_stages calls clear_cache when the run is
+over. The cache is keyed by the file's size and mtime, so a rewritten file
+is parsed again.
+
+Sharing only pays when the stages run in one process. The scheduler
+(pipeline/scheduler.py) runs every stage in a fresh process, so it turns
+sharing off with set_sharing(False) and each stage parses just its own
+columns.
+
+calendar and reviews_detailed are too large to hold and are streamed in
+chunks by calendar_clean and reviews_clean; their schemas are declared here
+for completeness and for per-city files.
+"""
+import os
+
+import pandas as pd
+
+
+SCHEMAS = {
+    'listings_detailed': {
+        'id': 'int', 'listing_url': 'str', 'name': 'str', 'description': 'str', 'picture_url': 'str',
+        'host_id': 'int', 'host_url': 'str', 'host_name': 'str', 'host_since': 'str', 'host_location': 'str',
+        'host_response_time': 'category', 'host_is_superhost': 'bool', 'host_listings_count': 'int',
+        'host_total_listings_count': 'int', 'host_has_profile_pic': 'bool', 'host_identity_verified': 'bool',
+        'neighbourhood': 'str', 'room_type': 'category',
+        'accommodates': 'int', 'bedrooms': 'float', 'beds': 'float', 'amenities': 'str',
+        'number_of_reviews': 'int', 'review_scores_rating': 'float', 'instant_bookable': 'bool',
+        'city': 'category',
+    },
+    'listings': {
+        'id': 'int', 'name': 'str', 'host_id': 'int', 'host_name': 'str', 'neighbourhood_group': 'category',
+        'neighbourhood': 'str', 'room_type': 'category', 'price': 'str',
+    },
+    'neighbourhoods': {'neighbourhood_group': 'category', 'neighbourhood': 'str'},
+    'calendar': {
+        'listing_id': 'int', 'date': 'str', 'available': 'bool', 'price': 'str', 'adjusted_price': 'str',
+        'minimum_nights': 'int', 'maximum_nights': 'int',
+    },
+    'reviews': {'listing_id': 'int', 'date': 'str'},
+    'reviews_detailed': {
+        'listing_id': 'int', 'id': 'int', 'date': 'str', 'reviewer_id': 'int', 'reviewer_name': 'str',
+        'comments': 'str',
+    },
+}
+
+DTYPES = {'int': 'Int64', 'float': 'float64', 'str': 'str', 'category': 'category', 'bool': 'boolean'}
+
+# kinds whose strict parse can fail on a malformed value; parse_columns then coerces them
+COERCED = ('int', 'float', 'bool')
+
+# parsed columns per file: abspath -> ((size, mtime_ns), DataFrame)
+_cache = {}
+
+# default of read_table's share
+_share = True
+
+
+def table_name(path):
+    """'listings_detailed' for listings_detailed_combined.csv or a city's listings_detailed.csv."""
+    name = os.path.basename(path)
+    for suffix in ('_combined.csv', '.csv'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def table_schema(path):
+    try:
+        return SCHEMAS[table_name(path)]
+    except KeyError:
+        raise KeyError(f"No schema declared for {os.path.basename(path)}") from None
+
+
+def parse_columns(path, columns, schema=None):
+    """Parse just `columns` of a CSV with the dtypes of its schema."""
+    schema = schema or table_schema(path)
+    undeclared = [c for c in columns if c not in schema]
+    if undeclared:
+        raise KeyError(f"Columns {undeclared} of {os.path.basename(path)} are not in its schema")
+    try:
+        return pd.read_csv(path, usecols=columns, dtype={c: DTYPES[schema[c]] for c in columns},
+                           true_values=['t'], false_values=['f'])[columns]
+    except (TypeError, ValueError):
+        pass
+    # a value that does not parse ('2.5' or 'abc' in an int column): read as text and coerce it to null
+    frame = pd.read_csv(path, usecols=columns, dtype={c: 'str' if schema[c] in COERCED else DTYPES[schema[c]]
+                                                      for c in columns})[columns]
+    for c in columns:
+        if schema[c] in COERCED:
+            coerced = coerce_column(frame[c], schema[c])
+            invalid = int((coerced.isna() & frame[c].notna()).sum())
+            if invalid:
+                print(f"Warning: {invalid} invalid {schema[c]} values in {os.path.basename(path)}:{c} set to null")
+            frame[c] = coerced
+    return frame
+
+
+def coerce_column(text, kind):
+    """A column read as text in the dtype of `kind`, with values that do not parse as null."""
+    text = text.str.strip()
+    if kind == 'int':
+        # validated as text: to_numeric would go through float64 and round 18-digit ids
+        whole = text.str.fullmatch(r'[+-]?\d+(\.0*)?').fillna(False).astype(bool)
+        return text.where(whole).str.replace(r'\.0*$', '', regex=True).astype('Int64')
+    if kind == 'float':
+        return pd.to_numeric(text, errors='coerce').astype('float64')
+    return text.map({'t': True, 'f': False}).astype('boolean')
+
+
+def set_sharing(enabled):
+    """Set whether read_table keeps parsed frames for later calls by default."""
+    global _share
+    _share = enabled
+
+
+def read_table(path, columns=None, share=None):
+    """Typed frame with `columns` of path (default: every declared column in the file).
+
+    With share, every declared column is parsed on the first call and kept
+    for the later calls of the run; without, only `columns` are parsed.
+    share defaults to set_sharing's setting, on unless changed.
+    """
+    share = _share if share is None else share
+    schema = table_schema(path)
+    declared = [c for c in pd.read_csv(path, nrows=0).columns if c in schema]
+    columns = declared if columns is None else list(columns)
+
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _cache.get(key)
+    frame = cached[1] if cached is not None and cached[0] == signature else None
+
+    wanted = dict.fromkeys(declared + columns if share else columns)
+    todo = [c for c in wanted if frame is None or c not in frame.columns]
+    if todo:
+        parsed = parse_columns(path, todo, schema)
+        if frame is None:
+            frame = parsed
+        else:
+            # same file, same rows: the new columns line up with the cached ones
+            frame = pd.concat([frame, parsed], axis=1)
+        if share:
+            _cache[key] = (signature, frame)
+    return frame[columns]
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,226 @@
+"""Per-listing trigram index over review comments.
+
+The listingReviewKeyword route filters a listing's reviews with
+`comments ILIKE '%kw%'`, a text scan of every review on each request. This
+index answers the same question from precomputed posting lists. It is
+offline only: the Node server cannot read it, so the route still runs the
+ILIKE query, and ReviewIndex serves Python callers (analysis, tests).
+
+Reviews are numbered by position after a stable sort on listing_id, so the
+reviews of one listing are a contiguous range of positions. Comments are
+lower-cased and every character is folded into one of 64 classes (letters,
+digits, space, other ASCII, and 26 buckets for everything else), so a
+trigram is an 18-bit code. For each trigram the index stores the sorted
+positions of the reviews containing it. A lookup for one listing is then a
+binary search for the listing's range in each posting list of the
+keyword's trigrams and an intersection of those slices; the few candidates
+left are checked against the LIKE pattern itself, so the result is exactly
+the review ids the ILIKE query returns.
+
+Files in the index directory, all memory-mapped:
+
+    listing_ids.i8      sorted distinct listing ids
+    listing_offsets.i8  first review position of each listing (+ total)
+    review_ids.i8       review_id of each position
+    review_rows.i8      row of each position in DB_reviews.ckpt
+    trigram_offsets.i8  start of each trigram's postings (+ total)
+    postings.u4         review positions, grouped by trigram, ascending
+    meta.json           row counts and the reviews checkpoint it indexes
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from pipeline.checkpoint import column_array, checkpoint_rows, take_strings
+
+
+TRIGRAMS = 64 ** 3
+
+# reviews tokenized per batch while building
+BATCH = 50_000
+
+
+def _class_table():
+    table = np.full(128, 37, dtype=np.int64)  # other ASCII
+    table[ord('a'):ord('z') + 1] = np.arange(26)
+    table[ord('0'):ord('9') + 1] = np.arange(26, 36)
+    table[ord(' ')] = 36
+    return table
+
+
+_ASCII_CLASS = _class_table()
+
+
+def char_classes(codepoints):
+    """Fold lower-cased code points into the 64 trigram classes."""
+    codepoints = np.asarray(codepoints, dtype=np.int64)
+    ascii_class = _ASCII_CLASS[np.minimum(codepoints, 127)]
+    return np.where(codepoints < 128, ascii_class, 38 + codepoints % 26)
+
+
+def _codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def trigram_codes(text):
+    """Distinct trigram codes of one (lower-cased) string."""
+    classes = char_classes(_codepoints(text))
+    if len(classes) < 3:
+        return np.zeros(0, np.int64)
+    return np.unique(classes[:-2] * 4096 + classes[1:-1] * 64 + classes[2:])
+
+
+def _batch_postings(comments, first_position):
+    """Sorted unique (trigram << 32 | position) keys for a batch of comments."""
+    texts = [c.lower() if c is not None else '' for c in comments]
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    # NUL separates the comments, so no trigram spans two reviews
+    codepoints = _codepoints('\x00'.join(texts)).astype(np.int64)
+    if len(codepoints) < 3:
+        return np.zeros(0, np.int64)
+    classes = char_classes(codepoints)
+    separator = codepoints == 0
+    position = np.repeat(np.arange(first_position, first_position + len(texts)), lengths + 1)[:len(codepoints)]
+    code = classes[:-2] * 4096 + classes[1:-1] * 64 + classes[2:]
+    ok = ~(separator[:-2] | separator[1:-1] | separator[2:])
+    return np.unique((code[ok] << 32) | position[:-2][ok])
+
+
+def build_review_index(reviews_ckpt, index_dir, batch=BATCH):
+    """Build the trigram index for DB_reviews.ckpt in index_dir. Returns meta."""
+    listing_id = np.asarray(column_array(reviews_ckpt, 'listing_id'))
+    order = np.argsort(listing_id, kind='stable')
+    sorted_listing = listing_id[order]
+    listing_ids, starts = np.unique(sorted_listing, return_index=True)
+    total = len(order)
+
+    tmp_dir = tempfile.mkdtemp(prefix='.review_index_', dir=os.path.dirname(os.path.abspath(index_dir)))
+    try:
+        np.append(starts, total).astype(np.int64).tofile(os.path.join(tmp_dir, 'listing_offsets.i8'))
+        listing_ids.astype(np.int64).tofile(os.path.join(tmp_dir, 'listing_ids.i8'))
+        np.asarray(column_array(reviews_ckpt, 'review_id'))[order].tofile(os.path.join(tmp_dir, 'review_ids.i8'))
+        order.astype(np.int64).tofile(os.path.join(tmp_dir, 'review_rows.i8'))
+
+        # one run of postings per batch; positions only grow from batch to batch. Each run keeps its
+        # (trigram, count) pairs on disk next to it, so only the running totals stay in memory.
+        counts = np.zeros(TRIGRAMS, dtype=np.int64)
+        runs = []
+        for b, start in enumerate(range(0, total, batch)):
+            keys = _batch_postings(take_strings(reviews_ckpt, 'comments', order[start:start + batch]), start)
+            codes, run_counts = np.unique(keys >> 32, return_counts=True)
+            counts[codes] += run_counts
+            run_path = os.path.join(tmp_dir, f"run_{b:05d}")
+            (keys & 0xFFFFFFFF).astype(np.uint32).tofile(run_path + '.u4')
+            np.stack([codes, run_counts]).astype(np.int64).tofile(run_path + '.i8')
+            runs.append(run_path)
+
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        offsets.tofile(os.path.join(tmp_dir, 'trigram_offsets.i8'))
+        del counts
+        postings_path = os.path.join(tmp_dir, 'postings.u4')
+        if offsets[-1]:
+            postings = np.memmap(postings_path, dtype=np.uint32, mode='w+', shape=(int(offsets[-1]),))
+            cursor = offsets[:-1].copy()
+            for run_path in runs:
+                run = np.fromfile(run_path + '.u4', dtype=np.uint32)
+                codes, run_counts = np.fromfile(run_path + '.i8', dtype=np.int64).reshape(2, -1)
+                run_starts = np.concatenate([[0], np.cumsum(run_counts)[:-1]])
+                # element i of trigram t goes to cursor[t] + (i - run_starts[t])
+                postings[np.repeat(cursor[codes] - run_starts, run_counts) + np.arange(len(run))] = run
+                cursor[codes] += run_counts
+                os.remove(run_path + '.u4')
+                os.remove(run_path + '.i8')
+            postings.flush()
+            del postings
+        else:
+            open(postings_path, 'wb').close()
+
+        meta = {'reviews': total, 'listings': len(listing_ids), 'postings': int(offsets[-1]),
+                'reviews_ckpt': os.path.abspath(reviews_ckpt), 'rows': checkpoint_rows(reviews_ckpt)}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.replace(tmp_dir, index_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return meta
+
+
+def like_pattern(keyword):
+    """The route's '%kw%' as (literal pieces, compiled regex), with LIKE's % _ and \\ rules."""
+    pattern = f"%{keyword}%".lower()
+    pieces, regex, literal = [], [], ''
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\' and i + 1 < len(pattern):
+            literal += pattern[i + 1]
+            i += 2
+            continue
+        if ch in '%_':
+            if literal:
+                pieces.append(literal)
+                regex.append(re.escape(literal))
+                literal = ''
+            regex.append('.*' if ch == '%' else '.')
+        else:
+            literal += ch
+        i += 1
+    if literal:
+        pieces.append(literal)
+        regex.append(re.escape(literal))
+    return pieces, re.compile(''.join(regex), re.DOTALL)
+
+
+class ReviewIndex:
+    """Query API over a built index; equivalent to the listingReviewKeyword ILIKE."""
+
+    def __init__(self, index_dir, reviews_ckpt=None):
+        def load(name, dtype):
+            path = os.path.join(index_dir, name)
+            return np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.zeros(0, dtype)
+
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.reviews_ckpt = reviews_ckpt or self.meta['reviews_ckpt']
+        self.listing_ids = load('listing_ids.i8', np.int64)
+        self.listing_offsets = load('listing_offsets.i8', np.int64)
+        self.review_ids = load('review_ids.i8', np.int64)
+        self.review_rows = load('review_rows.i8', np.int64)
+        self.trigram_offsets = load('trigram_offsets.i8', np.int64)
+        self.postings = load('postings.u4', np.uint32)
+
+    def listing_range(self, listing_id):
+        i = np.searchsorted(self.listing_ids, listing_id)
+        if i == len(self.listing_ids) or self.listing_ids[i] != listing_id:
+            return 0, 0
+        return int(self.listing_offsets[i]), int(self.listing_offsets[i + 1])
+
+    def candidates(self, listing_id, pieces):
+        """Review positions of the listing that contain every trigram of every piece."""
+        lo, hi = self.listing_range(listing_id)
+        codes = np.unique(np.concatenate([trigram_codes(p) for p in pieces] or [np.zeros(0, np.int64)]))
+        if lo == hi or len(codes) == 0:
+            return np.arange(lo, hi)
+        result = None
+        for code in codes:
+            posting = self.postings[self.trigram_offsets[code]:self.trigram_offsets[code + 1]]
+            a, b = np.searchsorted(posting, [lo, hi])
+            found = np.asarray(posting[a:b], dtype=np.int64)
+            result = found if result is None else np.intersect1d(result, found, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def search(self, listing_id, keyword):
+        """review_ids of the listing whose comments ILIKE '%keyword%'."""
+        pieces, regex = like_pattern(keyword)
+        positions = self.candidates(listing_id, pieces)
+        comments = take_strings(self.reviews_ckpt, 'comments', self.review_rows[positions])
+        match = [c is not None and regex.fullmatch(c.lower()) is not None for c in comments]
+        return self.review_ids[positions[np.array(match, dtype=bool)]].tolist() if len(positions) else []
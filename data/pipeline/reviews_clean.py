@@ -0,0 +1,112 @@
+"""Out-of-core cleaning of reviews_detailed_combined.csv into DB_reviews.
+
+The rule is unchanged: every review whose id occurs more than once is
+dropped (all copies), and `id` is renamed to `review_id`. Finding those ids
+only needs the id column, so the first pass reads just `id` and
+hash-partitions it to disk; each partition is small enough to count on its
+own, and every copy of an id lands in the same partition. The second pass
+streams the full rows, comments included, one chunk at a time, and drops
+the rows whose id is in the (small) duplicate set.
+
+The result goes to DB_reviews.csv and, as a columnar equivalent, to a
+checkpoint whose comments can be memory-mapped by later stages. The same
+pass can feed the kept rows to a per-listing review sample
+(pipeline/sampling.py).
+"""
+import os
+import shutil
+import tempfile
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics
+from pipeline.checkpoint import CHUNKSIZE, CheckpointWriter, encode_int
+
+
+PARTITIONS = 64
+
+# checkpoint kinds for the known reviews_detailed columns; anything else is kept as text
+REVIEW_KINDS = {'review_id': 'int', 'listing_id': 'int', 'date': 'date', 'reviewer_id': 'int'}
+
+
+def duplicate_ids(reviews_csv, partitions=PARTITIONS, chunksize=CHUNKSIZE, work_dir=None):
+    """Sorted int64 array of the ids that occur more than once.
+
+    Missing ids are encoded as INT_NULL, so several reviews without an id
+    count as duplicates of each other, as with duplicated(keep=False).
+    """
+    work_dir = tempfile.mkdtemp(prefix='.reviews_', dir=work_dir or os.path.dirname(os.path.abspath(reviews_csv)))
+    try:
+        part_files = [open(os.path.join(work_dir, f"ids_{p:03d}.bin"), 'wb') for p in range(partitions)]
+        try:
+            for chunk in pd.read_csv(reviews_csv, usecols=['id'], dtype=str, chunksize=chunksize):
+                ids = encode_int(chunk['id'])
+                part = ids % partitions
+                order = np.argsort(part, kind='stable')
+                bounds = np.searchsorted(part[order], np.arange(partitions + 1))
+                for p in range(partitions):
+                    if bounds[p] < bounds[p + 1]:
+                        ids[order[bounds[p]:bounds[p + 1]]].tofile(part_files[p])
+        finally:
+            for f in part_files:
+                f.close()
+
+        # an id and all of its copies are in one partition
+        duplicates = []
+        for p in range(partitions):
+            ids = np.fromfile(os.path.join(work_dir, f"ids_{p:03d}.bin"), dtype=np.int64)
+            values, counts = np.unique(ids, return_counts=True)
+            duplicates.append(values[counts > 1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return np.sort(np.concatenate(duplicates))
+
+
+def clean_reviews_file(reviews_csv, output_csv, output_ckpt=None, partitions=PARTITIONS, chunksize=CHUNKSIZE,
+                       reservoir=None):
+    """Clean reviews_detailed_combined.csv into DB_reviews in two streaming passes.
+
+    Text columns are passed through as read. reservoir: a
+    sampling.ReviewReservoir offered every kept row, by its row number in
+    DB_reviews. Returns a dict of row counts.
+    """
+    with metrics.timed('duplicate_review_id'):
+        dup_ids = duplicate_ids(reviews_csv, partitions, chunksize)
+    print(f"Number of duplicate 'id' values: {len(dup_ids)}")
+
+    columns = pd.read_csv(reviews_csv, nrows=0).rename(columns={'id': 'review_id'}).columns
+    pd.DataFrame(columns=columns).to_csv(output_csv, index=False, encoding='utf-8-sig')
+    # a pass that raises removes the checkpoint instead of finishing it (CheckpointWriter.__exit__)
+    if output_ckpt is not None:
+        checkpoint_writer = CheckpointWriter(output_ckpt, {c: REVIEW_KINDS.get(c, 'str') for c in columns})
+    else:
+        checkpoint_writer = nullcontext()
+
+    stats = {'rows_in': 0, 'dropped_duplicate': 0, 'rows_out': 0}
+    with checkpoint_writer as writer:
+        with open(output_csv, 'a', newline='', encoding='utf-8') as out:
+            for chunk in pd.read_csv(reviews_csv, dtype=str, keep_default_na=False, chunksize=chunksize):
+                stats['rows_in'] += len(chunk)
+                with metrics.timed('duplicate_review_id'):
+                    keep = ~np.isin(encode_int(chunk['id'].mask(chunk['id'] == '')), dup_ids)
+                metrics.rows('duplicate_review_id', len(keep), int(keep.sum()), reason='review id repeated, all copies')
+                chunk = chunk[keep].rename(columns={'id': 'review_id'})
+                stats['dropped_duplicate'] += int((~keep).sum())
+                if reservoir is not None:
+                    with metrics.timed('review_sample'):
+                        reservoir.add(encode_int(chunk['listing_id'].mask(chunk['listing_id'] == '')),
+                                      encode_int(chunk['review_id'].mask(chunk['review_id'] == '')), stats['rows_out'])
+                stats['rows_out'] += len(chunk)
+                with metrics.timed('export_csv'):
+                    chunk.to_csv(out, header=False, index=False)
+
+                if writer is not None:
+                    typed = chunk.mask(chunk == '')
+                    for column, kind in writer.schema.items():
+                        if kind == 'date':
+                            typed[column] = pd.to_datetime(typed[column], errors='coerce')
+                    with metrics.timed('write_checkpoint'):
+                        writer.append(typed)
+    return stats
@@ -0,0 +1,98 @@
+"""Precomputed random-pick tables for the random review and random listing routes.
+
+topRatedWithReview picked a listing's review with ORDER BY RANDOM() over all
+of its reviews, and randomListing sorted every listing rated above 4.9 by
+RANDOM(). Both now pick a random slot of a small numbered table:
+
+    listing_review_sample  listing_id, slot, review_id, comments: up to
+                           SAMPLE_SIZE reviews per listing, slots 0..n-1
+    featured_listing       slot, listing_id: the listings rated above
+                           FEATURED_RATING, slots 0..n-1
+
+The review sample is a bottom-k sample: every review gets a pseudo-random
+key, a hash of its review_id and the seed, and a listing keeps the
+SAMPLE_SIZE reviews with the smallest keys. That is a uniform sample without
+replacement. It is kept up to date chunk by chunk during the streaming pass
+of reviews_clean and never holds more than SAMPLE_SIZE reviews per listing
+plus one chunk. Only reviews of the cleaned listings (DB_listings.csv) are
+sampled, so the table loads without the integrity stage's drop. The same
+input and seed always give the same sample. The comments of the sampled
+reviews are read back from the reviews checkpoint at the end.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline.checkpoint import INT_NULL, take_strings
+from pipeline.integrity import member
+
+
+SAMPLE_SIZE = 5
+SEED = 0
+
+FEATURED_RATING = 4.9
+
+
+def random_keys(ids, seed=SEED):
+    """A pseudo-random uint64 per int64 id (splitmix64 of the id and the seed)."""
+    with np.errstate(over='ignore'):
+        z = np.asarray(ids, dtype=np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15) * np.uint64(seed + 1)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bottom_k(group, key, size):
+    """Positions of the `size` smallest keys of each group, ordered by (group, key)."""
+    order = np.lexsort((key, group))
+    sorted_group = group[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_group, sorted_group)
+    return order[rank < size]
+
+
+class ReviewReservoir:
+    """The running per-listing review sample of one streaming pass.
+
+    listing_ids: sorted int64 ids of the listings whose reviews are sampled
+    (default: every listing).
+    """
+
+    def __init__(self, size=SAMPLE_SIZE, seed=SEED, listing_ids=None):
+        self.size = size
+        self.seed = seed
+        self.listing_filter = None if listing_ids is None else np.unique(np.asarray(listing_ids, dtype=np.int64))
+        self.listing_id = np.zeros(0, np.int64)
+        self.key = np.zeros(0, np.uint64)
+        self.review_id = np.zeros(0, np.int64)
+        self.row = np.zeros(0, np.int64)
+
+    def add(self, listing_id, review_id, first_row):
+        """Offer a chunk of reviews: int64 ids, their rows in the checkpoint starting at first_row."""
+        listing_id = np.asarray(listing_id, dtype=np.int64)
+        review_id = np.asarray(review_id, dtype=np.int64)
+        row = first_row + np.arange(len(review_id), dtype=np.int64)
+        ok = (listing_id != INT_NULL) & (review_id != INT_NULL)
+        if self.listing_filter is not None:
+            ok &= member(self.listing_filter, listing_id)
+        listing_id = np.concatenate([self.listing_id, listing_id[ok]])
+        review_id = np.concatenate([self.review_id, review_id[ok]])
+        key = np.concatenate([self.key, random_keys(review_id[len(self.key):], self.seed)])
+        row = np.concatenate([self.row, row[ok]])
+        keep = _bottom_k(listing_id, key, self.size)
+        self.listing_id, self.key, self.review_id, self.row = listing_id[keep], key[keep], review_id[keep], row[keep]
+
+    def frame(self, reviews_ckpt):
+        """listing_review_sample, with the comments of the sampled rows of reviews_ckpt."""
+        slot = np.arange(len(self.listing_id)) - np.searchsorted(self.listing_id, self.listing_id)
+        return pd.DataFrame({'listing_id': self.listing_id, 'slot': slot, 'review_id': self.review_id,
+                             'comments': take_strings(reviews_ckpt, 'comments', self.row)})
+
+
+def featured_pool(listing_ids, ratings, threshold=FEATURED_RATING):
+    """featured_listing: the listings rated above threshold, numbered 0..n-1 in listing id order.
+
+    Ratings are compared at the two decimals of review_scores_rating NUMERIC(5, 2).
+    """
+    ids = pd.to_numeric(pd.Series(listing_ids), errors='coerce')
+    ratings = pd.to_numeric(pd.Series(ratings), errors='coerce').round(2)
+    featured = np.unique(ids[(ratings > threshold).to_numpy() & ids.notna().to_numpy()].astype(np.int64))
+    return pd.DataFrame({'slot': np.arange(len(featured)), 'listing_id': featured})
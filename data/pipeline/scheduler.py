@@ -0,0 +1,190 @@
+"""Run the pipeline's stages concurrently, in dependency order, within a memory budget.
+
+run_stages runs the stages one after another. Most of them only need the
+combined files and DB_listings.csv, though: hosts, reviews, amenities and
+the calendar do not wait on each other. Here a stage depends on the stages
+whose declared outputs match one of its declared inputs, and every stage
+whose dependencies are done is started in its own process. A rebuild then
+takes about as long as its longest chain of stages (combine, listings,
+calendar, ...) rather than the sum of all of them.
+
+The memory budget holds stages back: one is only started while the
+estimated peaks of the running stages and its own fit in the budget. A
+stage's estimate is its peak_rss_mb in the latest metrics run log
+(<data>/metrics/run-*.json), or DEFAULT_STAGE_MB on the first run. A stage
+always starts when nothing else is running, whatever its estimate.
+
+The stage cache, the parameters and the run log work as in run_stages.
+Each stage's printed output goes to <data>/metrics/<stage>.log. A stage's
+process ends with the stage, so nothing would reuse the frames reader.py
+keeps for the later stages of a run: the workers read only the columns
+their stage asks for.
+"""
+import contextlib
+import fnmatch
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pipeline import metrics, reader
+from pipeline.cache import StageCache
+from pipeline.stages import RUNTIME_PARAMS, STAGES, get_stage
+
+
+# peak memory assumed for a stage with no recorded run
+DEFAULT_STAGE_MB = 2048
+
+# share of the machine's memory used when no budget is given
+MEMORY_SHARE = 0.75
+
+
+def dependencies(stages, paths):
+    """{stage name: [names of the earlier stages writing one of its inputs]}."""
+    deps = {}
+    for i, stage in enumerate(stages):
+        inputs = [p.format(**paths) for p in stage.inputs]
+        deps[stage.name] = [
+            earlier.name for earlier in stages[:i]
+            if any(inp == out or fnmatch.fnmatch(inp, out) or fnmatch.fnmatch(out, inp)
+                   for out in (p.format(**paths) for p in earlier.outputs) for inp in inputs)]
+    return deps
+
+
+def select_stages(names, stages=STAGES, paths=None, upstream=True):
+    """The named stages, in pipeline order, with every stage they depend on when upstream is set."""
+    wanted = {get_stage(name, stages).name for name in names}
+    if upstream:
+        deps = dependencies(stages, paths or {'raw': '{raw}', 'data': '{data}'})
+        for stage in reversed(stages):
+            if stage.name in wanted:
+                wanted.update(deps[stage.name])
+    return [stage for stage in stages if stage.name in wanted]
+
+
+def memory_budget_mb():
+    """MEMORY_SHARE of the machine's physical memory, in MB."""
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+    return total / 1024 / 1024 * MEMORY_SHARE
+
+
+def recorded_peaks(metrics_dir):
+    """{stage name: peak_rss_mb of its latest recorded run} from the run logs."""
+    peaks = {}
+    for path in sorted(glob.glob(os.path.join(metrics_dir, 'run-*.json')), reverse=True):
+        try:
+            with open(path) as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for record in run.get('stages', []):
+            if record.get('status') == 'ran' and 'peak_rss_mb' in record:
+                peaks.setdefault(record['stage'], record['peak_rss_mb'])
+    return peaks
+
+
+def _run_stage(func, name, paths, params, log_path, profile_path):
+    """Run one stage in a pool process; returns its metrics record."""
+    reader.set_sharing(False)
+    try:
+        with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+            with metrics.measure(name, profile_path) as record:
+                func(paths, **params)
+    finally:
+        reader.clear_cache()
+    return record
+
+
+def schedule_stages(paths, stages=STAGES, params=None, force=(), use_cache=True, metrics_log=None, profile=(),
+                    jobs=None, memory_mb=None):
+    """Run the stages concurrently as their dependencies finish; returns the names of the stages that ran.
+
+    jobs: stages running at once (default: one per CPU). memory_mb: memory
+    budget (default: MEMORY_SHARE of physical memory). The other arguments
+    are run_stages'. After a failure no more stages are started; the first
+    failure is raised once the running stages are done.
+    """
+    params = params or {}
+    jobs = jobs or os.cpu_count() or 1
+    memory_mb = memory_mb or memory_budget_mb() or float('inf')
+    os.makedirs(paths['data'], exist_ok=True)
+    metrics_dir = os.path.join(paths['data'], 'metrics')
+    os.makedirs(metrics_dir, exist_ok=True)
+    run_log = metrics.RunLog(metrics_log or os.path.join(metrics_dir, f"run-{time.strftime('%Y%m%d-%H%M%S')}.json"),
+                             paths, params)
+    peaks = recorded_peaks(metrics_dir)
+    cache = StageCache(paths['data']) if use_cache else None
+
+    names = {stage.name for stage in stages}
+    deps = {name: [d for d in found if d in names] for name, found in dependencies(stages, paths).items()}
+    pending = list(stages)
+    keys = {}
+    running = {}  # future -> (stage, memory estimate)
+    finished, ran, errors = set(), [], []
+
+    # each stage gets a fresh process, so its memory is returned when it ends
+    pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                               max_tasks_per_child=1)
+    try:
+        while pending and not errors or running:
+            in_use = sum(estimate for _, estimate in running.values())
+            for stage in list(pending) if not errors else []:
+                if any(d not in finished for d in deps[stage.name]):
+                    continue
+                stage_params = dict(stage.params, **params.get(stage.name, {}))
+                if cache is not None and stage.name not in keys:
+                    keys[stage.name] = cache.stage_key(
+                        stage, paths, {k: v for k, v in stage_params.items() if k not in RUNTIME_PARAMS})
+                    if stage.name not in force and cache.is_valid(stage, paths, keys[stage.name]):
+                        print(f"[{stage.name}] up to date, skipped")
+                        run_log.add({'stage': stage.name, 'status': 'skipped'})
+                        pending.remove(stage)
+                        finished.add(stage.name)
+                        continue
+
+                estimate = peaks.get(stage.name, DEFAULT_STAGE_MB)
+                if running and (len(running) >= jobs or in_use + estimate > memory_mb):
+                    continue  # starts when a running stage finishes
+                pending.remove(stage)
+                if cache is not None:
+                    cache.invalidate(stage)
+                profile_path = os.path.join(metrics_dir, f"{stage.name}.prof") if stage.name in profile else None
+                log_path = os.path.join(metrics_dir, f"{stage.name}.log")
+                future = pool.submit(_run_stage, stage.func, stage.name, paths, stage_params, log_path, profile_path)
+                running[future] = (stage, estimate)
+                in_use += estimate
+                print(f"[{stage.name}] running (log: {log_path})")
+
+            if not running:
+                continue  # stages were skipped; their dependents may be ready now
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, _ = running.pop(future)
+                finished.add(stage.name)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print(f"[{stage.name}] failed: {e!r}")
+                    run_log.add({'stage': stage.name, 'status': 'failed', 'error': repr(e)})
+                    errors.append(e)
+                    continue
+                run_log.add(record)
+                print(f"[{stage.name}] {record['wall_s']:.1f}s, peak {record['peak_rss_mb']:.0f} MB")
+                if record.get('profile'):
+                    print(metrics.profile_summary(record['profile']))
+                ran.append(stage.name)
+                if cache is not None:
+                    cache.record(stage, paths, keys[stage.name])
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for stage in pending:
+            run_log.add({'stage': stage.name, 'status': 'not_run'})
+        run_log.finish()
+    if errors:
+        raise errors[0]
+    return ran
@@ -0,0 +1,177 @@
+"""Top-k similar listings within a city, from amenity and attribute bitsets.
+
+Each listing is packed into two fixed-width bitsets:
+
+    amenities   bit amenity_id - 1 for every top-N amenity it has (DB_has_amenity2)
+    attributes  one bit for its room_type, then accommodates and bedrooms as
+                thermometer codes (the lowest min(value, width) bits set), so
+                that the overlap of two codes is the smaller value
+
+The similarity of two listings is a weighted sum of the Jaccard indexes of
+the two bitsets, |a & b| / |a | b|, where |a | b| = |a| + |b| - |a & b|. A
+batch of listings is compared with every listing of its city at once: AND of
+the words, np.bitwise_count, sum. Cities are split into row blocks that run
+in a process pool.
+
+Neighbors are ranked by score, ties by the lower listing id, and written as
+listing_similar (listing_id, rank, similar_listing_id, score). Listings
+without a city are left out.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pipeline.availability import listing_cities
+
+
+K = 10
+
+# weight of the amenity Jaccard index; the attribute index gets the rest
+AMENITY_WEIGHT = 0.7
+
+ACCOMMODATES_BITS = 16
+BEDROOMS_BITS = 8
+
+# listings per process pool task, and listing pairs compared at once within a task
+TASK_ROWS = 2048
+BATCH_PAIRS = 1_000_000
+
+SIMILAR_COLUMNS = ['listing_id', 'rank', 'similar_listing_id', 'score']
+
+
+def _set_bits(bits, rows, positions):
+    """Set bit `positions` of the bitset in each of `rows`."""
+    positions = np.asarray(positions, dtype=np.int64)
+    np.bitwise_or.at(bits, (np.asarray(rows, dtype=np.int64), positions // 64),
+                     np.left_shift(np.uint64(1), (positions % 64).astype(np.uint64)))
+
+
+def _thermometer(rows, values, width, offset):
+    """(rows, bit positions) of thermometer codes: bits offset .. offset + min(value, width) - 1."""
+    counts = np.clip(np.nan_to_num(values, nan=0), 0, width).astype(np.int64)
+    code_rows = np.repeat(rows, counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return code_rows, offset + np.arange(len(code_rows)) - starts
+
+
+def listing_features(listings_csv, listings_detailed_csv, has_amenity_csv, city_neighborhood_csv):
+    """Listings with a city, ordered by (city_id, listing_id), and their bitsets.
+
+    Returns (listings, amenity_bits, attribute_bits): listings has
+    listing_id and city_id, the bitsets are uint64 arrays of one row per listing.
+    """
+    listings = listing_cities(listings_csv, city_neighborhood_csv)
+    listings = listings[listings['city_id'] > 0].sort_values(['city_id', 'listing_id']).reset_index(drop=True)
+    ids = listings['listing_id'].to_numpy(np.int64)
+    order = np.argsort(ids, kind='stable')
+
+    def rows_of(values):
+        """Rows of the listings with these ids, and which ids have one."""
+        values = pd.to_numeric(pd.Series(values), errors='coerce').fillna(-1).to_numpy(np.int64)
+        pos = np.minimum(np.searchsorted(ids[order], values), max(len(ids) - 1, 0))
+        found = (ids[order][pos] == values) if len(ids) else np.zeros(len(values), dtype=bool)
+        return order[pos[found]], found
+
+    has_amenity = pd.read_csv(has_amenity_csv, encoding='utf-8-sig')
+    rows, found = rows_of(has_amenity['id'])
+    amenity_ids = has_amenity['amenity_id'].to_numpy(np.int64)[found]
+    amenity_bits = np.zeros((len(ids), max((int(amenity_ids.max(initial=0)) + 63) // 64, 1)), dtype=np.uint64)
+    _set_bits(amenity_bits, rows, amenity_ids - 1)
+
+    room_type = pd.read_csv(listings_csv, usecols=['id', 'room_type'], dtype=str).drop_duplicates('id')
+    detailed = (pd.read_csv(listings_detailed_csv, usecols=['id', 'accommodates', 'bedrooms'], dtype=str)
+                  .drop_duplicates('id'))
+    room_types = sorted(room_type['room_type'].dropna().unique())
+    attribute_bits = np.zeros((len(ids), (len(room_types) + ACCOMMODATES_BITS + BEDROOMS_BITS + 63) // 64),
+                              dtype=np.uint64)
+    rows, found = rows_of(room_type['id'])
+    codes = pd.Categorical(room_type['room_type'], categories=room_types).codes[found]
+    _set_bits(attribute_bits, rows[codes >= 0], codes[codes >= 0])
+    rows, found = rows_of(detailed['id'])
+    for column, width, offset in (('accommodates', ACCOMMODATES_BITS, len(room_types)),
+                                  ('bedrooms', BEDROOMS_BITS, len(room_types) + ACCOMMODATES_BITS)):
+        values = pd.to_numeric(detailed[column], errors='coerce').to_numpy(float)[found]
+        _set_bits(attribute_bits, *_thermometer(rows, values, width, offset))
+    return listings, amenity_bits, attribute_bits
+
+
+def _jaccard(words, counts, batch):
+    """Jaccard index of each listing of `batch` against every listing.
+
+    words is the bitsets transposed to (word, listing), so that each word is
+    one contiguous AND and popcount over all pairs.
+    """
+    inter = np.zeros((len(batch), words.shape[1]), dtype=np.int32)
+    for word in words:
+        inter += np.bitwise_count(word[batch, None] & word[None, :])
+    union = counts[batch, None] + counts[None, :] - inter
+    return np.divide(inter, union, out=np.zeros(inter.shape), where=union > 0)
+
+
+def _top_k(scores, rows, ids, k):
+    """(row, neighbor, score) of the k best neighbors of each of `rows`, ties by lower listing id."""
+    scores[np.arange(len(rows)), rows] = -1  # never a neighbor of itself
+    k = min(k, scores.shape[1] - 1)
+    if k <= 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+    # every listing scoring at least the k-th best, so ties at the boundary are broken by id
+    which, neighbor = np.nonzero(scores >= kth[:, None])
+    score = scores[which, neighbor]
+    order = np.lexsort((ids[neighbor], -score, which))
+    which, neighbor, score = which[order], neighbor[order], score[order]
+    rank = np.arange(len(which)) - np.searchsorted(which, which)
+    keep = rank < k
+    return rows[which[keep]], neighbor[keep], score[keep]
+
+
+def similar_block(amenity_bits, attribute_bits, ids, start, stop, k=K, amenity_weight=AMENITY_WEIGHT):
+    """Top-k neighbors of one city's listings start..stop-1, as rows into the city's arrays.
+
+    Returns (rows, neighbor rows, scores), k (or fewer) per listing in rank order.
+    """
+    amenity_counts = np.bitwise_count(amenity_bits).sum(axis=1, dtype=np.int32)
+    attribute_counts = np.bitwise_count(attribute_bits).sum(axis=1, dtype=np.int32)
+    amenity_words = np.ascontiguousarray(amenity_bits.T)
+    attribute_words = np.ascontiguousarray(attribute_bits.T)
+    batch = max(1, BATCH_PAIRS // max(len(ids), 1))
+    parts = []
+    for first in range(start, stop, batch):
+        rows = np.arange(first, min(first + batch, stop))
+        scores = (amenity_weight * _jaccard(amenity_words, amenity_counts, rows)
+                  + (1 - amenity_weight) * _jaccard(attribute_words, attribute_counts, rows))
+        parts.append(_top_k(scores, rows, ids, k))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def build_similar_listings(listings_csv, listings_detailed_csv, has_amenity_csv, city_neighborhood_csv, k=K,
+                           amenity_weight=AMENITY_WEIGHT, workers=1):
+    """The listing_similar table: the k most similar listings of the same city for every listing."""
+    listings, amenity_bits, attribute_bits = listing_features(listings_csv, listings_detailed_csv,
+                                                              has_amenity_csv, city_neighborhood_csv)
+    ids = listings['listing_id'].to_numpy(np.int64)
+    city_ids, starts = np.unique(listings['city_id'].to_numpy(), return_index=True)
+    bounds = list(zip(starts, np.append(starts[1:], len(ids))))
+
+    tasks = []
+    for lo, hi in bounds:
+        for start in range(0, hi - lo, TASK_ROWS):
+            tasks.append((lo, (amenity_bits[lo:hi], attribute_bits[lo:hi], ids[lo:hi], start,
+                               min(start + TASK_ROWS, hi - lo), k, amenity_weight)))
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(lo, pool.submit(similar_block, *args)) for lo, args in tasks]
+            results = [(lo, future.result()) for lo, future in futures]
+    else:
+        results = [(lo, similar_block(*args)) for lo, args in tasks]
+
+    if not results:
+        return pd.DataFrame(columns=SIMILAR_COLUMNS)
+    rows = np.concatenate([lo + r for lo, (r, _, _) in results])
+    neighbors = np.concatenate([lo + n for lo, (_, n, _) in results])
+    scores = np.concatenate([s for _, (_, _, s) in results])
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows) + 1
+    return pd.DataFrame({'listing_id': ids[rows], 'rank': rank, 'similar_listing_id': ids[neighbors],
+                         'score': scores.round(4)})
@@ -0,0 +1,486 @@
+"""The preprocessing pipeline as a list of stages.
+
+Each section of the old notebook is a stage function taking the `paths` dict
+({'raw': <per-city folders>, 'data': <combined data folder>}) and its
+parameters as keyword arguments. A stage declares the files it reads and
+writes as '{raw}/...' / '{data}/...' patterns, which is what the stage cache
+(pipeline/cache.py) hashes to decide whether it has to run again.
+"""
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import (aggregates, amenities, availability, calendar_clean, calendar_serving, checkpoint, eda, ingest,
+                      integrity, load, metrics, neighborhoods, profiler, reader, review_index, reviews_clean, sampling,
+                      similar)
+from pipeline.cache import StageCache
+
+
+# code: modules and functions besides `func` whose source is part of the stage's cache key
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs', 'params', 'code'])
+
+
+# Define the list of CSV files to concatenate
+CSV_FILES = ['reviews.csv', 'reviews_detailed.csv', 'calendar.csv', 'listings.csv', 'listings_detailed.csv', 'neighbourhoods.csv']
+
+
+def read_listing_ids(data_path):
+    """Listing ids of the cleaned listings table, as an int64 array."""
+    ids = pd.read_csv(os.path.join(data_path, 'DB_listings.csv'), usecols=['id'])['id']
+    return pd.to_numeric(ids, errors='coerce').dropna().astype(np.int64).unique()
+
+
+#########################################################
+#### Concatenate files to create nationwide datasets ####
+#########################################################
+
+def combine_stage(paths, chunksize=ingest.CHUNKSIZE, workers=1):
+    # Concatenate file, listings_detailed gets a column "city" with the city folder name
+    for file in CSV_FILES:
+        output_filename = file[:-4]  # removes the '.csv' extension
+        output_path = os.path.join(paths['data'], f"{output_filename}_combined.csv")
+
+        rows = ingest.concat_city_files(paths['raw'], file, output_path,
+                                        add_city=(file == 'listings_detailed.csv'),
+                                        chunksize=chunksize, workers=workers)
+        if rows is not None:
+            print(f"Created {output_filename}_combined.csv ({rows} rows)")
+        else:
+            print(f"No files named '{file}' found in any city folders.")
+
+
+####################################################
+#### Basic EDA for all files ####
+####################################################
+
+def eda_stage(paths, missing_threshold=0.5, report=False, workers=None):
+    # report: headless, parallel rendering to eda_results/<file>_report/ instead of inline plots
+    if report:
+        eda.eda_report(paths['data'], eda.COMBINED_FILES, missing_threshold, workers=workers)
+    else:
+        eda.basic_eda(paths['data'], eda.COMBINED_FILES, missing_threshold)
+
+
+####################################################
+#### preprocessng listings_combined, listings_details_combined data file
+####################################################
+
+# select columns
+LISTINGS_COLUMNS = ['id', 'name', 'host_id', 'neighbourhood', 'room_type']
+LISTINGS_DETAILED_COLUMNS = [
+    'id', 'description', 'listing_url', 'picture_url',
+    'bedrooms', 'beds', 'number_of_reviews', 'accommodates', 'instant_bookable', 'review_scores_rating'
+]
+
+
+def clean_listings(df):
+    """Split listings_detailed rows into the listings and Listings_detailed tables."""
+    df_listings = df[LISTINGS_COLUMNS].copy()
+    df_listings_detailed = df[LISTINGS_DETAILED_COLUMNS].copy()
+
+    # deal with null
+    rows_in = len(df_listings)
+    df_listings = df_listings.dropna(subset=['name', 'neighbourhood']).reset_index(drop=True)
+    metrics.rows('listings.missing_name_or_neighbourhood', rows_in, len(df_listings),
+                 reason='name or neighbourhood is null')
+    rows_in = len(df_listings_detailed)
+    df_listings_detailed = df_listings_detailed.dropna(subset=['review_scores_rating']).reset_index(drop=True)
+    metrics.rows('listings_detailed.missing_rating', rows_in, len(df_listings_detailed),
+                 reason='review_scores_rating is null')
+    rows_in = len(df_listings_detailed)
+    # a null among the values sends Int64.isin through float64, where 18-digit ids collide
+    df_listings_detailed = df_listings_detailed[df_listings_detailed['id'].isin(df_listings['id'].dropna())]
+    metrics.rows('listings_detailed.not_in_listings', rows_in, len(df_listings_detailed), reason='id not in listings')
+
+    # remove duplicates
+    for name, table in [('df_listings', df_listings), ('df_listings_detailed', df_listings_detailed)]:
+        if not table['id'].is_unique:
+            print(f"'id' in {name} is NOT unique.")
+            print(table['id'].value_counts()[table['id'].value_counts() > 1])
+
+    rows_in = len(df_listings), len(df_listings_detailed)
+    df_listings = df_listings.drop_duplicates(subset='id')
+    df_listings_detailed = df_listings_detailed.drop_duplicates(subset='id')
+    metrics.rows('listings.duplicate_id', rows_in[0], len(df_listings), reason='id repeated, first kept')
+    metrics.rows('listings_detailed.duplicate_id', rows_in[1], len(df_listings_detailed),
+                 reason='id repeated, first kept')
+
+    # Drop invalid values
+    rows_in = len(df_listings)
+    df_listings = df_listings.dropna(subset=['id', 'host_id'])
+    df_listings['id'] = pd.to_numeric(df_listings['id'], errors='coerce').astype('Int64')
+    df_listings['host_id'] = pd.to_numeric(df_listings['host_id'], errors='coerce').astype('Int64')
+    df_listings = df_listings.drop_duplicates()
+    metrics.rows('listings.invalid_id', rows_in, len(df_listings), reason='id or host_id is null')
+
+    rows_in = len(df_listings_detailed)
+    df_listings_detailed = df_listings_detailed.dropna(subset=['id'])
+    df_listings_detailed['id'] = pd.to_numeric(df_listings_detailed['id'], errors='coerce').astype('Int64')
+    df_listings_detailed = df_listings_detailed.drop_duplicates()
+    metrics.rows('listings_detailed.invalid_id', rows_in, len(df_listings_detailed), reason='id is null')
+    return df_listings, df_listings_detailed
+
+
+def listings_stage(paths, featured_rating=sampling.FEATURED_RATING):
+    df = reader.read_table(os.path.join(paths['data'], 'listings_detailed_combined.csv'),
+                           LISTINGS_COLUMNS + LISTINGS_DETAILED_COLUMNS[1:] + ['city'])
+    # neighbourhood becomes the cleaned_neighborhood key of city_neighborhood (neighborhoods stage)
+    df['neighbourhood'], _ = neighborhoods.clean_neighborhoods(df['neighbourhood'], df['city'])
+    df_listings, df_listings_detailed = clean_listings(df)
+
+    # output
+    df_listings.to_csv(os.path.join(paths['data'], 'DB_listings.csv'), index=False)
+    df_listings_detailed.to_csv(os.path.join(paths['data'], 'DB_listings_detailed.csv'), index=False)
+    print(f"Listings: {len(df_listings)}, listings detailed: {len(df_listings_detailed)}")
+
+    # numbered pool of the listings randomListing picks from
+    df_featured = sampling.featured_pool(df_listings_detailed['id'], df_listings_detailed['review_scores_rating'],
+                                         featured_rating)
+    df_featured.to_csv(os.path.join(paths['data'], 'featured_listing.csv'), index=False, encoding='utf-8-sig')
+    print(f"featured_listing: {len(df_featured)} listings")
+
+
+####################################################
+#### city_neighborhood, cities and city_search tables ####
+####################################################
+
+def neighborhoods_stage(paths):
+    df = reader.read_table(os.path.join(paths['data'], 'listings_detailed_combined.csv'), ['neighbourhood', 'city'])
+    cleaned, cities = neighborhoods.clean_neighborhoods(df['neighbourhood'], df['city'])
+    tables = neighborhoods.build_tables(cleaned, cities)
+    for name in NEIGHBORHOOD_TABLES:
+        tables[name].to_csv(os.path.join(paths['data'], f"{name}.csv"), index=False, encoding='utf-8-sig')
+        print(f"{name}: {len(tables[name])} rows")
+
+
+####################################################
+#### preprocessng amenities and listings_amenities data files ####
+####################################################
+
+def amenities_stage(paths, top_n=200):
+    df = reader.read_table(os.path.join(paths['data'], 'listings_detailed_combined.csv'), ['id', 'amenities'])
+
+    top_amenities_df, df_has_amenity, amenities_count = amenities.build_amenities(
+        df['id'], df['amenities'], read_listing_ids(paths['data']), top_n=top_n)
+    print(f"Number of distinct amenities: {len(amenities_count)}")
+
+    top_amenities_df.to_csv(os.path.join(paths['data'], 'amenities.csv'), index=False, encoding='utf-8-sig')
+    df_has_amenity.to_csv(os.path.join(paths['data'], 'DB_has_amenity2.csv'), index=False, encoding='utf-8-sig')
+    print(f"has_amenity rows: {len(df_has_amenity)}")
+
+    # bitmasks for the amenity filters: per listing, and per keyword of the amenity names
+    listing_masks = amenities.listing_amenity_masks(df_has_amenity, read_listing_ids(paths['data']))
+    listing_masks.to_csv(os.path.join(paths['data'], 'listing_amenity_mask.csv'), index=False, encoding='utf-8-sig')
+    keyword_masks = amenities.amenity_keywords(top_amenities_df)
+    keyword_masks.to_csv(os.path.join(paths['data'], 'amenity_keyword.csv'), index=False, encoding='utf-8-sig')
+    print(f"amenity masks: {len(listing_masks)} listings, {len(keyword_masks)} keywords")
+
+
+def similar_stage(paths, k=similar.K, amenity_weight=similar.AMENITY_WEIGHT, workers=1):
+    # top-k listings of the same city by amenity and room/size similarity
+    with metrics.timed('similar_listings'):
+        df_similar = similar.build_similar_listings(
+            os.path.join(paths['data'], 'DB_listings.csv'), os.path.join(paths['data'], 'DB_listings_detailed.csv'),
+            os.path.join(paths['data'], 'DB_has_amenity2.csv'), os.path.join(paths['data'], 'city_neighborhood.csv'),
+            k=k, amenity_weight=amenity_weight, workers=workers)
+    df_similar.to_csv(os.path.join(paths['data'], 'listing_similar.csv'), index=False, encoding='utf-8-sig')
+    print(f"listing_similar: {len(df_similar)} rows for {df_similar['listing_id'].nunique()} listings")
+
+
+####################################################
+#### preprocessng calendar_combined data file
+####################################################
+
+def calendar_stage(paths, price_cap=calendar_clean.PRICE_CAP, drop_months=calendar_clean.DROP_MONTHS,
+                   holidays=calendar_serving.HOLIDAYS):
+    calendar_stats = calendar_clean.clean_calendar(
+        os.path.join(paths['data'], 'calendar_combined.csv'), read_listing_ids(paths['data']),
+        os.path.join(paths['data'], 'DB_calendar4.ckpt'), os.path.join(paths['data'], 'DB_calendar4.csv'),
+        price_cap=price_cap, drop_months=drop_months,
+        monthly_ckpt=os.path.join(paths['data'], 'DB_calendar_monthly.ckpt'))
+    print(calendar_stats)
+
+    #check distribution of adjust_price (after the cap)
+    adjusted_price = checkpoint.read_checkpoint(os.path.join(paths['data'], 'DB_calendar4.ckpt'),
+                                                ['adjusted_price'])['adjusted_price']
+    print(f"Number of 0 values in 'adjusted_price': {(adjusted_price == 0).sum()}")
+    print(adjusted_price.quantile([0.5, 0.9, 0.95, 0.99]))
+    print("Maximum Price:", adjusted_price.max())
+
+    # per-listing tables for the cheapest-dates, monthly-trend and holiday-price routes
+    with metrics.timed('serving_tables'):
+        serving = calendar_serving.build_calendar_serving(os.path.join(paths['data'], 'DB_calendar4.ckpt'), holidays)
+    for name, table in serving.items():
+        table.to_csv(os.path.join(paths['data'], f"{name}.csv"), index=False, encoding='utf-8-sig')
+        print(f"{name}: {len(table)} rows")
+
+    # availability bitsets and nightly prices per listing for the date-range stay searches
+    with metrics.timed('availability_index'):
+        index_meta = availability.build_availability_index(
+            os.path.join(paths['data'], 'DB_calendar4.ckpt'), os.path.join(paths['data'], 'DB_listings.csv'),
+            os.path.join(paths['data'], 'city_neighborhood.csv'), os.path.join(paths['data'], 'availability_index'))
+    print(f"Availability index: {index_meta['listings']} listings x {index_meta['days']} nights "
+          f"from {index_meta['first_day']}")
+
+
+####################################################
+#### preprocessng review data file
+# check if id is unique
+# check if id has null value
+# remove rows with duplicate id
+# output the cleaned dataset to csv
+####################################################
+
+def clean_reviews(df_reviews_detailed):
+    """Drop every review whose id is duplicated and rename id to review_id."""
+    # Count the number of rows in df_reviews_detailed
+    print(f"Number of rows in df_reviews_detailed: {len(df_reviews_detailed)}")
+    print(f"Is 'id' unique: {df_reviews_detailed['id'].is_unique}")
+    print(f"Does 'id' have any null values: {df_reviews_detailed['id'].isnull().any()}")
+
+    duplicate_rows = df_reviews_detailed[df_reviews_detailed['id'].duplicated(keep=False)]
+    print(f"Number of duplicate 'id' values: {duplicate_rows['id'].nunique()}")
+
+    # remove duplicates
+    df_reviews_detailed_clean = df_reviews_detailed[~df_reviews_detailed['id'].isin(duplicate_rows['id'])]
+    return df_reviews_detailed_clean.rename(columns={'id': 'review_id'})
+
+
+def reviews_stage(paths, chunksize=checkpoint.CHUNKSIZE, sample_size=sampling.SAMPLE_SIZE, sample_seed=sampling.SEED):
+    # ids are deduplicated out of core; comments are only ever held one chunk at a time
+    reservoir = sampling.ReviewReservoir(sample_size, sample_seed, read_listing_ids(paths['data']))
+    reviews_stats = reviews_clean.clean_reviews_file(
+        os.path.join(paths['data'], 'reviews_detailed_combined.csv'), os.path.join(paths['data'], 'DB_reviews.csv'),
+        os.path.join(paths['data'], 'DB_reviews.ckpt'), chunksize=chunksize, reservoir=reservoir)
+    print(reviews_stats)
+
+    # up to sample_size random reviews per listing, for the random review of topRatedWithReview
+    df_sample = reservoir.frame(os.path.join(paths['data'], 'DB_reviews.ckpt'))
+    df_sample.to_csv(os.path.join(paths['data'], 'listing_review_sample.csv'), index=False, encoding='utf-8-sig')
+    print(f"listing_review_sample: {len(df_sample)} reviews for {df_sample['listing_id'].nunique()} listings")
+
+    # trigram index for the listingReviewKeyword lookups
+    with metrics.timed('review_index'):
+        index_meta = review_index.build_review_index(os.path.join(paths['data'], 'DB_reviews.ckpt'),
+                                                     os.path.join(paths['data'], 'review_index'))
+    print(f"Review index: {index_meta['postings']} postings for {index_meta['listings']} listings")
+
+
+####################################################
+#### preprocessng hosts data file
+#check if host_id is unique
+#check if host_id has null value
+#remove rows with duplicate host_id
+#output the cleaned dataset to csv
+####################################################
+
+HOST_COLUMNS = ['host_id', 'host_url', 'host_name', 'host_since', 'host_location', 'host_response_time',
+                'host_is_superhost', 'host_identity_verified', 'host_has_profile_pic',
+                'host_listings_count', 'host_total_listings_count']
+
+
+def clean_hosts(df_listing_details):
+    """One row per host_id with the Hosts columns, first listing wins."""
+    host_columns = [col for col in df_listing_details.columns if "host" in col]
+    df_host = df_listing_details[host_columns]
+
+    #remove duplicates
+    df_host_dedup = df_host.drop_duplicates(subset=['host_id'], keep='first')
+    metrics.rows('hosts.duplicate_host_id', len(df_host), len(df_host_dedup),
+                 reason='host of several listings, first kept')
+
+    print(len(df_host_dedup))
+    print(f"Is 'host_id' unique: {df_host_dedup['host_id'].is_unique}")
+    print(f"Does 'host_id' have any null values: {df_host_dedup['host_id'].isnull().any()}")
+
+    # select columns
+    return df_host_dedup[HOST_COLUMNS]
+
+
+def hosts_stage(paths):
+    df_listing_details = reader.read_table(os.path.join(paths['data'], 'listings_detailed_combined.csv'), HOST_COLUMNS)
+    df_host_dedup = clean_hosts(df_listing_details)
+
+    # output
+    df_host_dedup.to_csv(os.path.join(paths['data'], 'DB_host.csv'), index=False, encoding='utf-8-sig')
+
+
+####################################################
+#### preprocessng is_super_host data file ####
+####################################################
+
+def superhost_stage(paths):
+    # host_is_superhost is decoded when DB_host.csv is written; older files have 't' / 'f'
+    df_host = pd.read_csv(os.path.join(paths['data'], 'DB_host.csv'), usecols=['host_id', 'host_is_superhost'],
+                          dtype={'host_is_superhost': 'boolean'}, true_values=['t'], false_values=['f'])
+
+    # Create 'host_is_superhost_boo' column, null -> False
+    df_host['host_is_superhost_boo'] = df_host['host_is_superhost'].fillna(False).astype(bool)
+
+    host_is_superhost_counts = df_host.groupby('host_is_superhost_boo').size().reset_index(name='count')
+    print(host_is_superhost_counts)
+
+    df_host = df_host[['host_id', 'host_is_superhost_boo']]
+
+    # output
+    df_host.to_csv(os.path.join(paths['data'], 'DB_is_super_host.csv'), index=False, encoding='utf-8-sig')
+
+
+####################################################
+#### monthly price tables (were materialized views over Calendar)
+####################################################
+
+PRICE_VIEWS = ['monthly_avg_cache', 'listing_overall_avg_price', 'city_monthly_avg', 'superhost_neighborhood_monthly']
+
+
+def price_views_stage(paths):
+    monthly = checkpoint.read_checkpoint(os.path.join(paths['data'], 'DB_calendar_monthly.ckpt'))
+    listings = pd.read_csv(os.path.join(paths['data'], 'DB_listings.csv'), usecols=['id', 'host_id', 'neighbourhood'])
+    superhost = pd.read_csv(os.path.join(paths['data'], 'DB_is_super_host.csv'), encoding='utf-8-sig')
+    city_neighborhood = pd.read_csv(os.path.join(paths['data'], 'city_neighborhood.csv'),
+                                    usecols=['cleaned_neighborhood', 'city'], encoding='utf-8-sig')
+    listing_city = listings.merge(city_neighborhood, left_on='neighbourhood', right_on='cleaned_neighborhood')
+    listing_city = listing_city[['id', 'city']].dropna()
+
+    monthly_avg = aggregates.monthly_avg_cache(monthly)
+    tables = {
+        'monthly_avg_cache': monthly_avg,
+        'listing_overall_avg_price': aggregates.listing_overall_avg_price(monthly_avg),
+        'city_monthly_avg': aggregates.city_monthly_avg(monthly_avg, listing_city),
+        'superhost_neighborhood_monthly': aggregates.superhost_neighborhood_monthly(monthly, listings, superhost,
+                                                                                    listing_city),
+    }
+    for name, table in tables.items():
+        table.to_csv(os.path.join(paths['data'], f"{name}.csv"), index=False, encoding='utf-8-sig')
+        print(f"{name}: {len(table)} rows")
+
+
+####################################################
+#### foreign keys of the outputs (create_tables.sql)
+####################################################
+
+def integrity_stage(paths, drop=True):
+    # drop=True removes the orphan rows so that the load does not fail on them; drop=False only reports
+    results = integrity.check_integrity(paths['data'], drop=drop)
+    integrity.print_results(results)
+    integrity.write_report(results, os.path.join(paths['data'], 'integrity_report.json'))
+
+
+NEIGHBORHOOD_TABLES = ['cities', 'city_neighborhood', 'city_search']
+
+CALENDAR_SERVING = ['listing_cheapest_dates', 'listing_monthly_trend', 'listing_holiday_price']
+
+COMBINED = ['{data}/' + f[:-4] + '_combined.csv' for f in CSV_FILES]
+
+# every name a city file may have, compressed or not
+RAW_FILES = ['{raw}/*/' + name for f in CSV_FILES for name in ingest.input_names(f)]
+
+STAGES = [
+    Stage('combine', combine_stage, RAW_FILES, COMBINED,
+          {'chunksize': ingest.CHUNKSIZE, 'workers': os.cpu_count() or 1}, [ingest]),
+    Stage('eda', eda_stage, ['{data}/' + f for f in eda.COMBINED_FILES],
+          ['{data}/eda_results/*_eda_results.csv', '{data}/eda_results/*_report'],
+          {'missing_threshold': 0.5, 'report': False, 'workers': os.cpu_count() or 1}, [eda, profiler]),
+    Stage('listings', listings_stage, ['{data}/listings_detailed_combined.csv'],
+          ['{data}/DB_listings.csv', '{data}/DB_listings_detailed.csv', '{data}/featured_listing.csv'],
+          {'featured_rating': sampling.FEATURED_RATING},
+          [clean_listings, reader, neighborhoods, sampling.featured_pool]),
+    Stage('neighborhoods', neighborhoods_stage, ['{data}/listings_detailed_combined.csv'],
+          ['{data}/' + name + '.csv' for name in NEIGHBORHOOD_TABLES], {}, [neighborhoods, reader]),
+    Stage('amenities', amenities_stage, ['{data}/listings_detailed_combined.csv', '{data}/DB_listings.csv'],
+          ['{data}/amenities.csv', '{data}/DB_has_amenity2.csv', '{data}/listing_amenity_mask.csv',
+           '{data}/amenity_keyword.csv'], {'top_n': 200}, [amenities, reader]),
+    Stage('similar', similar_stage,
+          ['{data}/DB_listings.csv', '{data}/DB_listings_detailed.csv', '{data}/DB_has_amenity2.csv',
+           '{data}/city_neighborhood.csv'],
+          ['{data}/listing_similar.csv'],
+          {'k': similar.K, 'amenity_weight': similar.AMENITY_WEIGHT, 'workers': os.cpu_count() or 1},
+          [similar, availability.listing_cities]),
+    Stage('calendar', calendar_stage,
+          ['{data}/calendar_combined.csv', '{data}/DB_listings.csv', '{data}/city_neighborhood.csv'],
+          ['{data}/DB_calendar4.ckpt', '{data}/DB_calendar4.csv', '{data}/DB_calendar_monthly.ckpt',
+           '{data}/availability_index'] + ['{data}/' + name + '.csv' for name in CALENDAR_SERVING],
+          {'price_cap': calendar_clean.PRICE_CAP, 'drop_months': calendar_clean.DROP_MONTHS,
+           'holidays': calendar_serving.HOLIDAYS},
+          [calendar_clean, checkpoint, aggregates.MonthlyPrices, calendar_serving, integrity.member,
+           availability]),
+    Stage('reviews', reviews_stage, ['{data}/reviews_detailed_combined.csv', '{data}/DB_listings.csv'],
+          ['{data}/DB_reviews.csv', '{data}/DB_reviews.ckpt', '{data}/review_index',
+           '{data}/listing_review_sample.csv'],
+          {'chunksize': checkpoint.CHUNKSIZE, 'sample_size': sampling.SAMPLE_SIZE, 'sample_seed': sampling.SEED},
+          [reviews_clean, review_index, checkpoint, sampling, integrity.member]),
+    Stage('hosts', hosts_stage, ['{data}/listings_detailed_combined.csv'], ['{data}/DB_host.csv'], {},
+          [clean_hosts, reader]),
+    Stage('superhost', superhost_stage, ['{data}/DB_host.csv'], ['{data}/DB_is_super_host.csv'], {}, []),
+    Stage('price_views', price_views_stage,
+          ['{data}/DB_calendar_monthly.ckpt', '{data}/DB_listings.csv', '{data}/DB_is_super_host.csv',
+           '{data}/city_neighborhood.csv'],
+          ['{data}/' + name + '.csv' for name in PRICE_VIEWS], {}, [aggregates]),
+    Stage('integrity', integrity_stage,
+          ['{data}/' + table.file for table in load.TABLES] + ['{data}/DB_calendar4.ckpt', '{data}/DB_reviews.ckpt',
+                                                                load.SCHEMA_PATH],
+          ['{data}/integrity_report.json'], {'drop': True}, [integrity]),
+]
+
+# parameters that only change how a stage runs, not what it writes
+RUNTIME_PARAMS = {'chunksize', 'workers'}
+
+
+def get_stage(name, stages=STAGES):
+    for stage in stages:
+        if stage.name == name:
+            return stage
+    raise KeyError(f"Unknown stage {name!r}; stages are {[s.name for s in stages]}")
+
+
+def run_stages(paths, stages=STAGES, params=None, force=(), use_cache=True, metrics_log=None, profile=()):
+    """Run the stages in order, skipping the ones whose outputs are still valid.
+
+    params maps a stage name to parameter overrides. Stages named in `force`
+    always run. Time, memory and row counts of every stage go to the JSON log
+    metrics_log (default <data>/metrics/run-<time>.json); stages named in
+    `profile` run under cProfile (pipeline/metrics.py). Returns the names of
+    the stages that ran.
+    """
+    params = params or {}
+    os.makedirs(paths['data'], exist_ok=True)
+    metrics_dir = os.path.join(paths['data'], 'metrics')
+    run_log = metrics.RunLog(metrics_log or os.path.join(metrics_dir, f"run-{time.strftime('%Y%m%d-%H%M%S')}.json"),
+                             paths, params)
+    cache = StageCache(paths['data']) if use_cache else None
+    ran = []
+    try:
+        for stage in stages:
+            stage_params = dict(stage.params, **params.get(stage.name, {}))
+            key = None
+            if cache is not None:
+                key = cache.stage_key(stage, paths, {k: v for k, v in stage_params.items() if k not in RUNTIME_PARAMS})
+                if stage.name not in force and cache.is_valid(stage, paths, key):
+                    print(f"[{stage.name}] up to date, skipped")
+                    run_log.add({'stage': stage.name, 'status': 'skipped'})
+                    continue
+                cache.invalidate(stage)
+
+            print(f"[{stage.name}] running")
+            profile_path = os.path.join(metrics_dir, f"{stage.name}.prof") if stage.name in profile else None
+            if profile_path is not None:
+                os.makedirs(metrics_dir, exist_ok=True)
+            try:
+                with metrics.measure(stage.name, profile_path) as record:
+                    stage.func(paths, **stage_params)
+            finally:
+                run_log.add(record)
+            print(f"[{stage.name}] {record['wall_s']:.1f}s, peak {record['peak_rss_mb']:.0f} MB")
+            if profile_path is not None:
+                print(metrics.profile_summary(profile_path))
+            ran.append(stage.name)
+            if cache is not None:
+                cache.record(stage, paths, key)
+    finally:
+        # the stages of one run share parsed frames (pipeline/reader.py); the next run parses again
+        reader.clear_cache()
+        run_log.finish()
+    return ran
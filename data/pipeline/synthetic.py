@@ -0,0 +1,363 @@
+"""Synthetic Inside Airbnb snapshots for testing and benchmarking the pipeline.
+
+Writes one folder per city with the files the combine stage concatenates
+(listings.csv, listings_detailed.csv, calendar.csv, reviews.csv,
+reviews_detailed.csv, neighbourhoods.csv), with the columns and quirks of the
+real downloads:
+
+    - the 75 listings_detailed columns, t/f flags, `$1,234.00` prices
+    - amenities as stringified JSON lists, with \\u escapes
+    - listing ids of both generations (small ints and 18-digit ids)
+    - repeated listing rows, repeated (listing_id, date) calendar rows and
+      repeated review ids, at `dup_rate`
+    - listings without a name or neighbourhood, which the listings stage
+      drops, so some reviews and calendar rows point at unknown listings
+
+Every city is generated from its own seed, in blocks of listings, so cities
+can be written in parallel and memory stays flat at any scale. SCALES holds
+presets; 'full' is about the real dataset (34 cities, ~58M calendar rows).
+
+    python -m pipeline.synthetic OUT_DIR [--scale small] [--cities 5] [--listings 2000]
+        [--days 365] [--reviews 20] [--seed 0] [--workers 4]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# cities, listings per city, calendar days, mean reviews per listing
+SCALES = {
+    'tiny': {'cities': 3, 'listings': 200, 'days': 90, 'reviews': 5},
+    'small': {'cities': 5, 'listings': 2_000, 'days': 365, 'reviews': 20},
+    'medium': {'cities': 12, 'listings': 4_000, 'days': 365, 'reviews': 25},
+    'full': {'cities': 34, 'listings': 4_700, 'days': 365, 'reviews': 30},
+}
+
+CITIES = ['Asheville', 'Austin', 'Boston', 'Broward County', 'Cambridge', 'Chicago', 'Clark County', 'Columbus',
+          'Dallas', 'Denver', 'Fort Worth', 'Hawaii', 'Jersey City', 'Los Angeles', 'Nashville', 'New Orleans',
+          'New York City', 'Newark', 'Oakland', 'Pacific Grove', 'Portland', 'Rhode Island', 'Salem', 'San Diego',
+          'San Francisco', 'San Mateo County', 'Santa Clara County', 'Santa Cruz County', 'Seattle',
+          'Twin Cities MSA', 'Washington D.C.', 'Bozeman', 'Albany', 'Mid North Coast']
+
+LISTINGS_DETAILED_COLUMNS = [
+    'id', 'listing_url', 'scrape_id', 'last_scraped', 'source', 'name', 'description', 'neighborhood_overview',
+    'picture_url', 'host_id', 'host_url', 'host_name', 'host_since', 'host_location', 'host_about',
+    'host_response_time', 'host_response_rate', 'host_acceptance_rate', 'host_is_superhost', 'host_thumbnail_url',
+    'host_picture_url', 'host_neighbourhood', 'host_listings_count', 'host_total_listings_count',
+    'host_verifications', 'host_has_profile_pic', 'host_identity_verified', 'neighbourhood',
+    'neighbourhood_cleansed', 'neighbourhood_group_cleansed', 'latitude', 'longitude', 'property_type',
+    'room_type', 'accommodates', 'bathrooms', 'bathrooms_text', 'bedrooms', 'beds', 'amenities', 'price',
+    'minimum_nights', 'maximum_nights', 'minimum_minimum_nights', 'maximum_minimum_nights',
+    'minimum_maximum_nights', 'maximum_maximum_nights', 'minimum_nights_avg_ntm', 'maximum_nights_avg_ntm',
+    'calendar_updated', 'has_availability', 'availability_30', 'availability_60', 'availability_90',
+    'availability_365', 'calendar_last_scraped', 'number_of_reviews', 'number_of_reviews_ltm',
+    'number_of_reviews_l30d', 'first_review', 'last_review', 'review_scores_rating', 'review_scores_accuracy',
+    'review_scores_cleanliness', 'review_scores_checkin', 'review_scores_communication', 'review_scores_location',
+    'review_scores_value', 'license', 'instant_bookable', 'calculated_host_listings_count',
+    'calculated_host_listings_count_entire_homes', 'calculated_host_listings_count_private_rooms',
+    'calculated_host_listings_count_shared_rooms', 'reviews_per_month']
+
+LISTINGS_COLUMNS = ['id', 'name', 'host_id', 'host_name', 'neighbourhood_group', 'neighbourhood', 'latitude',
+                    'longitude', 'room_type', 'price', 'minimum_nights', 'number_of_reviews', 'last_review',
+                    'reviews_per_month', 'calculated_host_listings_count', 'availability_365',
+                    'number_of_reviews_ltm', 'license']
+
+ROOM_TYPES = (['Entire home/apt', 'Private room', 'Shared room', 'Hotel room'], [0.70, 0.27, 0.02, 0.01])
+PROPERTY_TYPES = ['Entire home', 'Entire rental unit', 'Private room in home', 'Entire condo', 'Entire guesthouse',
+                  'Room in hotel', 'Shared room in home', 'Entire townhouse']
+RESPONSE_TIMES = (['within an hour', 'within a few hours', 'within a day', 'a few days or more', 'N/A'],
+                  [0.55, 0.15, 0.1, 0.02, 0.18])
+
+# the head of the amenity distribution, then a long tail of brand / variant names
+AMENITIES = ['Wifi', 'Smoke alarm', 'Kitchen', 'Essentials', 'Hangers', 'Hair dryer', 'Hot water',
+             'Carbon monoxide alarm', 'Iron', 'Dishes and silverware', 'Refrigerator', 'Microwave', 'Bed linens',
+             'Cooking basics', 'Shampoo', 'Coffee maker', 'Heating', 'Air conditioning', 'Fire extinguisher',
+             'Self check-in', 'Dedicated workspace', 'TV', 'Free parking on premises', 'Free street parking',
+             'Paid parking off premises', 'Washer', 'Dryer', 'First aid kit', 'Long term stays allowed',
+             'Pets allowed', 'Pool', 'Hot tub', 'Gym', 'EV charger', 'Crib', 'Patio or balcony', 'BBQ grill',
+             'Private entrance', 'Lockbox', 'Dishwasher', 'Oven', 'Stove', 'Extra pillows and blankets',
+             'Room-darkening shades', 'Luggage dropoff allowed', 'Elevator', 'Backyard', 'Outdoor furniture',
+             'Chef\\u2019s kitchen', 'Children\\u2019s books and toys', 'Beach access \\u2013 Beachfront']
+AMENITY_TAIL = ['Samsung refrigerator', 'HDTV with Netflix', 'Body soap', 'Conditioner', 'Clothing storage: closet',
+                'Gas stove', 'Electric stove', 'Stainless steel oven', 'Bluetooth sound system',
+                'Fast wifi \\u2013 500 Mbps', 'Paid washer \\u2013 In building', 'Free dryer \\u2013 In unit',
+                'Sound system', 'Game console', 'Ping pong table', 'Record player', 'Private pool', 'Shared hot tub']
+
+REVIEW_PHRASES = ['Great place, very clean!', 'Host was lovely.<br/>Would stay again', 'Noisy street at night.',
+                  'Super comfy bed and fast wifi', 'Perfect location, close to everything.',
+                  'Free parking was a big plus.', 'Check-in was easy — thanks!', 'Très bien situé.',
+                  'The kitchen had everything we needed.', 'A bit smaller than the photos, but cozy \U0001F60A',
+                  'Would recommend to friends and family.', 'Quiet neighbourhood, "hidden gem".']
+NAMES = ['Ann', 'Bob', 'Carlos', 'Dana', 'Eve', 'Fatima', 'Giulia', 'Hiro', 'Ines', 'Jamal', 'Kim', 'Lee', 'María']
+
+# listings generated and written at a time
+BLOCK = 2_000
+
+_PRICE_TEXT = np.array([f"${p:,.2f}" for p in range(0, 20_001)], dtype=object)
+
+
+def price_text(dollars):
+    """`$1,234.00` strings for whole-dollar prices."""
+    return _PRICE_TEXT[np.clip(dollars, 0, len(_PRICE_TEXT) - 1)]
+
+
+def _tf(mask):
+    return np.where(mask, 't', 'f').astype(object)
+
+
+def _blank(values, missing):
+    values = np.asarray(values, dtype=object)
+    values[missing] = None
+    return values
+
+
+def _amenity_lists(rng, n):
+    vocabulary = AMENITIES + AMENITY_TAIL + [f"Amenity {i}" for i in range(300)]
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** 0.9
+    weights /= weights.sum()
+    counts = rng.integers(5, 60, n)
+    out = np.empty(n, dtype=object)
+    for i, k in enumerate(counts):
+        picked = rng.choice(len(vocabulary), size=min(k, len(vocabulary)), replace=False, p=weights)
+        out[i] = '[' + ', '.join(f'"{vocabulary[j]}"' for j in picked) + ']'
+    return out
+
+
+def _neighbourhoods(city, rng):
+    n = int(rng.integers(15, 80))
+    return [f"{city} District {i}" for i in range(n - 3)] + ['Downtown', 'Midtown', 'Old Town']
+
+
+def _listings_block(rng, city, city_index, ids, neighbourhoods, scrape_date):
+    n = len(ids)
+    host_id = rng.integers(1, max(2, n // 3), n) + 10_000_000 * (city_index + 1)
+    room_type = rng.choice(ROOM_TYPES[0], n, p=ROOM_TYPES[1])
+    property_type = rng.choice(PROPERTY_TYPES, n)
+    accommodates = rng.integers(1, 11, n)
+    bedrooms = np.where(rng.random(n) < 0.1, np.nan, np.maximum(1, accommodates // 2))
+    beds = np.where(rng.random(n) < 0.05, np.nan, np.maximum(1, accommodates // 2 + rng.integers(0, 2, n)))
+    price = (rng.lognormal(5.0, 0.7, n)).astype(np.int64) + 20
+    number_of_reviews = rng.negative_binomial(1, 0.05, n)
+    rating = np.where(number_of_reviews > 0, np.round(np.clip(rng.normal(4.75, 0.3, n), 1, 5), 2), np.nan)
+    cleansed = rng.choice(neighbourhoods, n)
+    neighbourhood = _blank([f"{c}, {city}, United States" for c in cleansed], rng.random(n) < 0.3)
+    name = _blank([f"{p} in {city} · {a} guests" for p, a in zip(property_type, accommodates)],
+                  rng.random(n) < 0.01)
+    superhost = _blank(_tf(rng.random(n) < 0.35), rng.random(n) < 0.03)
+    reviewed = number_of_reviews > 0
+    review_dates = _blank((scrape_date - rng.integers(0, 700, n).astype('timedelta64[D]')).astype(str), ~reviewed)
+    minimum_nights = rng.choice([1, 2, 3, 30], n, p=[0.4, 0.3, 0.2, 0.1])
+    return pd.DataFrame({
+        'id': ids,
+        'listing_url': [f"https://www.airbnb.com/rooms/{i}" for i in ids],
+        'scrape_id': 20231218000000 + city_index,
+        'last_scraped': str(scrape_date),
+        'source': 'city scrape',
+        'name': name,
+        'description': [f"Bright {p.lower()}, sleeps {a}.<br /><br />Close to \"{c}\", transit and shops."
+                        for p, a, c in zip(property_type, accommodates, cleansed)],
+        'neighborhood_overview': _blank(np.full(n, 'Walkable, quiet streets.', dtype=object), rng.random(n) < 0.4),
+        'picture_url': [f"https://a0.muscache.com/pictures/{i}.jpg" for i in ids],
+        'host_id': host_id,
+        'host_url': [f"https://www.airbnb.com/users/show/{h}" for h in host_id],
+        'host_name': rng.choice(NAMES, n),
+        'host_since': (np.datetime64('2009-01-01') + rng.integers(0, 5000, n).astype('timedelta64[D]')).astype(str),
+        'host_location': f"{city}, United States",
+        'host_about': _blank(np.full(n, 'Love to travel!', dtype=object), rng.random(n) < 0.5),
+        'host_response_time': rng.choice(RESPONSE_TIMES[0], n, p=RESPONSE_TIMES[1]),
+        'host_response_rate': [f"{r}%" for r in rng.integers(50, 101, n)],
+        'host_acceptance_rate': [f"{r}%" for r in rng.integers(30, 101, n)],
+        'host_is_superhost': superhost,
+        'host_thumbnail_url': 'https://a0.muscache.com/im/users/small.jpg',
+        'host_picture_url': 'https://a0.muscache.com/im/users/large.jpg',
+        'host_neighbourhood': cleansed,
+        'host_listings_count': rng.integers(1, 20, n),
+        'host_total_listings_count': rng.integers(1, 40, n),
+        'host_verifications': "['email', 'phone']",
+        'host_has_profile_pic': _tf(rng.random(n) < 0.98),
+        'host_identity_verified': _tf(rng.random(n) < 0.9),
+        'neighbourhood': neighbourhood,
+        'neighbourhood_cleansed': cleansed,
+        'neighbourhood_group_cleansed': None,
+        'latitude': np.round(rng.uniform(25, 48, n), 6),
+        'longitude': np.round(rng.uniform(-123, -71, n), 6),
+        'property_type': property_type,
+        'room_type': room_type,
+        'accommodates': accommodates,
+        'bathrooms': np.maximum(1, accommodates // 3),
+        'bathrooms_text': [f"{b} bath" for b in np.maximum(1, accommodates // 3)],
+        'bedrooms': bedrooms,
+        'beds': beds,
+        'amenities': _amenity_lists(rng, n),
+        'price': price_text(price),
+        'minimum_nights': minimum_nights,
+        'maximum_nights': rng.choice([30, 365, 1125], n),
+        'minimum_minimum_nights': minimum_nights,
+        'maximum_minimum_nights': minimum_nights,
+        'minimum_maximum_nights': 1125,
+        'maximum_maximum_nights': 1125,
+        'minimum_nights_avg_ntm': minimum_nights.astype(float),
+        'maximum_nights_avg_ntm': 1125.0,
+        'calendar_updated': None,
+        'has_availability': 't',
+        'availability_30': rng.integers(0, 31, n),
+        'availability_60': rng.integers(0, 61, n),
+        'availability_90': rng.integers(0, 91, n),
+        'availability_365': rng.integers(0, 366, n),
+        'calendar_last_scraped': str(scrape_date),
+        'number_of_reviews': number_of_reviews,
+        'number_of_reviews_ltm': np.minimum(number_of_reviews, rng.integers(0, 30, n)),
+        'number_of_reviews_l30d': np.minimum(number_of_reviews, rng.integers(0, 4, n)),
+        'first_review': review_dates,
+        'last_review': review_dates,
+        'review_scores_rating': rating,
+        'review_scores_accuracy': rating,
+        'review_scores_cleanliness': rating,
+        'review_scores_checkin': rating,
+        'review_scores_communication': rating,
+        'review_scores_location': rating,
+        'review_scores_value': rating,
+        'license': _blank(np.full(n, 'STR-0001', dtype=object), rng.random(n) < 0.6),
+        'instant_bookable': _tf(rng.random(n) < 0.3),
+        'calculated_host_listings_count': rng.integers(1, 20, n),
+        'calculated_host_listings_count_entire_homes': rng.integers(0, 10, n),
+        'calculated_host_listings_count_private_rooms': rng.integers(0, 10, n),
+        'calculated_host_listings_count_shared_rooms': 0,
+        'reviews_per_month': np.where(reviewed, np.round(rng.uniform(0.05, 5, n), 2), np.nan),
+    }, columns=LISTINGS_DETAILED_COLUMNS)
+
+
+def _calendar_block(rng, ids, base_price, days, start_date, dup_rate):
+    n = len(ids)
+    dates = (start_date + np.arange(days).astype('timedelta64[D]')).astype(str).astype(object)
+    weekday = (np.arange(days) + (start_date.astype('datetime64[D]').astype(np.int64) + 3)) % 7
+    listing_id = np.repeat(ids, days)
+    factor = np.tile(np.where(weekday >= 4, 1.2, 1.0), n) * rng.uniform(0.85, 1.15, n * days)
+    price = (np.repeat(base_price, days) * factor).astype(np.int64)
+    calendar = pd.DataFrame({
+        'listing_id': listing_id,
+        'date': np.tile(dates, n),
+        'available': _tf(rng.random(n * days) < 0.55),
+        'price': price_text(price),
+        # recent snapshots leave adjusted_price empty
+        'adjusted_price': _blank(price_text(price), rng.random(n * days) < 0.9),
+        'minimum_nights': np.repeat(rng.choice([1, 2, 3, 30], n, p=[0.4, 0.3, 0.2, 0.1]), days),
+        'maximum_nights': np.repeat(rng.choice([30, 365, 1125], n), days),
+    })
+    if dup_rate:
+        repeat = rng.random(len(calendar)) < dup_rate / 10
+        calendar = pd.concat([calendar, calendar[repeat]]).sort_index(kind='stable')
+    return calendar
+
+
+def _reviews_block(rng, ids, number_of_reviews, first_review_id, scrape_date, dup_rate):
+    listing_id = np.repeat(ids, number_of_reviews)
+    n = len(listing_id)
+    review_id = first_review_id + np.arange(n)
+    # newer reviews have 18-digit ids
+    review_id = np.where(rng.random(n) < 0.4, 700_000_000_000_000_000 + review_id, review_id)
+    if dup_rate and n:
+        repeat = rng.random(n) < dup_rate
+        review_id[repeat] = review_id[rng.integers(0, n, int(repeat.sum()))]
+    phrases = rng.choice(len(REVIEW_PHRASES), (n, 3))
+    comments = _blank([' '.join(REVIEW_PHRASES[j] for j in row[:k]) for row, k in
+                       zip(phrases, rng.integers(1, 4, n))], rng.random(n) < 0.01)
+    return pd.DataFrame({
+        'listing_id': listing_id,
+        'id': review_id,
+        'date': (scrape_date - rng.integers(0, 3000, n).astype('timedelta64[D]')).astype(str),
+        'reviewer_id': rng.integers(1, 500_000_000, n),
+        'reviewer_name': rng.choice(NAMES, n),
+        'comments': comments,
+    })
+
+
+def write_city(city_dir, city, city_index, listings=SCALES['small']['listings'], days=SCALES['small']['days'],
+               reviews=SCALES['small']['reviews'], seed=0, dup_rate=0.01, start_date='2023-12-18'):
+    """Write one city folder. Returns {file: rows}."""
+    rng = np.random.default_rng([seed, city_index])
+    os.makedirs(city_dir, exist_ok=True)
+    start_date = np.datetime64(start_date, 'D')
+    neighbourhoods = _neighbourhoods(city, rng)
+    pd.DataFrame({'neighbourhood_group': None, 'neighbourhood': neighbourhoods}).to_csv(
+        os.path.join(city_dir, 'neighbourhoods.csv'), index=False)
+
+    # older listings have small ids, newer ones 18-digit ids
+    small = city_index * 10_000_000 + 1_000 + rng.permutation(listings * 3)[:listings]
+    large = 600_000_000_000_000_000 + city_index * 10_000_000_000 + rng.permutation(listings * 3)[:listings]
+    ids = np.where(rng.random(listings) < 0.6, small, large).astype(np.int64)
+
+    rows = dict.fromkeys(['listings_detailed.csv', 'listings.csv', 'calendar.csv', 'reviews_detailed.csv',
+                          'reviews.csv'], 0)
+    first_review_id = (city_index + 1) * 100_000_000
+    for b, start in enumerate(range(0, listings, BLOCK)):
+        block_ids = ids[start:start + BLOCK]
+        detailed = _listings_block(rng, city, city_index, block_ids, neighbourhoods, start_date)
+        # re-scraped listings show up twice
+        repeat = rng.random(len(detailed)) < dup_rate
+        detailed = pd.concat([detailed, detailed[repeat]])
+        summary = detailed[[c for c in LISTINGS_COLUMNS if c in detailed.columns]].assign(
+            neighbourhood_group=None, neighbourhood=detailed['neighbourhood_cleansed'])[LISTINGS_COLUMNS]
+        base_price = detailed['price'].str.replace(r'[$,]', '', regex=True).astype(float).to_numpy()[:len(block_ids)]
+        calendar = _calendar_block(rng, block_ids, base_price, days, start_date, dup_rate)
+        reviews_detailed = _reviews_block(rng, block_ids, rng.poisson(reviews, len(block_ids)), first_review_id,
+                                          start_date, dup_rate)
+        first_review_id += len(reviews_detailed)
+
+        for file, frame in [('listings_detailed.csv', detailed), ('listings.csv', summary),
+                            ('calendar.csv', calendar), ('reviews_detailed.csv', reviews_detailed),
+                            ('reviews.csv', reviews_detailed[['listing_id', 'date']])]:
+            frame.to_csv(os.path.join(city_dir, file), mode='w' if b == 0 else 'a', header=(b == 0), index=False)
+            rows[file] += len(frame)
+    return rows
+
+
+def generate(output_dir, scale='small', cities=None, listings=None, days=None, reviews=None, seed=0,
+             dup_rate=0.01, workers=1):
+    """Write a synthetic snapshot, one folder per city. Returns {city: {file: rows}}.
+
+    cities / listings / days / reviews override the preset of `scale`.
+    """
+    config = dict(SCALES[scale])
+    for name, value in [('cities', cities), ('listings', listings), ('days', days), ('reviews', reviews)]:
+        if value is not None:
+            config[name] = value
+    names = [CITIES[i % len(CITIES)] + ('' if i < len(CITIES) else f" {i // len(CITIES) + 1}")
+             for i in range(config['cities'])]
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {city: pool.submit(write_city, os.path.join(output_dir, city), city, i, config['listings'],
+                                     config['days'], config['reviews'], seed, dup_rate)
+                   for i, city in enumerate(names)}
+        summary = {city: future.result() for city, future in futures.items()}
+    with open(os.path.join(output_dir, 'synthetic.json'), 'w') as f:
+        json.dump({'config': dict(config, seed=seed, dup_rate=dup_rate), 'rows': summary}, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--cities', type=int)
+    parser.add_argument('--listings', type=int, help='listings per city')
+    parser.add_argument('--days', type=int, help='calendar days per listing')
+    parser.add_argument('--reviews', type=float, help='mean reviews per listing')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dup-rate', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    summary = generate(args.output_dir, args.scale, args.cities, args.listings, args.days, args.reviews,
+                       args.seed, args.dup_rate, args.workers)
+    totals = pd.DataFrame(summary).T.sum()
+    print(f"{len(summary)} cities written to {args.output_dir}")
+    print(totals.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""Fixtures shared by the tests: a synthetic snapshot run through the pipeline once per session.
+
+Run from the data/ folder: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import stages, synthetic  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def raw_dir(tmp_path_factory):
+    """Per-city folders of the 'tiny' synthetic scale (pipeline/synthetic.py)."""
+    path = str(tmp_path_factory.mktemp('raw'))
+    synthetic.generate(path, scale='tiny')
+    return path
+
+
+@pytest.fixture(scope='session')
+def data_dir(raw_dir, tmp_path_factory):
+    """Outputs of every stage but eda, with the integrity stage's drop."""
+    path = str(tmp_path_factory.mktemp('data'))
+    pipeline_stages = [stage for stage in stages.STAGES if stage.name != 'eda']
+    stages.run_stages({'raw': raw_dir, 'data': path}, pipeline_stages,
+                      {'combine': {'workers': 1}, 'similar': {'workers': 1}}, use_cache=False)
+    return path
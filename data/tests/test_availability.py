@@ -0,0 +1,83 @@
+"""AvailabilityIndex against a GROUP BY over DB_calendar4."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import checkpoint
+from pipeline.availability import AvailabilityIndex, build_availability_index
+
+
+@pytest.fixture(scope='module')
+def calendar(data_dir):
+    calendar = pd.read_csv(os.path.join(data_dir, 'DB_calendar4.csv'), encoding='utf-8-sig',
+                           parse_dates=['date'])
+    listings = pd.read_csv(os.path.join(data_dir, 'DB_listings.csv'), usecols=['id', 'neighbourhood'])
+    cities = pd.read_csv(os.path.join(data_dir, 'city_neighborhood.csv'), encoding='utf-8-sig')
+    city = listings.merge(cities, left_on='neighbourhood', right_on='cleaned_neighborhood')[['id', 'city']]
+    return calendar.merge(city, left_on='listing_id', right_on='id')
+
+
+def group_by_search(calendar, city, check_in, check_out, max_total=None):
+    """The stay search as SQL would write it: one group per listing of the city over the stay's nights."""
+    check_in, check_out = pd.Timestamp(check_in), pd.Timestamp(check_out)
+    nights = (check_out - check_in).days
+    stay = calendar[(calendar['city'].str.lower() == city.lower()) & (calendar['date'] >= check_in)
+                    & (calendar['date'] < check_out)]
+    first = stay[stay['date'] == check_in].set_index('listing_id')
+    groups = stay.groupby('listing_id').agg(free=('available_boo', 'sum'), total_price=('price', 'sum'))
+    groups = groups.join(first[['minimum_nights', 'maximum_nights']], how='inner')
+    ok = ((groups['free'] == nights) & (groups['minimum_nights'] <= nights)
+          & ((groups['maximum_nights'] == 0) | (groups['maximum_nights'] >= nights)))
+    result = groups[ok].reset_index()[['listing_id', 'total_price']]
+    if max_total is not None:
+        result = result[result['total_price'] <= max_total]
+    return result.sort_values(['total_price', 'listing_id']).reset_index(drop=True)
+
+
+def test_search_matches_group_by(data_dir, calendar):
+    index = AvailabilityIndex(os.path.join(data_dir, 'availability_index'))
+    rng = np.random.default_rng(0)
+    first_day, days = index.first_day, index.days
+    for _ in range(40):
+        city = rng.choice(sorted(calendar['city'].unique()))
+        check_in = first_day + np.timedelta64(int(rng.integers(0, days - 1)), 'D')
+        check_out = check_in + np.timedelta64(int(rng.integers(1, 8)), 'D')
+        max_total = None if rng.random() < 0.5 else float(rng.integers(100, 3000))
+        found = index.search(city.upper(), check_in, check_out, max_total)
+        expected = group_by_search(calendar, city, check_in, check_out, max_total)
+        assert found['listing_id'].tolist() == expected['listing_id'].tolist(), (city, check_in, check_out)
+        np.testing.assert_allclose(found['total_price'].to_numpy(float), expected['total_price'].to_numpy(float))
+
+
+def test_listing_lookups(data_dir, calendar):
+    index = AvailabilityIndex(os.path.join(data_dir, 'availability_index'))
+    check_in = index.first_day + np.timedelta64(3, 'D')
+    check_out = check_in + np.timedelta64(2, 'D')
+    stay = calendar[(calendar['date'] >= pd.Timestamp(check_in)) & (calendar['date'] < pd.Timestamp(check_out))]
+    prices = stay.groupby('listing_id')['price'].agg(['sum', 'count'])
+    for listing_id, row in prices.head(50).iterrows():
+        expected = row['sum'] if row['count'] == 2 else None
+        assert index.stay_price(listing_id, check_in, check_out) == pytest.approx(expected)
+    assert index.stay_price(-1, check_in, check_out) is None
+    assert not index.is_available(-1, check_in, check_out)
+
+
+def test_price_past_int32_is_unknown(data_dir, tmp_path):
+    ckpt = os.path.join(data_dir, 'DB_calendar4.ckpt')
+    calendar = checkpoint.read_checkpoint(ckpt)
+    priced = calendar.index[calendar['price'].notna() & calendar['date'].notna()]
+    row = priced[len(priced) // 2]
+    calendar.loc[row, 'price'] = 30_000_000.0  # 3e9 cents would wrap to a negative int32
+    huge_ckpt = os.path.join(tmp_path, 'DB_calendar4.ckpt')
+    checkpoint.write_checkpoint(huge_ckpt, calendar, checkpoint.checkpoint_kinds(ckpt))
+
+    index_dir = os.path.join(tmp_path, 'availability_index')
+    build_availability_index(huge_ckpt, os.path.join(data_dir, 'DB_listings.csv'),
+                             os.path.join(data_dir, 'city_neighborhood.csv'), index_dir)
+    index = AvailabilityIndex(index_dir)
+    listing_id, night = calendar.loc[row, 'listing_id'], calendar.loc[row, 'date'].to_datetime64()
+    assert index.stay_price(listing_id, night, night + np.timedelta64(1, 'D')) is None
+    original = AvailabilityIndex(os.path.join(data_dir, 'availability_index'))
+    assert original.stay_price(listing_id, night, night + np.timedelta64(1, 'D')) is not None
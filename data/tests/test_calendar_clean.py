@@ -0,0 +1,60 @@
+"""calendar_clean against the step-by-step calendar cleaning it replaced."""
+import os
+
+import pandas as pd
+
+from pipeline import calendar_clean
+from pipeline.stages import read_listing_ids
+
+
+def baseline_calendar(calendar_csv, listing_ids, work_dir):
+    """The notebook's calendar section: each step a pandas pass, with its CSV round trips."""
+    df_calendar = pd.read_csv(calendar_csv)
+    df_calendar['date'] = pd.to_datetime(df_calendar['date'])
+    df_calendar = df_calendar[~((df_calendar['date'].dt.year == 2024) & (df_calendar['date'].dt.month.isin([3, 4, 5])))]
+    df_calendar = df_calendar[df_calendar['listing_id'].isin(set(listing_ids))]
+    df_calendar.to_csv(os.path.join(work_dir, 'calendar_remove_2024_3_5.csv'), index=False, encoding='utf-8-sig')
+
+    df_calendar = pd.read_csv(os.path.join(work_dir, 'calendar_remove_2024_3_5.csv'))
+    df_calendar['price'] = calendar_clean.parse_price(df_calendar['price'])
+    df_calendar.to_csv(os.path.join(work_dir, 'calendar_remove_price_int.csv'), index=False, encoding='utf-8-sig')
+
+    df_calendar = pd.read_csv(os.path.join(work_dir, 'calendar_remove_price_int.csv'))
+    df_calendar = df_calendar.drop_duplicates(subset=['listing_id', 'date'], keep='first')
+    df_calendar['minimum_nights'] = df_calendar['minimum_nights'].fillna(0).astype(int)
+    df_calendar['maximum_nights'] = df_calendar['maximum_nights'].fillna(0).astype(int)
+    df_calendar.to_csv(os.path.join(work_dir, 'DB_calendar2.csv'), index=False, encoding='utf-8-sig')
+
+    df_calendar = pd.read_csv(os.path.join(work_dir, 'DB_calendar2.csv'))
+    df_calendar['adjusted_price'] = calendar_clean.parse_price(df_calendar['adjusted_price'])
+    df_calendar['adjusted_price'] = pd.to_numeric(df_calendar['adjusted_price'], errors='coerce').fillna(0)
+    df_calendar['available_boo'] = df_calendar['available'].map({'t': True, 'f': False})
+    df_calendar = df_calendar.drop(columns=['available'])
+    df_calendar = df_calendar[df_calendar['adjusted_price'] <= 6000]
+    df_calendar.to_csv(os.path.join(work_dir, 'DB_calendar4.csv'), index=False, encoding='utf-8-sig')
+    return os.path.join(work_dir, 'DB_calendar4.csv')
+
+
+def test_clean_calendar_matches_baseline(data_dir, tmp_path):
+    calendar_csv = os.path.join(data_dir, 'calendar_combined.csv')
+    listing_ids = read_listing_ids(data_dir)
+    expected = baseline_calendar(calendar_csv, listing_ids, tmp_path)
+
+    # small chunks and few partitions, so duplicates span chunks and share partitions
+    output_csv = os.path.join(tmp_path, 'streamed.csv')
+    stats = calendar_clean.clean_calendar(calendar_csv, listing_ids, os.path.join(tmp_path, 'streamed.ckpt'),
+                                          output_csv, price_cap=6000, partitions=4, chunksize=5_000)
+    assert stats['dropped_duplicate'] > 0
+    with open(expected, 'rb') as f, open(output_csv, 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_clean_calendar_frame_matches_streamed(data_dir, tmp_path):
+    calendar_csv = os.path.join(data_dir, 'calendar_combined.csv')
+    listing_ids = read_listing_ids(data_dir)
+    calendar_clean.clean_calendar(calendar_csv, listing_ids, os.path.join(tmp_path, 'streamed.ckpt'),
+                                  os.path.join(tmp_path, 'streamed.csv'), chunksize=5_000)
+    framed = calendar_clean.clean_calendar_frame(pd.read_csv(calendar_csv, dtype=str), listing_ids)
+    framed.to_csv(os.path.join(tmp_path, 'framed.csv'), index=False, encoding='utf-8-sig')
+    pd.testing.assert_frame_equal(pd.read_csv(os.path.join(tmp_path, 'framed.csv'), encoding='utf-8-sig'),
+                                  pd.read_csv(os.path.join(tmp_path, 'streamed.csv'), encoding='utf-8-sig'))
@@ -0,0 +1,47 @@
+"""CheckpointWriter round trips and failed writes."""
+import os
+
+import pandas as pd
+import pytest
+
+from pipeline import checkpoint
+
+
+SCHEMA = {'id': 'int', 'date': 'date', 'price': 'fixed', 'ok': 'bool', 'text': 'str'}
+
+
+def frame(start, n):
+    return pd.DataFrame({
+        'id': pd.array([600_000_000_000_000_000 + i if i % 7 else None for i in range(start, start + n)],
+                       dtype='Int64'),
+        'date': pd.to_datetime(['2024-01-01'] * n) + pd.to_timedelta(range(n), unit='D'),
+        'price': [i * 1.25 for i in range(n)],
+        'ok': pd.array([None if i % 5 == 0 else i % 2 == 0 for i in range(n)], dtype='boolean'),
+        'text': [None if i % 3 == 0 else f"é{i}" * (i % 4) for i in range(n)],
+    })
+
+
+def test_round_trip_across_chunks(tmp_path):
+    path = os.path.join(tmp_path, 'ckpt')
+    # chunks of 13 rows, so the packed bits of bool and str columns carry over between chunks
+    with checkpoint.CheckpointWriter(path, SCHEMA) as writer:
+        for start in range(0, 50, 13):
+            writer.append(frame(start, min(13, 50 - start)))
+    expected = pd.concat([frame(start, min(13, 50 - start)) for start in range(0, 50, 13)], ignore_index=True)
+    result = checkpoint.read_checkpoint(path)
+    assert checkpoint.checkpoint_rows(path) == 50
+    assert (checkpoint.encode_int(result['id']) == checkpoint.encode_int(expected['id'])).all()
+    assert result['date'].tolist() == expected['date'].tolist()
+    assert result['price'].tolist() == expected['price'].tolist()
+    assert result['ok'].astype(object).where(result['ok'].notna(), None).tolist() == \
+        expected['ok'].astype(object).where(expected['ok'].notna(), None).tolist()
+    assert result['text'].where(result['text'].notna(), None).tolist() == expected['text'].tolist()
+
+
+def test_failed_write_leaves_no_checkpoint(tmp_path):
+    path = os.path.join(tmp_path, 'ckpt')
+    with pytest.raises(RuntimeError):
+        with checkpoint.CheckpointWriter(path, SCHEMA) as writer:
+            writer.append(frame(0, 10))
+            raise RuntimeError('stage failed')
+    assert not os.path.exists(path)
@@ -0,0 +1,35 @@
+"""EDA over a set of combined files, one of which cannot be profiled."""
+import os
+import shutil
+
+import pytest
+
+from pipeline import eda
+
+
+FILES = ['listings_combined.csv', 'neighbourhoods_combined.csv', 'reviews_combined.csv']
+
+
+@pytest.fixture
+def eda_dir(data_dir, tmp_path):
+    for file in FILES[:2]:
+        shutil.copy(os.path.join(data_dir, file), tmp_path)
+    open(os.path.join(tmp_path, 'calendar_combined.csv'), 'w').close()
+    # profiling a directory fails in the worker with an OSError
+    os.makedirs(os.path.join(tmp_path, 'reviews_combined.csv'))
+    return str(tmp_path)
+
+
+def test_report_skips_failed_files(eda_dir, capsys):
+    eda.eda_report(eda_dir, ['calendar_combined.csv'] + FILES, workers=2)
+    out = capsys.readouterr().out
+    assert 'Empty file' in out and 'EDA of reviews_combined.csv failed' in out
+    for file in FILES[:2]:
+        assert os.path.exists(os.path.join(eda_dir, 'eda_results', f"{file[:-4]}_report", 'index.html'))
+
+
+def test_basic_eda_skips_empty_files(eda_dir, capsys):
+    eda.basic_eda(eda_dir, ['calendar_combined.csv'] + FILES[:2], plots=False)
+    assert 'Empty file' in capsys.readouterr().out
+    for file in FILES[:2]:
+        assert os.path.exists(os.path.join(eda_dir, 'eda_results', f"{file[:-4]}_eda_results.csv"))
@@ -0,0 +1,57 @@
+"""pipeline/load.py against a local Postgres; skipped unless $PG_DSN is set."""
+import os
+import uuid
+
+import pandas as pd
+import pytest
+
+from pipeline import load
+
+
+DSN = os.environ.get('PG_DSN')
+
+pytestmark = pytest.mark.skipif(not DSN, reason='PG_DSN is not set')
+
+
+@pytest.fixture
+def dsn():
+    """DSN of a scratch schema, dropped after the test; the tables of the database are left alone."""
+    psycopg2 = pytest.importorskip('psycopg2')
+    schema = f"pipeline_test_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(DSN)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    try:
+        yield psycopg2.extensions.make_dsn(DSN, options=f"-c search_path={schema}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+
+def table_counts(dsn, names):
+    conn = load.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            counts = {}
+            for name in names:
+                cur.execute(f"SELECT COUNT(*) FROM {name}")
+                counts[name] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def test_load_matches_output_rows(data_dir, dsn):
+    load.create_schema(dsn)
+    expected = {table.name: len(pd.read_csv(os.path.join(data_dir, table.file), dtype=str, encoding='utf-8-sig'))
+                for table in load.TABLES if os.path.exists(os.path.join(data_dir, table.file))}
+    assert {'listings', 'calendar', 'reviews', 'listing_review_sample'} <= set(expected)
+
+    assert load.load_tables(dsn, data_dir, workers=2) == expected
+    assert table_counts(dsn, expected) == expected
+
+    # reloading with truncate replaces the rows instead of adding to them
+    assert load.load_tables(dsn, data_dir, workers=2, truncate=True) == expected
+    assert table_counts(dsn, expected) == expected
@@ -0,0 +1,51 @@
+"""Typed reads of the combined files, with malformed values coerced to null."""
+import os
+
+import pandas as pd
+
+from pipeline import reader, stages
+
+
+def test_malformed_values_are_coerced(tmp_path):
+    path = os.path.join(tmp_path, 'listings_detailed.csv')
+    with open(path, 'w') as f:
+        f.write('id,accommodates,review_scores_rating,instant_bookable\n'
+                '700000000100000778,2,4.5,t\n'
+                'abc,2.5,x,maybe\n'
+                '3.0,4,,f\n')
+    df = reader.parse_columns(path, ['id', 'accommodates', 'review_scores_rating', 'instant_bookable'])
+    # the 18-digit id survives: coercion does not go through float64
+    assert df['id'].tolist() == [700000000100000778, pd.NA, 3]
+    assert df['accommodates'].tolist() == [2, pd.NA, 4]
+    assert df['review_scores_rating'].isna().tolist() == [False, True, True]
+    assert df['instant_bookable'].tolist() == [True, pd.NA, False]
+    assert str(df['id'].dtype) == 'Int64' and str(df['instant_bookable'].dtype) == 'boolean'
+
+
+def run_listings_stages(path, combined):
+    os.mkdir(path)
+    combined.to_csv(os.path.join(path, 'listings_detailed_combined.csv'), index=False)
+    stages.listings_stage({'data': str(path)})
+    stages.hosts_stage({'data': str(path)})
+    return {name: pd.read_csv(os.path.join(path, f"{name}.csv"), dtype={'id': str}, encoding='utf-8-sig')
+            for name in ('DB_listings', 'DB_listings_detailed', 'DB_host')}
+
+
+def test_stages_drop_malformed_ids(data_dir, tmp_path):
+    combined = pd.read_csv(os.path.join(data_dir, 'listings_detailed_combined.csv'), dtype=str)
+    expected = run_listings_stages(tmp_path / 'clean', combined)
+
+    # rows whose id occurs once, so the malformed id is gone from every output
+    once = combined.index[~combined['id'].duplicated(keep=False)]
+    bad_id, bad_count = combined.loc[once[0], 'id'], combined.loc[once[1], 'id']
+    combined.loc[once[0], 'id'] = 'abc'
+    combined.loc[once[1], 'accommodates'] = '2.5'
+    combined.loc[once[1], 'host_listings_count'] = 'many'
+    out = run_listings_stages(tmp_path / 'bad', combined)
+
+    for name in ('DB_listings', 'DB_listings_detailed'):
+        assert set(out[name]['id']) == set(expected[name]['id']) - {bad_id}
+    detailed = out['DB_listings_detailed'].set_index('id')
+    assert pd.isna(detailed.loc[bad_count, 'accommodates'])
+    # a malformed count is only a null: the host is still written
+    assert set(out['DB_host']['host_id']) == set(expected['DB_host']['host_id'])
@@ -0,0 +1,53 @@
+"""ReviewIndex.search against a scan of every review with the route's ILIKE '%kw%'."""
+import fnmatch
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import checkpoint
+from pipeline.review_index import ReviewIndex, build_review_index
+
+
+KEYWORDS = ['clean', 'WIFI', 'Free Park', 'très', 'ck-in', '"hidden', 'host%again', 'n_isy', 'big plus.', '',
+            'a', 'no such phrase', r'100\%']
+
+
+def ilike(comment, keyword):
+    """comment ILIKE '%keyword%', for keywords without [ or ]."""
+    if '\\' in keyword:
+        return keyword.replace('\\', '').lower() in comment.lower()
+    return fnmatch.fnmatchcase(comment.lower(), '*' + keyword.lower().replace('%', '*').replace('_', '?') + '*')
+
+
+@pytest.fixture(scope='module')
+def reviews(data_dir):
+    ckpt = os.path.join(data_dir, 'DB_reviews.ckpt')
+    frame = checkpoint.read_checkpoint(ckpt, ['review_id', 'listing_id', 'comments'])
+    return ckpt, frame
+
+
+def test_search_matches_scan(reviews, tmp_path):
+    ckpt, frame = reviews
+    # small batches, so the postings are merged from many runs
+    build_review_index(ckpt, os.path.join(tmp_path, 'review_index'), batch=300)
+    index = ReviewIndex(os.path.join(tmp_path, 'review_index'))
+
+    listing_ids = np.random.default_rng(0).choice(frame['listing_id'].unique(), 40, replace=False)
+    for listing_id in list(listing_ids) + [-1]:
+        listing = frame[frame['listing_id'] == listing_id]
+        for keyword in KEYWORDS:
+            expected = [review_id for review_id, comment in zip(listing['review_id'], listing['comments'])
+                        if not pd.isna(comment) and ilike(comment, keyword)]
+            assert sorted(index.search(listing_id, keyword)) == sorted(expected), (listing_id, keyword)
+
+
+def test_index_is_the_same_for_any_batch(reviews, tmp_path):
+    ckpt, _ = reviews
+    build_review_index(ckpt, os.path.join(tmp_path, 'one'), batch=10 ** 9)
+    build_review_index(ckpt, os.path.join(tmp_path, 'many'), batch=97)
+    for name in ['listing_ids.i8', 'listing_offsets.i8', 'review_ids.i8', 'trigram_offsets.i8', 'postings.u4']:
+        with open(os.path.join(tmp_path, 'one', name), 'rb') as one, \
+                open(os.path.join(tmp_path, 'many', name), 'rb') as many:
+            assert one.read() == many.read(), name
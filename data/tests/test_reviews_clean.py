@@ -0,0 +1,45 @@
+"""reviews_clean against the in-memory rule: drop every review whose id is duplicated."""
+import os
+
+import pandas as pd
+import pytest
+
+from pipeline import checkpoint, reviews_clean
+from pipeline.stages import clean_reviews
+
+
+def test_clean_reviews_file_matches_in_memory(data_dir, tmp_path):
+    reviews_csv = os.path.join(data_dir, 'reviews_detailed_combined.csv')
+    df_reviews = pd.read_csv(reviews_csv, dtype=str, keep_default_na=False)
+    assert df_reviews['id'].duplicated(keep=False).any()
+    expected = clean_reviews(df_reviews).reset_index(drop=True)
+
+    output_csv = os.path.join(tmp_path, 'DB_reviews.csv')
+    output_ckpt = os.path.join(tmp_path, 'DB_reviews.ckpt')
+    # ids spread over few partitions and many chunks, so copies of an id fall in different chunks
+    stats = reviews_clean.clean_reviews_file(reviews_csv, output_csv, output_ckpt, partitions=3, chunksize=250)
+    assert stats['rows_out'] == len(expected)
+    pd.testing.assert_frame_equal(pd.read_csv(output_csv, dtype=str, keep_default_na=False, encoding='utf-8-sig'),
+                                  expected)
+    assert (checkpoint.column_array(output_ckpt, 'review_id') == checkpoint.encode_int(expected['review_id'])).all()
+
+
+class FailingReservoir:
+    """Raises on the third chunk offered."""
+
+    def __init__(self):
+        self.chunks = 0
+
+    def add(self, listing_id, review_id, first_row):
+        self.chunks += 1
+        if self.chunks == 3:
+            raise RuntimeError('reservoir failed')
+
+
+def test_failed_pass_leaves_no_checkpoint(data_dir, tmp_path):
+    output_ckpt = os.path.join(tmp_path, 'DB_reviews.ckpt')
+    with pytest.raises(RuntimeError):
+        reviews_clean.clean_reviews_file(os.path.join(data_dir, 'reviews_detailed_combined.csv'),
+                                         os.path.join(tmp_path, 'DB_reviews.csv'), output_ckpt, chunksize=250,
+                                         reservoir=FailingReservoir())
+    assert not os.path.exists(output_ckpt)
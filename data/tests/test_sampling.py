@@ -0,0 +1,56 @@
+"""The review sample and the featured pool against brute-force selections."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline import checkpoint, sampling
+from pipeline.stages import read_listing_ids
+
+
+def bottom_k(reviews, size=sampling.SAMPLE_SIZE, seed=sampling.SEED):
+    """The `size` reviews with the smallest keys of every listing, slot-numbered."""
+    reviews = reviews.assign(key=sampling.random_keys(reviews['review_id'].to_numpy(np.int64), seed))
+    sample = reviews.sort_values(['listing_id', 'key']).groupby('listing_id').head(size)
+    sample = sample.assign(slot=sample.groupby('listing_id').cumcount())
+    return sample[['listing_id', 'slot', 'review_id', 'comments']].reset_index(drop=True)
+
+
+def test_review_sample_is_bottom_k_of_cleaned_listings(data_dir):
+    reviews = checkpoint.read_checkpoint(os.path.join(data_dir, 'DB_reviews.ckpt'),
+                                         ['review_id', 'listing_id', 'comments'])
+    reviews = reviews[reviews['listing_id'].isin(read_listing_ids(data_dir))]
+    sample = pd.read_csv(os.path.join(data_dir, 'listing_review_sample.csv'), encoding='utf-8-sig')
+    pd.testing.assert_frame_equal(sample.astype({'listing_id': np.int64, 'review_id': np.int64}),
+                                  bottom_k(reviews).astype({'listing_id': np.int64, 'review_id': np.int64}),
+                                  check_dtype=False)
+
+    # nothing for the integrity stage to drop
+    with open(os.path.join(data_dir, 'integrity_report.json')) as f:
+        report = json.load(f)['relationships']
+    assert all(r['orphans'] == 0 for r in report if r['file'] == 'listing_review_sample.csv')
+
+
+def test_reservoir_does_not_depend_on_chunks(data_dir):
+    reviews_ckpt = os.path.join(data_dir, 'DB_reviews.ckpt')
+    listing_id = checkpoint.column_array(reviews_ckpt, 'listing_id')
+    review_id = checkpoint.column_array(reviews_ckpt, 'review_id')
+    listing_ids = read_listing_ids(data_dir)
+    samples = []
+    for chunk in (len(review_id), 1000, 7):
+        reservoir = sampling.ReviewReservoir(3, seed=1, listing_ids=listing_ids)
+        for start in range(0, len(review_id), chunk):
+            reservoir.add(listing_id[start:start + chunk], review_id[start:start + chunk], start)
+        samples.append(reservoir.frame(reviews_ckpt))
+    for sample in samples[1:]:
+        pd.testing.assert_frame_equal(sample, samples[0])
+    assert samples[0].groupby('listing_id').size().max() == 3
+
+
+def test_featured_pool(data_dir):
+    detailed = pd.read_csv(os.path.join(data_dir, 'DB_listings_detailed.csv'))
+    pool = pd.read_csv(os.path.join(data_dir, 'featured_listing.csv'), encoding='utf-8-sig')
+    expected = sorted(detailed.loc[detailed['review_scores_rating'].round(2) > sampling.FEATURED_RATING, 'id'])
+    assert pool['listing_id'].tolist() == expected
+    assert pool['slot'].tolist() == list(range(len(expected)))
@@ -0,0 +1,69 @@
+"""similar.build_similar_listings against a brute-force Jaccard ranking over Python sets."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import similar
+from pipeline.availability import listing_cities
+
+
+def feature_sets(data_dir):
+    """{listing_id: (city_id, amenity set, attribute set)} for the listings with a city."""
+    cities = listing_cities(os.path.join(data_dir, 'DB_listings.csv'), os.path.join(data_dir, 'city_neighborhood.csv'))
+    has_amenity = pd.read_csv(os.path.join(data_dir, 'DB_has_amenity2.csv'), encoding='utf-8-sig')
+    amenity_sets = has_amenity.groupby('id')['amenity_id'].apply(set).to_dict()
+    room_type = (pd.read_csv(os.path.join(data_dir, 'DB_listings.csv')).drop_duplicates('id')
+                   .set_index('id')['room_type'])
+    detailed = pd.read_csv(os.path.join(data_dir, 'DB_listings_detailed.csv')).drop_duplicates('id').set_index('id')
+
+    features = {}
+    for listing_id, city_id in zip(cities['listing_id'], cities['city_id']):
+        if city_id == 0:
+            continue
+        attributes = set()
+        if not pd.isna(room_type.get(listing_id)):
+            attributes.add(('room_type', room_type[listing_id]))
+        if listing_id in detailed.index:
+            for column, width in (('accommodates', similar.ACCOMMODATES_BITS), ('bedrooms', similar.BEDROOMS_BITS)):
+                value = detailed.at[listing_id, column]
+                count = 0 if pd.isna(value) else int(min(max(value, 0), width))
+                attributes.update((column, i) for i in range(count))
+        features[listing_id] = (city_id, amenity_sets.get(listing_id, set()), attributes)
+    return features
+
+
+def jaccard(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+def brute_force(features, listing_id, k=similar.K, amenity_weight=similar.AMENITY_WEIGHT):
+    city_id, amenities, attributes = features[listing_id]
+    scored = [(amenity_weight * jaccard(amenities, other_amenities)
+               + (1 - amenity_weight) * jaccard(attributes, other_attributes), other)
+              for other, (other_city, other_amenities, other_attributes) in features.items()
+              if other_city == city_id and other != listing_id]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return scored[:k]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_similar_matches_brute_force(data_dir, workers, monkeypatch):
+    # small blocks, so a city is split over several tasks
+    monkeypatch.setattr(similar, 'TASK_ROWS', 64)
+    table = similar.build_similar_listings(
+        os.path.join(data_dir, 'DB_listings.csv'), os.path.join(data_dir, 'DB_listings_detailed.csv'),
+        os.path.join(data_dir, 'DB_has_amenity2.csv'), os.path.join(data_dir, 'city_neighborhood.csv'),
+        workers=workers)
+    features = feature_sets(data_dir)
+    assert set(table['listing_id']) == set(features)
+
+    by_listing = {listing_id: rows for listing_id, rows in table.groupby('listing_id')}
+    for listing_id in np.random.default_rng(0).choice(sorted(features), 60, replace=False):
+        expected = brute_force(features, listing_id)
+        rows = by_listing[listing_id].sort_values('rank')
+        assert rows['rank'].tolist() == list(range(1, len(expected) + 1))
+        assert rows['similar_listing_id'].tolist() == [other for _, other in expected], listing_id
+        np.testing.assert_allclose(rows['score'], [score for score, _ in expected], atol=1e-4)
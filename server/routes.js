@@ -35,9 +35,9 @@ const highRatedFamilyListings = async (req, res) => {
       INNER JOIN city_neighborhood as n ON n.cleaned_neighborhood = l.cleaned_neighborhood
       WHERE ld.review_scores_rating > 4.8
         AND ld.accommodates >= 4
-        AND n.city ILIKE $1
+        AND ($1 = '' OR n.city_id IN (SELECT city_id FROM city_search WHERE term = LOWER(TRIM($1))))
     `;
-    const values = [`%${city}%`];
+    const values = [city];
     const result = await connection.query(query, values);
     res.status(200).json(result.rows);
   } catch (err) {
@@ -47,6 +47,8 @@ const highRatedFamilyListings = async (req, res) => {
 };
 
 // Route 2: GET /listingReviewKeyword - For a given listing, list all reviews containing provided keyword
+// Scans the listing's reviews with ILIKE. The trigram index in data/pipeline/review_index.py gives the
+// same results offline; the server does not read it.
 const listingReviewKeyword = async (req, res) => {
   const listingId = req.params.id;
   const keyword = req.query.q || '';
@@ -79,14 +81,8 @@ const listingReviewKeyword = async (req, res) => {
 // Listings with free parking & instant bookable, showing overall average price
 const flexibleInstantListings = async (req, res) => {
   try {
+    // any amenity named '... free parking ...': the listing's mask shares a bit with the keyword's mask
     const query = `
-      WITH Free_Parking_Listings AS (
-        SELECT la.id
-        FROM listings_amenities la
-        JOIN amenities a 
-          ON la.amenity_id = a.amenity_id
-        WHERE a.amenities ILIKE '%free parking%'
-      )
       SELECT
         l.id::text         AS listing_id,
         l.name,
@@ -96,11 +92,13 @@ const flexibleInstantListings = async (req, res) => {
       FROM listings l
       JOIN listings_detailed ld 
         ON l.id = ld.id
-      JOIN Free_Parking_Listings fp 
-        ON l.id = fp.id
+      JOIN listing_amenity_mask m
+        ON l.id = m.listing_id
       JOIN listing_overall_avg_price o 
         ON l.id = o.listing_id
       WHERE ld.instant_bookable = TRUE
+        AND (m.amenity_mask & (SELECT amenity_mask FROM amenity_keyword WHERE keyword = 'free parking'))
+            <> B'0'::bit(200)
       ORDER BY o.overall_avg_price DESC;
     `;
 
@@ -120,12 +118,9 @@ const cheapestAvailableDates = async (req, res) => {
   try {
     const query = `
       SELECT listing_id::text as listing_id, date, ROUND(price, 2) AS price
-      FROM Calendar
-      WHERE available_boo = TRUE
-        AND listing_id = $1
-        AND price IS NOT NULL
-      ORDER BY price ASC
-      LIMIT 3;
+      FROM listing_cheapest_dates
+      WHERE listing_id = $1
+      ORDER BY rank;
     `;
     const { rows } = await connection.query(query, [listingId]);
     res.status(200).json(rows);
@@ -143,13 +138,11 @@ const averageChristmasPrice = async (req, res) => {
     const query = `
       SELECT 
         COALESCE(NULLIF(TRIM(l.cleaned_neighborhood), ''), 'Unknown') AS neighbourhood,
-        ROUND(AVG(c.price), 2) AS avg_price_christmas
+        ROUND(h.avg_price, 2) AS avg_price_christmas
       FROM listings l
-      JOIN calendar c ON l.id = c.listing_id
+      JOIN listing_holiday_price h ON l.id = h.listing_id
       WHERE l.id = $1
-        AND c.date BETWEEN '2023-12-20' AND '2023-12-26'
-        AND c.price IS NOT NULL
-      GROUP BY 1;
+        AND h.holiday = 'christmas';
     `;
     const { rows } = await connection.query(query, [listingId]);
     res.status(200).json(rows);
@@ -199,33 +192,37 @@ const filteredSortedListings = async (req, res) => {
 
   // Convert comma-separated amenities string into array
   const amenityList = amenities.split(',').map(item => item.trim());
+  // listings with every requested amenity: (mask & wanted) = wanted; bit amenity_id - 1 is set per amenity
   const query = `
+  WITH wanted AS (
+    SELECT
+      BIT_OR(B'1'::bit(200) >> (amenity_id - 1)) AS mask,
+      COUNT(DISTINCT amenities) AS found,
+      STRING_AGG(DISTINCT amenities, ', ') AS amenities_list
+    FROM Amenities
+    WHERE amenities = ANY ($1::text[])
+  )
   SELECT
     l.id::text AS listing_id,
     l.name AS listing_name,
     l.cleaned_neighborhood as neighbourhood,
     ld.review_scores_rating,
     ld.number_of_reviews,
-    STRING_AGG(DISTINCT a.amenities, ', ') AS amenities_list
-  FROM Listings l
-  LEFT JOIN Listings_detailed ld ON l.id = ld.id
-  LEFT JOIN Listings_Amenities la ON l.id = la.id
-  LEFT JOIN Amenities a ON la.amenity_id = a.amenity_id
+    w.amenities_list
+  FROM wanted w
+  INNER JOIN listing_amenity_mask m ON (m.amenity_mask & w.mask) = w.mask
+  INNER JOIN Listings l ON l.id = m.listing_id
+  INNER JOIN Listings_detailed ld ON l.id = ld.id
   INNER JOIN city_neighborhood as n ON n.cleaned_neighborhood = l.cleaned_neighborhood
-  WHERE a.amenities = ANY ($1::text[])
+  WHERE w.found = CARDINALITY(ARRAY(SELECT DISTINCT UNNEST($1::text[])))
     AND ld.review_scores_rating >= $2
-    AND n.city ILIKE $3
-  GROUP BY
-    l.id, l.name,
-    l.cleaned_neighborhood,
-    ld.review_scores_rating,
-    ld.number_of_reviews
+    AND ($3 = '' OR n.city_id IN (SELECT city_id FROM city_search WHERE term = LOWER(TRIM($3))))
   ORDER BY
     ld.review_scores_rating DESC,
     ld.number_of_reviews DESC
 `;
 
-const values = [amenityList, parseFloat(min_rating), `%${city}%`];
+const values = [amenityList, parseFloat(min_rating), city];
 
 connection.query(query, values, (err, data) => {
   if(err) {
@@ -286,7 +283,7 @@ const topRatedWithReview = async (req, res) => {
         INNER JOIN city_neighborhood as nc ON nc.cleaned_neighborhood = l.cleaned_neighborhood
         INNER JOIN listings_detailed AS ld
           ON l.id = ld.id
-        WHERE nc.city ILIKE $1
+        WHERE ($1 = '' OR nc.city_id IN (SELECT city_id FROM city_search WHERE term = LOWER(TRIM($1))))
       )
       SELECT
         rl.id,
@@ -302,16 +299,22 @@ const topRatedWithReview = async (req, res) => {
         rev.random_review
       FROM ranked_listings AS rl
       CROSS JOIN LATERAL (
-        SELECT r.comments AS random_review
-        FROM reviews AS r
-        WHERE r.listing_id = rl.id
-        ORDER BY RANDOM()
+        -- a random slot of the listing's review sample; slots are numbered 0..n-1
+        SELECT s.comments AS random_review
+        FROM (
+          SELECT FLOOR(RANDOM() * (MAX(slot) + 1))::int AS slot
+          FROM listing_review_sample
+          WHERE listing_id = rl.id
+        ) AS pick
+        JOIN listing_review_sample AS s
+          ON s.listing_id = rl.id AND s.slot >= pick.slot
+        ORDER BY s.slot
         LIMIT 1
       ) AS rev
       WHERE rl.rank <= 10
       ORDER BY rl.rank;
     `;
-    const values = [`%${city}%`];
+    const values = [city];
     const result = await connection.query(query, values);
     res.status(200).json(result.rows);
   } catch (err) {
@@ -333,7 +336,7 @@ const cheapestMonthsByCity = async (req, res) => {
         TO_CHAR(month, 'YYYY-MM') AS month,
         ROUND(avg_price, 2) AS avg_price
       FROM city_monthly_avg
-      WHERE LOWER(city) = LOWER($1)
+      WHERE city = (SELECT city FROM cities WHERE city_key = LOWER(TRIM($1)))
       ORDER BY avg_price ASC
       LIMIT 3;
     `;
@@ -351,8 +354,8 @@ const cheapestMonthsByCity = async (req, res) => {
 const getAvailableCities = async (req, res) => {
   try {
     const query = `
-      SELECT DISTINCT city
-      FROM city_neighborhood
+      SELECT city
+      FROM cities
       ORDER BY city ASC;
     `;
     const result = await connection.query(query);
@@ -370,14 +373,11 @@ const monthlyPriceTrend = async (req, res) => {
   try {
     const query = `
       SELECT 
-        TO_CHAR(DATE_TRUNC('month', c.date), 'YYYY-MM') AS month,
-        ROUND(AVG(c.price), 2) AS avg_monthly_price,
-        c.listing_id::text as listing_id
-      FROM Calendar c
-      WHERE c.listing_id = $1
-        AND c.available_boo = TRUE
-        AND c.price IS NOT NULL
-      GROUP BY DATE_TRUNC('month', c.date), c.listing_id
+        TO_CHAR(t.month, 'YYYY-MM') AS month,
+        ROUND(t.avg_monthly_price, 2) AS avg_monthly_price,
+        t.listing_id::text as listing_id
+      FROM listing_monthly_trend t
+      WHERE t.listing_id = $1
       ORDER BY month;
     `;
     const { rows } = await connection.query(query, [listingId]);
@@ -390,14 +390,13 @@ const monthlyPriceTrend = async (req, res) => {
 
 // Route 11: GET /random_listing - Return a random featured SmartStay listing with reviews > 4.9
 const randomListing = async function(req, res) {
+  // featured_listing numbers the listings rated above 4.9 from 0; pick a random slot
   connection.query(`
     SELECT
-      ld.id::text AS id
-    FROM listings AS l
-    INNER JOIN listings_detailed AS ld
-      ON l.id = ld.id
-    WHERE ld.review_scores_rating > 4.9
-    ORDER BY RANDOM()
+      f.listing_id::text AS id
+    FROM featured_listing AS f
+    WHERE f.slot >= (SELECT FLOOR(RANDOM() * (MAX(slot) + 1))::int FROM featured_listing)
+    ORDER BY f.slot
     LIMIT 1;
   `, (err, data) => {
     if (err) {
@@ -457,6 +456,31 @@ const listingDetailsById = async function (req, res) {
 
 
 
+// Route 14: GET /similar_listings/:listing_id - Most similar listings of the same city (amenities, room type, size)
+const similarListings = async (req, res) => {
+  const listingId = req.params.listing_id;
+
+  try {
+    const query = `
+      SELECT
+        s.rank,
+        s.similar_listing_id::text AS id,
+        l.name,
+        l.room_type,
+        ROUND(s.score, 4) AS score
+      FROM listing_similar s
+      JOIN listings l ON l.id = s.similar_listing_id
+      WHERE s.listing_id = $1
+      ORDER BY s.rank;
+    `;
+    const { rows } = await connection.query(query, [listingId]);
+    res.status(200).json(rows);
+  } catch (err) {
+    console.error('Error in /similar_listings:', err.message);
+    res.status(500).json({ error: 'Internal server error' });
+  }
+};
+
 module.exports = {
   highRatedFamilyListings,
   listingReviewKeyword,
@@ -472,5 +496,6 @@ module.exports = {
   projectAuthor,
   listingDetailsById,
   getAvailableCities,
-  getAvailableAmenities
+  getAvailableAmenities,
+  similarListings
 };
@@ -27,6 +27,7 @@ app.get('/project_author/:type', routes.projectAuthor);
 app.get('/listings/:id', routes.listingDetailsById);
 app.get('/available_cities', routes.getAvailableCities);
 app.get('/available_amenities', routes.getAvailableAmenities);
+app.get('/similar_listings/:listing_id', routes.similarListings);
 
 app.listen(config.server_port, () => {
   console.log(`Server running at http://${config.server_host}:${config.server_port}/`)